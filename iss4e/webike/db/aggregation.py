@@ -0,0 +1,191 @@
+import math
+from array import array
+from typing import Dict, Iterable, List, NamedTuple, Sequence, Tuple
+
+from iss4e.webike.db.line_protocol import LineProtocolSerializer
+from iss4e.webike.db.metrics import metrics
+
+# aggregate functions by name, each one gets the finite values of a field in a window as an array of floats
+AGGREGATE_FUNCTIONS = {"mean": lambda values: sum(values) / len(values),
+                       "min": min,
+                       "max": max,
+                       "count": len}
+
+# the same aggregate functions over the count, sum, minimum and maximum of the finite values of a field
+STATISTIC_FUNCTIONS = {"mean": lambda count, total, low, high: total / count,
+                       "min": lambda count, total, low, high: low,
+                       "max": lambda count, total, low, high: high,
+                       "count": lambda count, total, low, high: count}
+
+# window lengths in seconds, aggregated fields, names of the aggregate functions and if raw points are written too
+Aggregation = NamedTuple('Aggregation', [('windows', List[int]), ('fields', List[str]), ('functions', List[str]),
+                                         ('raw', bool)])
+# the part of a window within the rows of a log file, for windows that are cut by the start or end of the rows:
+# the window length in nanoseconds, the imei, the start of the window and the count, sum, minimum and maximum of the
+# values of each aggregated field
+WindowPiece = NamedTuple('WindowPiece', [('length', int), ('imei', str), ('start', int),
+                                         ('statistics', Dict[str, Tuple[int, float, float, float]])])
+
+
+def window_label(seconds: int) -> str:
+    """
+    :returns a short name of the window length, e.g. 1s, 5m or 1h
+    """
+    for unit, unit_seconds in (("h", 3600), ("m", 60)):
+        if seconds % unit_seconds == 0:
+            return "{count}{unit}".format(count=seconds // unit_seconds, unit=unit)
+    return "{count}s".format(count=seconds)
+
+
+def merge_pieces(pieces: Iterable[WindowPiece]) -> WindowPiece:
+    """
+    :param pieces: pieces of the same window from different log files
+    :returns a piece with the statistics of the values of all pieces
+    """
+    statistics = {}  # type: Dict[str, Tuple[int, float, float, float]]
+    for piece in pieces:
+        for field, (count, total, low, high) in piece.statistics.items():
+            if field in statistics:
+                merged_count, merged_total, merged_low, merged_high = statistics[field]
+                statistics[field] = (merged_count + count, merged_total + total, min(merged_low, low),
+                                     max(merged_high, high))
+            else:
+                statistics[field] = (count, total, low, high)
+    return WindowPiece(piece.length, piece.imei, piece.start, statistics)
+
+
+class _Window(object):
+    """
+    Values of the aggregated fields of one imei within a window
+    """
+    __slots__ = ("start", "first_row", "values", "cut")
+
+    def __init__(self, start: int, first_row: int, fields: Sequence[str], cut: bool):
+        """
+        :param start: nanoseconds since the epoch at the start of the window
+        :param first_row: row offset to resume from to read all rows of the window again
+        :param cut: the window might have rows before the ones that are read, because it is the first of its imei
+        """
+        self.start = start
+        self.first_row = first_row
+        self.values = {field: array("d") for field in fields}
+        self.cut = cut
+
+
+class Downsampler(object):
+    """
+    Pipeline stage after parsing that aggregates the parsed field values of each imei in fixed windows aligned to
+    the epoch and writes the aggregates to one measurement per window length, e.g. sensor_data_1m with the fields
+    voltage_mean, voltage_min, voltage_max and voltage_count. Values are collected per window in float arrays,
+    each aggregate function runs over a whole array once the window is closed by a point of the imei in another
+    window or by the end of the log file. Rows are expected in chronological order per imei.
+    The first and the last window of each imei in a log file might continue in the log files before and after it.
+    If pieces are collected, these windows are not written but added as pieces, which write_pieces writes once they
+    are merged with the pieces of the same windows from the other log files.
+    """
+
+    def __init__(self, aggregation: Aggregation, measurement: str = "sensor_data", pieces: List[WindowPiece] = None):
+        """
+        :param pieces: the windows cut by the start or end of the rows are added to it, all windows are written
+                       if None
+        """
+        unknown = set(aggregation.functions) - set(AGGREGATE_FUNCTIONS)
+        if unknown:
+            raise ValueError("Unknown aggregate functions {functions}".format(functions=sorted(unknown)))
+        self._fields = tuple(aggregation.fields)
+        self._functions = aggregation.functions
+        # window length in nanoseconds, serializer of its measurement and the open window of each imei
+        self._streams = [(seconds * 10 ** 9, LineProtocolSerializer(measurement + "_" + window_label(seconds)), {})
+                         for seconds in aggregation.windows]
+        self._pieces = pieces
+        # first row of the earliest window added to the pieces
+        self._first_piece_row = None  # type: int
+
+    def add(self, row_number: int, imei: str, nanoseconds: int, fields: dict,
+            serializer: LineProtocolSerializer) -> bool:
+        """
+        :param row_number: row offset after the row of the point
+        :param fields: typed field values as the parser returns them, numbers other than booleans are aggregated
+        :param serializer: the aggregates of closed windows are written to it
+        :returns True if any aggregates were written
+        """
+        values = []
+        for field in self._fields:
+            value = fields.get(field)
+            if (type(value) is float or type(value) is int) and math.isfinite(value):
+                values.append((field, value))
+
+        written = False
+        for length, window_serializer, windows in self._streams:
+            start = nanoseconds - nanoseconds % length
+            window = windows.get(imei)
+            if window is None or window.start != start:
+                if window is not None:
+                    written = self._close(length, imei, window, window_serializer, serializer) or written
+                window = windows[imei] = _Window(start, row_number - 1, self._fields, window is None)
+            window_values = window.values
+            for field, value in values:
+                window_values[field].append(value)
+        return written
+
+    def resume_offset(self, row_number: int) -> int:
+        """
+        :returns the row offset to resume from so that the rows of all open windows and of the pieces are read again
+        """
+        return min([row_number] + [window.first_row for _, _, windows in self._streams
+                                   for window in windows.values()] +
+                   ([self._first_piece_row] if self._first_piece_row is not None else []))
+
+    def finish(self, serializer: LineProtocolSerializer) -> bool:
+        """
+        writes the aggregates of all open windows, or adds them to the pieces if they are collected
+        :returns True if any aggregates were written
+        """
+        written = False
+        for length, window_serializer, windows in self._streams:
+            for imei, window in windows.items():
+                # the end of the rows cuts the last window of each imei
+                window.cut = True
+                written = self._close(length, imei, window, window_serializer, serializer) or written
+            windows.clear()
+        return written
+
+    def write_pieces(self, pieces: Iterable[WindowPiece], serializer: LineProtocolSerializer) -> bool:
+        """
+        :param pieces: merged pieces of windows, those of window lengths that are not aggregated are ignored
+        :returns True if any aggregates were written
+        """
+        serializers = {length: window_serializer for length, window_serializer, _ in self._streams}
+        written = False
+        for piece in pieces:
+            if piece.length in serializers:
+                aggregates = {field + "_" + name: STATISTIC_FUNCTIONS[name](*piece.statistics[field])
+                              for field in self._fields if field in piece.statistics for name in self._functions}
+                written = self._write(piece.imei, piece.start, aggregates, serializers[piece.length],
+                                      serializer) or written
+        return written
+
+    def _close(self, length: int, imei: str, window: _Window, window_serializer: LineProtocolSerializer,
+               serializer: LineProtocolSerializer) -> bool:
+        if self._pieces is not None and window.cut:
+            self._pieces.append(WindowPiece(length, imei, window.start,
+                                            {field: (len(values), sum(values), min(values), max(values))
+                                             for field, values in window.values.items() if values}))
+            if self._first_piece_row is None or window.first_row < self._first_piece_row:
+                self._first_piece_row = window.first_row
+            return False
+        aggregates = {}  # type: Dict[str, object]
+        for field in self._fields:
+            values = window.values[field]
+            if values:
+                for name in self._functions:
+                    aggregates[field + "_" + name] = AGGREGATE_FUNCTIONS[name](values)
+        return self._write(imei, window.start, aggregates, window_serializer, serializer)
+
+    def _write(self, imei: str, start: int, aggregates: Dict[str, object], window_serializer: LineProtocolSerializer,
+               serializer: LineProtocolSerializer) -> bool:
+        if not window_serializer.add(imei, aggregates, start):
+            return False
+        metrics.count("points.aggregated")
+        serializer.extend(window_serializer)
+        return True
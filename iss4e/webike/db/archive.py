@@ -0,0 +1,298 @@
+import json
+import os
+import struct
+import zlib
+from contextlib import contextmanager
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+from iss4e.webike.db.metrics import metrics
+from iss4e.webike.db.point_batch import PointBatch
+from iss4e.webike.db.selection import TimeSpan
+
+# start of every columnar archive, which no log file starts with
+MAGIC = b"\x89WEBIKE\n"
+# version 2 adds the copy of the log file, version 3 encodes the blocks independently of the python version
+FORMAT_VERSION = 3
+# zlib level of the blocks, they are written once and read by every re-import
+COMPRESSION_LEVEL = 6
+# maximum number of points of a block, which is the unit that is decompressed, skipped or resumed from
+BLOCK_POINTS = 16384
+# length of the footer, which ends the archive
+_FOOTER_LENGTH = struct.Struct(">I")
+# bytes of the log file that are compressed at a time
+_LOG_BUFFER_SIZE = 1024 * 1024
+
+# position and length of a block in the archive, the imei and number of its points and their first and last
+# nanoseconds since the epoch
+Block = Tuple[int, int, str, int, int, int]
+
+
+class ArchiveWriter(object):
+    """
+    Writes the parsed points of a log file as a columnar archive. Each block holds the typed columns of a PointBatch
+    of one imei with its int64 UTC timestamps and is compressed on its own. The blocks are followed by a compressed
+    copy of the log file, which has the rows and values that are not part of the points, so that the log file can
+    be restored. A footer at the end has the position, imei and time range of each block, the position of the copy
+    and the statistics of the file: the number of points, the first and last raw timestamp of its rows and the
+    smallest and largest value of each number field.
+    """
+
+    def __init__(self, archive_file: BinaryIO, measurement: str = "sensor_data", block_points: int = BLOCK_POINTS):
+        self._file = archive_file
+        self._measurement = measurement
+        self._block_points = block_points
+        self._batch = None  # type: PointBatch
+        self._blocks = []  # type: List[Block]
+        self._ranges = {}  # type: Dict[str, list]
+        self._position = len(MAGIC)
+        self.points = 0
+        # schema of the blocks, so that their points have the fields in the order of the log file's columns
+        self.fieldnames = []  # type: List[str]
+        archive_file.write(MAGIC)
+
+    def add(self, imei: str, nanoseconds: int, fields: dict):
+        """
+        :param fields: typed field values as the parser returns them
+        """
+        batch = self._batch
+        if batch is None or batch.imei != imei or len(batch) >= self._block_points:
+            self._write_batch()
+            batch = self._batch = PointBatch(self._measurement, imei, self.fieldnames)
+        batch.append(nanoseconds, fields)
+
+    def add_batch(self, batch: PointBatch):
+        self._write_batch()
+        self._batch = batch
+        self._write_batch()
+
+    def close(self, span: TimeSpan, log_path: str = None):
+        """
+        writes the copy of the log file and the footer, the file stays open
+        :param span: first and last raw timestamp of the sensor data rows of the log file
+        :param log_path: the log file the points are from, the archive has no copy of it if None
+        """
+        self._write_batch()
+        log = self._write_log(log_path) if log_path is not None else None
+        footer = zlib.compress(json.dumps({
+            "version": FORMAT_VERSION,
+            "measurement": self._measurement,
+            "points": self.points,
+            "first": span.first,
+            "last": span.last,
+            "start": min((block[4] for block in self._blocks), default=None),
+            "end": max((block[5] for block in self._blocks), default=None),
+            "fields": self._ranges,
+            "blocks": self._blocks,
+            "log": log}).encode(), COMPRESSION_LEVEL)
+        self._file.write(footer)
+        self._file.write(_FOOTER_LENGTH.pack(len(footer)))
+
+    def _write_log(self, log_path: str) -> Tuple[int, int, int]:
+        """
+        :returns the position and length of the compressed copy of the log file and the crc32 of the log file
+        """
+        position = self._position
+        compressor = zlib.compressobj(COMPRESSION_LEVEL)
+        crc = 0
+        with open(log_path, "rb") as log_file:
+            for data in iter(lambda: log_file.read(_LOG_BUFFER_SIZE), b""):
+                crc = zlib.crc32(data, crc)
+                self._write(compressor.compress(data))
+            self._write(compressor.flush())
+        return position, self._position - position, crc
+
+    def _write(self, data: bytes):
+        self._file.write(data)
+        self._position += len(data)
+
+    def _write_batch(self):
+        batch = self._batch
+        if batch is None or not len(batch):
+            return
+        self._batch = None
+        data = zlib.compress(batch.encode(), COMPRESSION_LEVEL)
+        self._blocks.append((self._position, len(data), batch.imei, len(batch), min(batch.timestamps),
+                             max(batch.timestamps)))
+        self._write(data)
+        self.points += len(batch)
+        for field, (smallest, largest) in batch.value_ranges().items():
+            value_range = self._ranges.setdefault(field, [smallest, largest])
+            value_range[0] = min(value_range[0], smallest)
+            value_range[1] = max(value_range[1], largest)
+
+
+class ArchiveReader(object):
+    """
+    Reads the points of a columnar archive back. Offsets count the points of the archive like row offsets count
+    the rows of a log file.
+    """
+
+    def __init__(self, path: str):
+        self._file = open(path, "rb")
+        try:
+            if self._file.read(len(MAGIC)) != MAGIC:
+                raise ValueError("{path} is not a columnar archive".format(path=path))
+            self._file.seek(-_FOOTER_LENGTH.size, os.SEEK_END)
+            length, = _FOOTER_LENGTH.unpack(self._file.read(_FOOTER_LENGTH.size))
+            self._file.seek(-_FOOTER_LENGTH.size - length, os.SEEK_END)
+            footer = json.loads(zlib.decompress(self._file.read(length)).decode())
+        except Exception:
+            self._file.close()
+            raise
+        if footer["version"] > FORMAT_VERSION:
+            self._file.close()
+            raise ValueError("{path} has the unknown archive format {version}".format(path=path,
+                                                                                     version=footer["version"]))
+        self._path = path
+        self._version = footer["version"]
+        self.measurement = footer["measurement"]
+        self.points = footer["points"]
+        self.span = TimeSpan(footer["first"], footer["last"])
+        # nanoseconds since the epoch of the earliest and the latest point, None if there are none
+        self.start = footer["start"]
+        self.end = footer["end"]
+        self.field_ranges = dict((field, tuple(value_range)) for field, value_range in footer["fields"].items())
+        self.blocks = [tuple(block) for block in footer["blocks"]]  # type: List[Block]
+        # position and length of the copy of the log file and its crc32, None if the archive has none
+        self._log = footer.get("log")
+
+    @property
+    def has_log(self) -> bool:
+        return self._log is not None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        self._file.close()
+
+    def copy_log(self, target: BinaryIO):
+        """
+        writes the log file the archive was converted from
+        """
+        if self._log is None:
+            raise ValueError("The archive has no copy of its log file")
+        position, length, expected_crc = self._log
+        decompressor = zlib.decompressobj()
+        crc = 0
+        self._file.seek(position)
+        try:
+            while length > 0:
+                compressed = self._file.read(min(length, _LOG_BUFFER_SIZE))
+                if not compressed:
+                    break
+                length -= len(compressed)
+                data = decompressor.decompress(compressed)
+                crc = zlib.crc32(data, crc)
+                target.write(data)
+            data = decompressor.flush()
+        except zlib.error:
+            raise ValueError("The copy of the log file in the archive is corrupt")
+        crc = zlib.crc32(data, crc)
+        target.write(data)
+        if length or crc != expected_crc:
+            raise ValueError("The copy of the log file in the archive is corrupt")
+
+    def batches(self, offset: int = 0, start: int = None, end: int = None) -> Iterator[Tuple[int, PointBatch]]:
+        """
+        :param offset: number of points to skip, blocks before it are not read
+        :param start: blocks with points only before these nanoseconds since the epoch are not read
+        :param end: blocks with points only at or after these nanoseconds since the epoch are not read
+        :returns an iterator over the offset of the first point of each read block and its points
+        """
+        if self._version < 3 and self.blocks:
+            raise ValueError("The blocks of {path} are in the marshal format of the python version that wrote them, "
+                             "its log file can be restored and converted again".format(path=self._path))
+        first_point = 0
+        for position, length, imei, points, first, last in self.blocks:
+            if first_point + points > offset and (start is None or last >= start) and (end is None or first < end):
+                self._file.seek(position)
+                yield first_point, PointBatch.decode(self.measurement, imei, zlib.decompress(self._file.read(length)))
+            first_point += points
+
+    def rows(self, offset: int = 0, start: int = None, end: int = None) -> Iterator[Tuple[int, str, int, dict]]:
+        """
+        :param offset: number of points to skip
+        :param start: first nanoseconds since the epoch of the selected points, all if None
+        :param end: nanoseconds since the epoch before which the selected points end, all if None
+        :returns an iterator over the offset after each selected point, its imei, nanoseconds and fields
+        """
+        read = 0
+        try:
+            for first_point, batch in self.batches(offset, start, end):
+                for row_number, (imei, nanoseconds, fields) in enumerate(batch.points(), first_point + 1):
+                    if row_number <= offset:
+                        continue
+                    read += 1
+                    if (start is None or nanoseconds >= start) and (end is None or nanoseconds < end):
+                        yield row_number, imei, nanoseconds, fields
+                    else:
+                        metrics.count("rows.filtered.selection")
+        finally:
+            metrics.count("rows.read", read)
+
+
+def is_archive(path: str) -> bool:
+    """
+    :returns True if the file is a columnar archive rather than a log file
+    """
+    with open(path, "rb") as log_file:
+        return log_file.read(len(MAGIC)) == MAGIC
+
+
+def read_span(path: str) -> TimeSpan:
+    """
+    :returns the first and last raw timestamp of the archived log file's rows
+    """
+    with ArchiveReader(path) as reader:
+        return reader.span
+
+
+def restore_log(path: str):
+    """
+    replaces a columnar archive with the log file it was converted from, which keeps the modification time of the
+    archive. The archive stays if it has no copy of the log file or the copy is corrupt
+    """
+    stat = os.stat(path)
+    with ArchiveReader(path) as reader, _replacing(path) as log_file:
+        reader.copy_log(log_file)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+
+@contextmanager
+def create_archive(path: str, measurement: str = "sensor_data") -> Iterator[ArchiveWriter]:
+    """
+    :returns a writer whose archive replaces the file at the path once the block is left without an error,
+             the writer needs to be closed within the block
+    """
+    with _replacing(path) as archive_file:
+        yield ArchiveWriter(archive_file, measurement)
+
+
+def store_archive(path: str, data: bytes):
+    """
+    writes an archive that was built in memory to the path
+    """
+    with _replacing(path) as archive_file:
+        archive_file.write(data)
+
+
+@contextmanager
+def _replacing(path: str) -> Iterator[BinaryIO]:
+    """
+    :returns a hidden file next to the path, which replaces the file at the path once the block is left without
+             an error, so that the path never has an incomplete archive
+    """
+    temporary_path = os.path.join(os.path.dirname(path), "." + os.path.basename(path) + ".tmp")
+    try:
+        with open(temporary_path, "wb") as archive_file:
+            yield archive_file
+            archive_file.flush()
+            os.fsync(archive_file.fileno())
+        os.replace(temporary_path, path)
+    finally:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
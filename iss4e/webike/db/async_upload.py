@@ -0,0 +1,145 @@
+import asyncio
+import logging
+import random
+from itertools import islice
+from typing import Callable, Iterable, Iterator
+
+import aiohttp
+
+# noinspection PyPep8Naming
+from iss4e.util import BraceMessage as __
+
+from iss4e.webike.db.classes import WorkItem
+from iss4e.webike.db.csv_parser import CSVParser
+from iss4e.webike.db.metrics import metrics, profiled
+from iss4e.webike.db.scheduler import ImportScheduler, ParsedLog, create_process_pool
+
+logger = logging.getLogger("iss4e.webike.db")
+
+
+class TransientWriteError(Exception):
+    pass
+
+
+class AsyncUploader(object):
+    """
+    Posts line protocol to the database's write endpoint over a shared connection pool,
+    with a bounded number of concurrent requests and retries with jitter on transient errors
+    """
+
+    def __init__(self, url: str, database: str, username: str = None, password: str = None, in_flight: int = 8,
+                 retries: int = 5, backoff: float = 0.5):
+        """
+        :param url: base url of the database, e.g. http://localhost:8086
+        :param in_flight: maximum number of concurrent write requests
+        :param retries: number of retries of a failed write before giving up
+        :param backoff: base delay in seconds of the exponential backoff between retries
+        """
+        self._url = url.rstrip("/") + "/write"
+        self._params = {"db": database}
+        self._auth = aiohttp.BasicAuth(username, password or "") if username else None
+        self._in_flight = in_flight
+        self._retries = retries
+        self._backoff = backoff
+        self._session = None
+        self._semaphore = None
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    @classmethod
+    def from_config(cls, influx_config, upload_config):
+        """
+        :param influx_config: database connection settings, webike.influx
+        :param upload_config: upload settings, webike.upload. A non-empty url replaces the database, e.g. with a stub
+        """
+        url = upload_config.get("url", "")
+        if not url:
+            scheme = "https" if influx_config.get("ssl", False) else "http"
+            url = "{scheme}://{host}:{port}".format(scheme=scheme, host=influx_config.get("host", "localhost"),
+                                                    port=influx_config.get("port", 8086))
+        return cls(url, influx_config["database"], influx_config.get("username", None),
+                   influx_config.get("password", None), upload_config.get("in_flight", 8),
+                   upload_config.get("retries", 5), upload_config.get("backoff", 0.5))
+
+    async def write(self, data: bytes):
+        if self._session is None:
+            self._session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self._in_flight))
+            self._semaphore = asyncio.Semaphore(self._in_flight)
+
+        for attempt in range(self._retries + 1):
+            try:
+                async with self._semaphore:
+                    await self._post(data)
+                return
+            except (TransientWriteError, aiohttp.ClientError, asyncio.TimeoutError) as error:
+                if attempt == self._retries:
+                    raise
+                metrics.count("retries")
+                # full jitter keeps retrying writers from hitting a recovering database at the same time
+                delay = random.uniform(0, self._backoff * 2 ** attempt)
+                logger.warning(__("Write failed with {error}, retry in {delay:.2f}s", error=error, delay=delay))
+                await asyncio.sleep(delay)
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def _post(self, data: bytes):
+        async with self._session.post(self._url, params=self._params, data=data, auth=self._auth) as response:
+            if response.status == 204:
+                return
+            message = "{status}: {body}".format(status=response.status, body=await response.text())
+            if response.status >= 500 or response.status == 429:
+                raise TransientWriteError(message)
+            raise ValueError(message)
+
+
+class AsyncImportScheduler(ImportScheduler):
+    """
+    Parses log files in a process pool and uploads them with an AsyncUploader in the main process
+    """
+
+    def __init__(self, csv_parser: CSVParser, get_offset: Callable[[WorkItem], int],
+                 upload: Callable[[AsyncUploader, WorkItem, ParsedLog], "asyncio.Future"],
+                 uploader: AsyncUploader, parse_workers: int = 0, profile_directory: str = None,
+                 archive: bool = False, part_points: int = 0):
+        """
+        :param upload: coroutine function uploading a log file given its ParsedLog
+        """
+        super().__init__(csv_parser, get_offset, None, parse_workers, 0, profile_directory, archive, part_points)
+        self._async_upload = upload
+        self._uploader = uploader
+        # enough files need to be uploading at once to keep all write slots busy
+        self._max_pending = 2 * self._parse_workers + uploader.in_flight
+
+    def run(self, work: Iterable[WorkItem]) -> Iterator[WorkItem]:
+        work = iter(work)
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        tasks = {}
+        try:
+            with create_process_pool(self._parse_workers, self._csv_parser, self._profile_directory,
+                                     self._archive) as parse_pool:
+                while True:
+                    # parsing only runs ahead of the uploads up to the pending limit
+                    for item in islice(work, max(self._max_pending - len(tasks), 0)):
+                        parsed = self._submit_parse(parse_pool, item)
+                        tasks[loop.create_task(self._async_upload(self._uploader, item, parsed))] = item
+                    if not tasks:
+                        break
+
+                    # the event loop runs all uploads, so it is profiled as a whole
+                    with profiled(self._profile_directory, "upload"):
+                        done, _ = loop.run_until_complete(
+                            asyncio.wait(list(tasks), return_when=asyncio.FIRST_COMPLETED))
+                    for task in done:
+                        item = tasks.pop(task)
+                        # rethrows unexpected errors of the upload
+                        task.result()
+                        yield item
+        finally:
+            loop.run_until_complete(self._uploader.close())
+            loop.close()
@@ -0,0 +1 @@
+"""Benchmarks for the WeBike log import pipeline, run them as modules, e.g. python3 -m iss4e.webike.db.benchmark.conversion"""
@@ -0,0 +1,99 @@
+"""Compares the write volume of raw points and of their windowed aggregates and checks the aggregates against
+the parsed points
+
+Usage:
+  aggregation.py [--rows=ROWS] [--version=VERSION] [--windows=WINDOWS] [--null-density=DENSITY]
+
+Options:
+  -h --help               Show this screen.
+  --rows=ROWS             Number of synthetic log rows [default: 20000]
+  --version=VERSION       Log format version of the synthetic log [default: 2]
+  --windows=WINDOWS       Comma separated window lengths in seconds [default: 1,60]
+  --null-density=DENSITY  Fraction of empty, null and NaN values [default: 0.05]
+
+"""
+import math
+import os
+import tempfile
+from typing import List
+
+from docopt import docopt
+
+from iss4e.webike.db.aggregation import AGGREGATE_FUNCTIONS, Aggregation, window_label
+from iss4e.webike.db.benchmark.synthetic import write_logs
+from iss4e.webike.db.classes import Directory
+from iss4e.webike.db.csv_parser import V1Parser, V2Parser, V3Parser
+from iss4e.webike.db.timestamp import TimestampConverter
+
+PARSERS = {1: V1Parser, 2: V2Parser, 3: V3Parser}
+FIELDS = ["acceleration_x", "acceleration_y", "acceleration_z", "voltage", "charging_current", "battery_temperature"]
+
+
+def _expected_aggregates(rows: list, seconds: int) -> dict:
+    """
+    :param rows: the parsed rows of the log file
+    :returns the aggregate fields by window start, computed from the rows one window at a time
+    """
+    timestamps = TimestampConverter('Canada/Eastern')
+    length = seconds * 10 ** 9
+    values_by_window = {}
+    for _, _, timestamp, fields in rows:
+        nanoseconds = timestamps.to_nanoseconds(timestamp)
+        values = values_by_window.setdefault(nanoseconds - nanoseconds % length, {})
+        for field in FIELDS:
+            value = fields.get(field)
+            if type(value) in (float, int) and math.isfinite(value):
+                values.setdefault(field, []).append(value)
+    return {start: {field + "_" + name: function(field_values) for field, field_values in values.items()
+                    for name, function in AGGREGATE_FUNCTIONS.items()}
+            for start, values in values_by_window.items() if values}
+
+
+def _parse_lines(data: List[bytes], measurement: str) -> dict:
+    """
+    :returns the fields by timestamp of the line protocol points of the measurement
+    """
+    aggregates = {}
+    for line in b"".join(data).decode().splitlines():
+        series, field_set, timestamp = line.rsplit(" ", 2)
+        if series.split(",")[0] == measurement:
+            aggregates[int(timestamp)] = {key: int(value[:-1]) if value.endswith("i") else float(value) for
+                                          key, value in (field.split("=") for field in field_set.split(","))}
+    return aggregates
+
+
+def _matches(expected: dict, written: dict) -> bool:
+    return expected.keys() == written.keys() and all(
+        math.isclose(expected[start][key], written[start][key], rel_tol=1e-9) and
+        expected[start].keys() == written[start].keys() for start in expected for key in expected[start])
+
+
+def run(rows: int, version: int, windows: List[int], null_density: float):
+    with tempfile.TemporaryDirectory() as root:
+        path, _ = write_logs(root, 1, 1, rows, [version], null_density)[0]
+        directory = Directory(os.path.basename(os.path.dirname(path)), os.path.dirname(path))
+        file_name = os.path.basename(path)
+        raw_parser = PARSERS[version]()
+        with open(path) as csv_file:
+            rows = list(raw_parser._parse_rows(raw_parser._get_reader(csv_file, directory.name)))
+        raw_data = [data for _, data in raw_parser.read_chunks(directory, file_name)]
+        aggregation = Aggregation(windows, FIELDS, sorted(AGGREGATE_FUNCTIONS), False)
+        aggregate_data = [data for _, data in PARSERS[version](aggregation=aggregation).read_chunks(directory,
+                                                                                                    file_name)]
+
+    print("{name:>16}: {points:8d} points {size:12d} bytes".format(
+        name="raw", points=sum(data.count(b"\n") for data in raw_data), size=sum(map(len, raw_data))))
+    for seconds in windows:
+        measurement = "sensor_data_" + window_label(seconds)
+        written = _parse_lines(aggregate_data, measurement)
+        size = sum(len(line) + 1 for data in aggregate_data for line in data.splitlines()
+                   if line.startswith(measurement.encode() + b","))
+        result = "matches" if _matches(_expected_aggregates(rows, seconds), written) else "differs"
+        print("{name:>16}: {points:8d} points {size:12d} bytes, {result}".format(
+            name=measurement, points=len(written), size=size, result=result))
+
+
+if __name__ == "__main__":
+    arguments = docopt(__doc__)
+    run(int(arguments["--rows"]), int(arguments["--version"]),
+        [int(window) for window in arguments["--windows"].split(",")], float(arguments["--null-density"]))
@@ -0,0 +1,68 @@
+"""Converts a synthetic log into a columnar archive, compares the file sizes and the time it takes to import the log
+and the archive and checks that both yield the same line protocol
+
+Usage:
+  archive.py [--rows=ROWS] [--version=VERSION] [--null-density=DENSITY]
+
+Options:
+  -h --help               Show this screen.
+  --rows=ROWS             Number of synthetic log rows [default: 50000]
+  --version=VERSION       Log format version of the synthetic log [default: 2]
+  --null-density=DENSITY  Fraction of empty, null and NaN values [default: 0.05]
+
+"""
+import os
+import tempfile
+import time
+from typing import Tuple
+
+from docopt import docopt
+
+from iss4e.webike.db.archive import ArchiveReader
+from iss4e.webike.db.benchmark.synthetic import write_logs
+from iss4e.webike.db.classes import Directory, WorkItem
+from iss4e.webike.db.csv_parser import V1Parser, V2Parser, V3Parser
+from iss4e.webike.db.scheduler import convert_log
+
+PARSERS = {1: V1Parser, 2: V2Parser, 3: V3Parser}
+
+
+def _timed_import(parser, directory: Directory, file_name: str) -> Tuple[bytes, float]:
+    """
+    :returns the line protocol of the file and the seconds it took to read it
+    """
+    start = time.perf_counter()
+    data = b"".join(chunk for _, chunk in parser.read_chunks(directory, file_name))
+    return data, time.perf_counter() - start
+
+
+def run(rows: int, version: int, null_density: float):
+    with tempfile.TemporaryDirectory() as root:
+        path, _ = write_logs(root, 1, 1, rows, [version], null_density)[0]
+        directory = Directory(os.path.basename(os.path.dirname(path)), os.path.dirname(path))
+        file_name = os.path.basename(path)
+        archive_directory = Directory(directory.name, os.path.join(directory.abs_path, "archive"))
+        os.mkdir(archive_directory.abs_path)
+
+        start = time.perf_counter()
+        convert_log(PARSERS[version](), WorkItem(directory, file_name, 0), os.path.join(archive_directory.abs_path,
+                                                                                         file_name))
+        convert_seconds = time.perf_counter() - start
+        log_data, log_seconds = _timed_import(PARSERS[version](), directory, file_name)
+        archive_data, archive_seconds = _timed_import(PARSERS[version](), archive_directory, file_name)
+        log_size = os.path.getsize(path)
+        archive_size = os.path.getsize(os.path.join(archive_directory.abs_path, file_name))
+        with ArchiveReader(os.path.join(archive_directory.abs_path, file_name)) as reader:
+            points, blocks = reader.points, len(reader.blocks)
+
+    print("{name:>8}: {size:12d} bytes, imported in {seconds:.3f}s".format(name="log", size=log_size,
+                                                                         seconds=log_seconds))
+    print("{name:>8}: {size:12d} bytes, imported in {seconds:.3f}s, converted in {convert:.3f}s, {points} points "
+          "in {blocks} blocks".format(name="archive", size=archive_size, seconds=archive_seconds,
+                                      convert=convert_seconds, points=points, blocks=blocks))
+    print("line protocol {result}".format(result="matches" if log_data == archive_data else "differs"))
+
+
+if __name__ == "__main__":
+    arguments = docopt(__doc__)
+    run(int(arguments["--rows"]), int(arguments["--version"]), float(arguments["--null-density"]))
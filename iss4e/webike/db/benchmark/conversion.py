@@ -0,0 +1,57 @@
+"""Compares the column typed value conversion with the generic literal parsing it replaced
+
+Usage:
+  conversion.py [--rows=ROWS] [--repeat=REPEAT]
+
+Options:
+  -h --help        Show this screen.
+  --rows=ROWS      Number of synthetic log rows [default: 20000]
+  --repeat=REPEAT  Number of timed runs per conversion, the best one is reported [default: 3]
+
+"""
+import ast
+import timeit
+
+from docopt import docopt
+
+from iss4e.webike.db.benchmark.synthetic import V2_FIELDNAMES, generate_rows
+from iss4e.webike.db.value_converter import compile_converters
+
+
+def _legacy_value(key: str, value: str):
+    try:
+        parsed_value = ast.literal_eval(value.title())
+        if key == "code_version":
+            parsed_value = int(parsed_value)
+        return parsed_value
+    except (ValueError, SyntaxError):
+        return value
+
+
+def _convert_legacy(rows):
+    return [[_legacy_value(key, value) for key, value in zip(V2_FIELDNAMES, row)] for row in rows]
+
+
+def _convert_typed(rows):
+    converters = compile_converters(tuple(V2_FIELDNAMES))
+    return [[converters[key](value) for key, value in zip(V2_FIELDNAMES, row)] for row in rows]
+
+
+def run(rows: int, repeat: int):
+    data = list(generate_rows(V2_FIELDNAMES, rows, code_version=20))
+    legacy = _convert_legacy(data)
+    typed = _convert_typed(data)
+    mismatches = sum(1 for legacy_row, typed_row in zip(legacy, typed) for a, b in zip(legacy_row, typed_row)
+                     if a != b or type(a) is not type(b))
+
+    cells = rows * len(V2_FIELDNAMES)
+    for name, function in (("literal_eval", _convert_legacy), ("typed", _convert_typed)):
+        seconds = min(timeit.repeat(lambda: function(data), number=1, repeat=repeat))
+        print("{name:>12}: {seconds:8.3f}s {rate:12.0f} values/s".format(name=name, seconds=seconds,
+                                                                       rate=cells / seconds))
+    print("{mismatches} mismatching values".format(mismatches=mismatches))
+
+
+if __name__ == "__main__":
+    arguments = docopt(__doc__)
+    run(int(arguments["--rows"]), int(arguments["--repeat"]))
@@ -0,0 +1,80 @@
+"""Imports the first part of a synthetic log and then the whole log against the dedup index, checks that the
+second import only writes the points of the rest of the log and times it against an import without the index
+
+Usage:
+  dedup.py [--rows=ROWS] [--version=VERSION] [--imported=FRACTION] [--columnar]
+
+Options:
+  -h --help             Show this screen.
+  --rows=ROWS           Number of synthetic log rows [default: 50000]
+  --version=VERSION     Log format version of the synthetic log [default: 3]
+  --imported=FRACTION   Fraction of the rows that is imported first [default: 0.8]
+  --columnar            Parses the log with the columnar mode, requires numpy
+
+"""
+import os
+import shutil
+import tempfile
+import time
+from typing import List, Tuple
+
+from docopt import docopt
+
+from iss4e.webike.db.benchmark.synthetic import write_logs
+from iss4e.webike.db.classes import Directory
+from iss4e.webike.db.csv_parser import V1Parser, V2Parser, V3Parser
+from iss4e.webike.db.dedup import DedupIndex
+
+PARSERS = {1: V1Parser, 2: V2Parser, 3: V3Parser}
+
+
+def _timestamps(data: List[bytes]) -> List[int]:
+    return [int(line.rsplit(b" ", 1)[1]) for chunk in data for line in chunk.splitlines()]
+
+
+def _import(parser, directory: Directory, file_name: str, index: DedupIndex = None) -> Tuple[List[bytes], float]:
+    """
+    :returns the chunks and the seconds it took to parse them, the chunks are added to the index
+    """
+    start = time.perf_counter()
+    data = [chunk for _, chunk in parser.read_chunks(directory, file_name)]
+    seconds = time.perf_counter() - start
+    if index is not None:
+        for chunk in data:
+            index.add_line_protocol(chunk)
+        index.compact()
+    return data, seconds
+
+
+def run(rows: int, version: int, imported: float, columnar: bool):
+    with tempfile.TemporaryDirectory() as root:
+        path, _ = write_logs(root, 1, 1, rows, [version])[0]
+        directory = Directory(os.path.basename(os.path.dirname(path)), os.path.dirname(path))
+        file_name = os.path.basename(path)
+        with open(path) as log_file:
+            lines = log_file.readlines()
+        # the header and the first rows, as if the log was imported while it was still being written
+        part_name = "part_" + file_name
+        with open(os.path.join(directory.abs_path, part_name), "w") as part_file:
+            part_file.writelines(lines[:1 + int((len(lines) - 1) * imported)])
+
+        index = DedupIndex(os.path.join(root, "dedup"))
+        first, _ = _import(PARSERS[version](columnar, dedup=index), directory, part_name, index)
+        second, dedup_seconds = _import(PARSERS[version](columnar, dedup=index), directory, file_name)
+        full, seconds = _import(PARSERS[version](columnar), directory, file_name)
+        index.close()
+        index_size = sum(entry.stat().st_size for entry in os.scandir(os.path.join(root, "dedup")))
+        shutil.rmtree(os.path.join(root, "dedup"))
+
+    written = _timestamps(first) + _timestamps(second)
+    # the database keeps one point per imei and timestamp
+    result = "matches" if set(written) == set(_timestamps(full)) else "differs"
+    print("first import: {points:8d} points".format(points=len(_timestamps(first))))
+    print("second import: {points:7d} points in {seconds:.3f}s, without index {all:d} points in {full:.3f}s"
+          .format(points=len(_timestamps(second)), seconds=dedup_seconds, all=len(_timestamps(full)), full=seconds))
+    print("index: {size:d} bytes, written timestamps {result} a single import".format(size=index_size, result=result))
+
+
+if __name__ == "__main__":
+    arguments = docopt(__doc__)
+    run(int(arguments["--rows"]), int(arguments["--version"]), float(arguments["--imported"]), arguments["--columnar"])
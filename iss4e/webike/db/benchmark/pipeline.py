@@ -0,0 +1,229 @@
+"""Times each stage of the log import on synthetic log files and saves the results as JSON, so that the
+results of different versions can be compared
+
+Usage:
+  pipeline.py [--imeis=IMEIS] [--files=FILES] [--rows=ROWS] [--versions=VERSIONS] [--null-density=DENSITY]
+              [--message-density=DENSITY] [--chunk-points=POINTS] [--upload-workers=WORKERS] [--repeat=REPEAT]
+              [--directory=DIRECTORY] [--label=LABEL] [--output=FILE] [--compare=FILE]
+
+Options:
+  -h --help                  Show this screen.
+  --imeis=IMEIS              Number of imei folders [default: 4]
+  --files=FILES              Number of log files per imei folder [default: 4]
+  --rows=ROWS                Number of rows per log file [default: 5000]
+  --versions=VERSIONS        Comma separated log format versions, the files take turns [default: 1,2,3]
+  --null-density=DENSITY     Fraction of empty, null and NaN values [default: 0.05]
+  --message-density=DENSITY  Fraction of log message rows in format 1 and 2 files [default: 0.01]
+  --chunk-points=POINTS      Number of points per upload request [default: 5000]
+  --upload-workers=WORKERS   Number of upload threads [default: 4]
+  --repeat=REPEAT            Number of timed runs, the fastest run of each stage is reported [default: 1]
+  --directory=DIRECTORY      Writes the logs into this folder and keeps them, a temporary folder is used otherwise
+  --label=LABEL              Name of the results, e.g. a commit [default: current]
+  --output=FILE              File the results are written to [default: benchmark.json]
+  --compare=FILE             Results of an earlier run to compare the rates with
+
+"""
+import json
+import logging
+import os
+import platform
+import resource
+import tempfile
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, List, Tuple
+
+from docopt import docopt
+
+from iss4e.webike.db.benchmark.stub_server import StubServer
+from iss4e.webike.db.benchmark.synthetic import write_logs
+from iss4e.webike.db.classes import Directory
+from iss4e.webike.db.csv_parser import V1Parser, V2Parser, V3Parser
+from iss4e.webike.db.file_system_access import FileSystemAccess
+from iss4e.webike.db.line_protocol import LineProtocolSerializer
+from iss4e.webike.db.timestamp import TimestampConverter
+from iss4e.webike.db.value_converter import compile_converters
+
+LOGFILE_REGEX = "^data.*?[.].+?[.]log$"
+STAGES = ["scan", "parse", "convert", "serialize", "upload"]
+
+
+class _Stage(object):
+    """
+    Duration of a stage and the amount of data it processed
+    """
+
+    def __init__(self, seconds: float, rows: int, size: int):
+        """
+        :param rows: files, rows or points the stage processed
+        :param size: bytes of log files or line protocol the stage processed
+        """
+        self.seconds = seconds
+        self.rows = rows
+        self.size = size
+        self.peak_rss = _peak_rss()
+
+    def as_dict(self) -> dict:
+        seconds = self.seconds or float("nan")
+        return {"seconds": self.seconds, "rows": self.rows, "bytes": self.size, "rows_per_second": self.rows / seconds,
+                "megabytes_per_second": self.size / 10 ** 6 / seconds, "peak_rss_megabytes": self.peak_rss}
+
+
+def _peak_rss() -> float:
+    """
+    :returns the peak resident set size of the process so far in megabytes
+    """
+    # kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _timed(function: Callable, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - start, result
+
+
+def _scan(root: str) -> list:
+    directories = [Directory(entry.name, entry.path) for entry in os.scandir(root) if entry.is_dir()]
+    listings = FileSystemAccess(logging.getLogger("iss4e.webike.db")).scan(LOGFILE_REGEX, directories)
+    return [(directory, log_file) for directory, log_files in listings.items() for log_file in log_files]
+
+
+def _parse(logs: List[Tuple[str, int]]) -> Tuple[list, int]:
+    """
+    :returns the parser, field names and rows with sensor data of each log file and the number of lines read
+    """
+    parsed = []
+    lines = 0
+    for path, version in logs:
+        parser = {1: V1Parser, 2: V2Parser, 3: V3Parser}[version]()
+        with open(path) as csv_file:
+            reader = parser._get_reader(csv_file, os.path.basename(os.path.dirname(path)))
+            rows = [row for row in reader if parser._filter_for_correct_log_format(row)]
+            lines += reader.line_num
+        parsed.append((parser, reader.fieldnames, rows))
+    return parsed, lines
+
+
+def _convert(parsed: list) -> list:
+    """
+    :returns the imei, timestamp in nanoseconds and typed fields of each row
+    """
+    timestamps = TimestampConverter("Canada/Eastern")
+    converted = []
+    for parser, fieldnames, rows in parsed:
+        parser._converters = compile_converters(tuple(fieldnames))
+        converted.append([(parser._get_imei(row), timestamps.to_nanoseconds(row.pop("timestamp")),
+                           parser._get_fields_with_correct_data_type(row)) for row in rows])
+    return converted
+
+
+def _serialize(converted: list, chunk_points: int) -> List[bytes]:
+    chunks = []
+    for points in converted:
+        serializer = LineProtocolSerializer("sensor_data")
+        for imei, nanoseconds, fields in points:
+            serializer.add(imei, fields, nanoseconds)
+            if serializer.points >= chunk_points:
+                chunks.append(serializer.flush())
+        if serializer.points:
+            chunks.append(serializer.flush())
+    return chunks
+
+
+def _upload(chunks: List[bytes], url: str, workers: int):
+    def post(data: bytes):
+        request = urllib.request.Request(url + "/write?db=webike", data=data, method="POST")
+        with urllib.request.urlopen(request) as response:
+            if response.status != 204:
+                raise ValueError(response.status)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(post, chunks))
+
+
+def run_stages(root: str, logs: List[Tuple[str, int]], chunk_points: int, upload_workers: int) \
+        -> Dict[str, _Stage]:
+    """
+    Runs the stages one after the other, each one on the complete output of the stage before
+    """
+    log_bytes = sum(os.path.getsize(path) for path, _ in logs)
+
+    stages = {}
+    seconds, listing = _timed(_scan, root)
+    stages["scan"] = _Stage(seconds, len(listing), log_bytes)
+    seconds, (parsed, lines) = _timed(_parse, logs)
+    stages["parse"] = _Stage(seconds, lines, log_bytes)
+    seconds, converted = _timed(_convert, parsed)
+    stages["convert"] = _Stage(seconds, sum(len(points) for points in converted), log_bytes)
+    del parsed
+    seconds, chunks = _timed(_serialize, converted, chunk_points)
+    points = sum(len(points) for points in converted)
+    line_protocol_bytes = sum(len(chunk) for chunk in chunks)
+    stages["serialize"] = _Stage(seconds, points, line_protocol_bytes)
+    del converted
+
+    server = StubServer().start()
+    try:
+        seconds, _ = _timed(_upload, chunks, server.url, upload_workers)
+    finally:
+        server.shutdown()
+        server.server_close()
+    if server.points != points:
+        raise ValueError("stub received {received} of {points} points".format(received=server.points,
+                                                                               points=points))
+    stages["upload"] = _Stage(seconds, points, line_protocol_bytes)
+    return stages
+
+
+def _print(results: dict, earlier: dict = None):
+    print("{stage:>10} {seconds:>9} {rows:>12} {megabytes:>9} {rss:>9}{change}".format(
+        stage="stage", seconds="seconds", rows="rows/s", megabytes="MB/s", rss="peak MB",
+        change="  vs {label}".format(label=earlier["label"]) if earlier else ""))
+    for stage in STAGES:
+        result = results["stages"][stage]
+        change = ""
+        if earlier and stage in earlier["stages"]:
+            change = "  {ratio:6.2f}x".format(
+                ratio=result["rows_per_second"] / earlier["stages"][stage]["rows_per_second"])
+        print("{stage:>10} {seconds:9.3f} {rows:12.0f} {megabytes:9.2f} {rss:9.1f}{change}".format(
+            stage=stage, seconds=result["seconds"], rows=result["rows_per_second"],
+            megabytes=result["megabytes_per_second"], rss=result["peak_rss_megabytes"], change=change))
+
+
+def main(arguments: dict):
+    parameters = {"imeis": int(arguments["--imeis"]), "files": int(arguments["--files"]),
+                  "rows": int(arguments["--rows"]),
+                  "versions": [int(version) for version in arguments["--versions"].split(",")],
+                  "null_density": float(arguments["--null-density"]),
+                  "message_density": float(arguments["--message-density"]),
+                  "chunk_points": int(arguments["--chunk-points"]),
+                  "upload_workers": int(arguments["--upload-workers"])}
+
+    with tempfile.TemporaryDirectory() as temporary_directory:
+        root = arguments["--directory"] or temporary_directory
+        logs = write_logs(root, parameters["imeis"], parameters["files"], parameters["rows"],
+                          parameters["versions"], parameters["null_density"], parameters["message_density"])
+        best = {}
+        for _ in range(int(arguments["--repeat"])):
+            for stage, result in run_stages(root, logs, parameters["chunk_points"],
+                                            parameters["upload_workers"]).items():
+                if stage not in best or result.seconds < best[stage].seconds:
+                    best[stage] = result
+
+    results = {"label": arguments["--label"], "created": datetime.now().isoformat(),
+               "python": platform.python_version(), "platform": platform.platform(), "parameters": parameters,
+               "stages": {stage: result.as_dict() for stage, result in best.items()}}
+    earlier = None
+    if arguments["--compare"]:
+        with open(arguments["--compare"]) as earlier_file:
+            earlier = json.load(earlier_file)
+    _print(results, earlier)
+    with open(arguments["--output"], "w") as output_file:
+        json.dump(results, output_file, indent=2, sort_keys=True)
+
+
+if __name__ == "__main__":
+    main(docopt(__doc__))
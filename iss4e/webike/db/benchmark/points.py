@@ -0,0 +1,91 @@
+"""Compares the memory of buffered points as influxdb client dicts and as point batches and checks that
+iterating over the batches yields the same dicts
+
+Usage:
+  points.py [--rows=ROWS] [--version=VERSION] [--null-density=DENSITY]
+
+Options:
+  -h --help               Show this screen.
+  --rows=ROWS             Number of synthetic log rows [default: 20000]
+  --version=VERSION       Log format version of the synthetic log [default: 2]
+  --null-density=DENSITY  Fraction of empty, null and NaN values [default: 0.05]
+
+"""
+import os
+import tempfile
+import tracemalloc
+from csv import DictReader
+from typing import Iterator
+
+from docopt import docopt
+
+from iss4e.webike.db.benchmark.synthetic import write_logs
+from iss4e.webike.db.classes import Directory
+from iss4e.webike.db.csv_parser import CSVParser, V1Parser, V2Parser, V3Parser
+from iss4e.webike.db.date_time import DateTime
+from iss4e.webike.db.point_batch import PointBatch
+
+PARSERS = {1: V1Parser, 2: V2Parser, 3: V3Parser}
+
+
+def dict_points(parser: CSVParser, reader: DictReader) -> Iterator[dict]:
+    """
+    :returns an iterator over the points of the rows in the influxdb client's dict format
+    """
+    for _, imei, timestamp, fields in parser._parse_rows(reader):
+        yield {"measurement": "sensor_data",
+               "tags": {"imei": imei},
+               "time": DateTime.from_string(timestamp, 'Canada/Eastern').utc_time,
+               "fields": fields}
+
+
+def point_batches(parser: CSVParser, reader: DictReader, batch_points: int) -> Iterator[PointBatch]:
+    """
+    :returns an iterator over batches of at most batch_points points of one imei
+    """
+    schema = parser._get_schema(reader.fieldnames or ())
+    batch = None
+    for _, imei, timestamp, fields in parser._parse_rows(reader):
+        if batch is None or batch.imei != imei or len(batch) >= batch_points:
+            if batch is not None:
+                yield batch
+            batch = PointBatch("sensor_data", imei, schema)
+        batch.append(parser._timestamps.to_nanoseconds(timestamp), fields)
+    if batch is not None:
+        yield batch
+
+
+def _traced(function):
+    """
+    :returns the result of the function and the memory it still holds
+    """
+    tracemalloc.start()
+    try:
+        result = function()
+        return result, tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+
+
+def run(rows: int, version: int, null_density: float):
+    with tempfile.TemporaryDirectory() as root:
+        path, _ = write_logs(root, 1, 1, rows, [version], null_density)[0]
+        directory = Directory(os.path.basename(os.path.dirname(path)), os.path.dirname(path))
+        parser = PARSERS[version]()
+
+        def read(function):
+            with open(path) as csv_file:
+                return list(function(parser._get_reader(csv_file, directory.name)))
+
+        points, dict_bytes = _traced(lambda: read(lambda reader: dict_points(parser, reader)))
+        batches, batch_bytes = _traced(lambda: read(lambda reader: point_batches(parser, reader, rows)))
+
+    result = "matches" if points == [point for batch in batches for point in batch] else "differs"
+    print("iteration {result} for {count} points".format(result=result, count=len(points)))
+    for name, size in (("dicts", dict_bytes), ("point batches", batch_bytes)):
+        print("{name:>14}: {size:10.0f} bytes/point".format(name=name, size=size / len(points)))
+
+
+if __name__ == "__main__":
+    arguments = docopt(__doc__)
+    run(int(arguments["--rows"]), int(arguments["--version"]), float(arguments["--null-density"]))
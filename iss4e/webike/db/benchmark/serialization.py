@@ -0,0 +1,57 @@
+"""Compares the line protocol serializer with building point dicts for the influxdb client. tests/test_line_protocol.py
+checks that both describe the same points
+
+Usage:
+  serialization.py [--rows=ROWS] [--repeat=REPEAT]
+
+Options:
+  -h --help        Show this screen.
+  --rows=ROWS      Number of synthetic log rows [default: 20000]
+  --repeat=REPEAT  Number of timed runs per serialization, the best one is reported [default: 3]
+
+"""
+import csv
+import io
+import timeit
+
+from docopt import docopt
+
+from iss4e.webike.db.benchmark.points import dict_points
+from iss4e.webike.db.benchmark.synthetic import V3_FIELDNAMES, generate_rows
+from iss4e.webike.db.csv_parser import V3Parser
+from iss4e.webike.db.line_protocol import LineProtocolSerializer
+
+
+def _dict_points(log: str) -> list:
+    return list(dict_points(V3Parser(), csv.DictReader(io.StringIO(log))))
+
+
+def _serialized_points(log: str) -> bytes:
+    serializer = LineProtocolSerializer("sensor_data")
+    for _ in V3Parser()._serialize(csv.DictReader(io.StringIO(log)), 0, serializer):
+        pass
+    return serializer.flush()
+
+
+def run(rows: int, repeat: int):
+    log = io.StringIO()
+    writer = csv.writer(log)
+    writer.writerow(V3_FIELDNAMES)
+    writer.writerows(generate_rows(V3_FIELDNAMES, rows, code_version=25))
+    log = log.getvalue()
+
+    timings = [("dicts", lambda: _dict_points(log)), ("line protocol", lambda: _serialized_points(log))]
+    try:
+        from influxdb.line_protocol import make_lines
+        timings.append(("dicts + make_lines", lambda: make_lines({"points": _dict_points(log)}).encode()))
+    except ImportError:
+        pass
+    for name, function in timings:
+        seconds = min(timeit.repeat(function, number=1, repeat=repeat))
+        print("{name:>18}: {seconds:8.3f}s {rate:12.0f} rows/s".format(name=name, seconds=seconds,
+                                                                     rate=rows / seconds))
+
+
+if __name__ == "__main__":
+    arguments = docopt(__doc__)
+    run(int(arguments["--rows"]), int(arguments["--repeat"]))
@@ -0,0 +1,91 @@
+"""Spools the chunks of synthetic log files, drains them into a stub of the database write endpoint with an
+interruption in between and checks that every point arrives exactly once
+
+Usage:
+  spool.py [--files=FILES] [--rows=ROWS] [--chunk-points=POINTS] [--failure-rate=RATE] [--rate=POINTS]
+           [--segment-size=BYTES]
+
+Options:
+  -h --help              Show this screen.
+  --files=FILES          Number of synthetic log files [default: 8]
+  --rows=ROWS            Number of rows per log file [default: 5000]
+  --chunk-points=POINTS  Number of points per chunk [default: 1000]
+  --failure-rate=RATE    Fraction of writes the stub answers with 503 [default: 0.1]
+  --rate=POINTS          Maximum number of points per second of the drain, 0 = unlimited [default: 0]
+  --segment-size=BYTES   Size of the spool segments [default: 1048576]
+
+"""
+import os
+import tempfile
+import time
+import urllib.request
+
+from docopt import docopt
+
+from iss4e.webike.db.benchmark.stub_server import StubServer
+from iss4e.webike.db.benchmark.synthetic import write_logs
+from iss4e.webike.db.classes import Directory
+from iss4e.webike.db.csv_parser import AutoParser
+from iss4e.webike.db.spool import Spool, drain
+
+
+def _post(url: str):
+    def write(data: bytes):
+        request = urllib.request.Request(url + "/write?db=webike", data=data, method="POST")
+        with urllib.request.urlopen(request) as response:
+            if response.status != 204:
+                raise ValueError(response.status)
+
+    return write
+
+
+def run(files: int, rows: int, chunk_points: int, failure_rate: float, rate: float, segment_size: int):
+    with tempfile.TemporaryDirectory() as root:
+        parser = AutoParser(chunk_points=chunk_points)
+        chunks = []
+        for path, _ in write_logs(os.path.join(root, "logs"), 1, files, rows, [1, 2, 3]):
+            directory = Directory(os.path.basename(os.path.dirname(path)), os.path.dirname(path))
+            chunks.extend(data for _, data in parser.read_chunks(directory, os.path.basename(path)))
+        points = sum(data.count(b"\n") for data in chunks)
+        size = sum(map(len, chunks))
+
+        spool_directory = os.path.join(root, "spool")
+        spool = Spool(spool_directory, segment_size)
+        start = time.perf_counter()
+        for data in chunks:
+            spool.append(data)
+        spool_seconds = time.perf_counter() - start
+        spooled_size = sum(os.path.getsize(os.path.join(spool_directory, name))
+                           for name in os.listdir(spool_directory) if name.endswith(".spool"))
+        spool.close()
+
+        server = StubServer(failure_rate=failure_rate).start()
+        try:
+            # the first drain stops half way like a crashed one, the second one has to send the rest
+            first = Spool(spool_directory, segment_size)
+            start = time.perf_counter()
+            sent = drain(first, _post(server.url), rate, backoff=0.01,
+                         should_stop=lambda: server.points >= points // 2)
+            first.close()
+            second = Spool(spool_directory, segment_size)
+            sent += drain(second, _post(server.url), rate, backoff=0.01)
+            drain_seconds = time.perf_counter() - start
+            remaining = len(second.pending())
+            second.close()
+        finally:
+            server.shutdown()
+        segments = len([name for name in os.listdir(spool_directory) if name.endswith(".spool")])
+
+    result = "exactly once" if server.points == points and sent == len(chunks) else "differs"
+    print("{points} points in {chunks} chunks, {sent} sent with {failures} failed writes: {result}".format(
+        points=points, chunks=len(chunks), sent=sent, failures=server.failures, result=result))
+    print("spooled {megabytes:.1f} MB as {spooled:.1f} MB at {rate:.1f} MB/s, {remaining} records and {segments} "
+          "segments left".format(megabytes=size / 10 ** 6, spooled=spooled_size / 10 ** 6,
+                                 rate=size / 10 ** 6 / spool_seconds, remaining=remaining, segments=segments))
+    print("drained {rate:.0f} points/s".format(rate=points / drain_seconds))
+
+
+if __name__ == "__main__":
+    arguments = docopt(__doc__)
+    run(int(arguments["--files"]), int(arguments["--rows"]), int(arguments["--chunk-points"]),
+        float(arguments["--failure-rate"]), float(arguments["--rate"]), int(arguments["--segment-size"]))
@@ -0,0 +1,81 @@
+"""Serves a stub of the InfluxDB write endpoint that accepts and counts line protocol points without storing them
+
+Usage:
+  stub_server.py [--port=PORT] [--failure-rate=RATE] [--delay=SECONDS]
+
+Options:
+  -h --help            Show this screen.
+  --port=PORT          Port to listen on [default: 8086]
+  --failure-rate=RATE  Fraction of writes answered with 503 to exercise retries [default: 0]
+  --delay=SECONDS      Delay before each response to simulate a remote database [default: 0]
+
+"""
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+from docopt import docopt
+
+
+class StubServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port: int = 0, failure_rate: float = 0.0, delay: float = 0.0):
+        """
+        :param port: port to listen on, a free one if 0
+        """
+        super().__init__(("localhost", port), _WriteHandler)
+        self.failure_rate = failure_rate
+        self.delay = delay
+        self.points = 0
+        self.bytes = 0
+        self.requests = 0
+        self.failures = 0
+        self.lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        return "http://localhost:{port}".format(port=self.server_address[1])
+
+    def start(self):
+        """
+        serves requests in a background thread until shutdown() is called
+        """
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+class _WriteHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.server.delay:
+            time.sleep(self.server.delay)
+        with self.server.lock:
+            self.server.requests += 1
+            failed = random.random() < self.server.failure_rate
+            if failed:
+                self.server.failures += 1
+            else:
+                self.server.points += body.count(b"\n")
+                self.server.bytes += len(body)
+        self.send_response(503 if failed else 204)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+if __name__ == "__main__":
+    arguments = docopt(__doc__)
+    server = StubServer(int(arguments["--port"]), float(arguments["--failure-rate"]), float(arguments["--delay"]))
+    print("Serving write endpoint on {url}".format(url=server.url))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("{points} points in {requests} requests, {failures} failed".format(
+            points=server.points, requests=server.requests, failures=server.failures))
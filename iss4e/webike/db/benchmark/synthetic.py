@@ -0,0 +1,100 @@
+import csv
+import os
+import random
+from datetime import datetime, timedelta
+from typing import Iterator, List, Tuple
+
+V1_FIELDNAMES = ["timestamp", "class", "latitude", "longitude", "network_latitude", "network_longitude",
+                 "acceleration_x", "acceleration_y", "acceleration_z", "magnetic_field_x", "magnetic_field_y",
+                 "magnetic_field_z", "gyroscope_x", "gyroscope_y", "gyroscope_z", "atmospheric_pressure",
+                 "light_level", "gravitational_acceleration", "linear_acceleration_x", "linear_acceleration_y",
+                 "linear_acceleration_z", "step_count", "battery_temperature", "ambient_temperature", "voltage",
+                 "charging_current", "significant_motion", "proximity_sensor", "phone_ip", "phone_battery_state"]
+V2_FIELDNAMES = V1_FIELDNAMES[:2] + ["code_version"] + V1_FIELDNAMES[2:] + ["discharge_current"]
+V3_FIELDNAMES = ["timestamp", "IMEI"] + V2_FIELDNAMES[1:]
+FIELDNAMES_BY_VERSION = {1: V1_FIELDNAMES, 2: V2_FIELDNAMES, 3: V3_FIELDNAMES}
+# code versions written by the app for each log format
+CODE_VERSIONS = {2: 17, 3: 23}
+LOG_MESSAGES = ["Sensor service started", "GPS signal lost", "Upload of log files failed", "Battery low"]
+
+
+def _value(field: str, rng: random.Random, null_density: float) -> str:
+    if rng.random() < null_density:
+        return rng.choice(["", "null", "NaN"])
+    if field == "class":
+        return "SensorData"
+    if field == "step_count":
+        return str(rng.randint(0, 10000))
+    if field == "significant_motion":
+        return rng.choice(["true", "false"])
+    if field == "phone_ip":
+        return "10.0.{}.{}".format(rng.randint(0, 255), rng.randint(0, 255))
+    if field == "phone_battery_state":
+        return rng.choice(["charging", "discharging", "full"])
+    return repr(round(rng.uniform(-100, 100), 6))
+
+
+def generate_rows(fieldnames: List[str], rows: int, imei: str = "123456789012345", code_version: int = None,
+                  null_density: float = 0.05, seed: int = 0) -> Iterator[List[str]]:
+    """
+    :returns an iterator over rows of a synthetic log with the given columns
+    """
+    rng = random.Random(seed)
+    time = datetime(2016, 3, 13, 1, 0, 0)
+    for _ in range(rows):
+        time += timedelta(milliseconds=rng.randint(100, 1000))
+        row = []
+        for field in fieldnames:
+            if field == "timestamp":
+                row.append(time.strftime('%Y-%m-%d %H:%M:%S.%f')[:-3])
+            elif field == "IMEI":
+                row.append(imei)
+            elif field == "code_version":
+                row.append(str(code_version))
+            else:
+                row.append(_value(field, rng, null_density))
+        yield row
+
+
+def generate_log(version: int, rows: int, imei: str = "123456789012345", null_density: float = 0.05,
+                 message_density: float = 0.0, seed: int = 0, short_messages: bool = False) -> Iterator[List[str]]:
+    """
+    :param message_density: fraction of rows with a written log message instead of sensor data, only in the
+                            old formats 1 and 2
+    :param short_messages: message rows only have the timestamp and the message instead of empty sensor data columns
+    :returns an iterator over the rows of a synthetic log file in the given format, including its header
+    """
+    fieldnames = FIELDNAMES_BY_VERSION[version]
+    if version == 3:
+        yield fieldnames
+    rng = random.Random(seed)
+    for row in generate_rows(fieldnames, rows, imei, CODE_VERSIONS.get(version), null_density, seed):
+        if version < 3 and rng.random() < message_density:
+            message = rng.choice(LOG_MESSAGES)
+            if short_messages:
+                row = row[:1] + [message]
+            else:
+                # messages take the place of the sensor data after the timestamp and class columns
+                row = row[:1] + ["LogMessage", message] + [""] * (len(fieldnames) - 3)
+        yield row
+
+
+def write_logs(root: str, imeis: int, files_per_imei: int, rows: int, versions: List[int],
+               null_density: float = 0.05, message_density: float = 0.0, seed: int = 0,
+               short_messages: bool = False) -> List[Tuple[str, int]]:
+    """
+    Writes synthetic log files into one folder per imei below root, the formats of the files take turns
+    :returns the paths and format versions of the written files
+    """
+    logs = []
+    for imei_index in range(imeis):
+        imei = str(350000000000000 + imei_index)
+        os.makedirs(os.path.join(root, imei), exist_ok=True)
+        for file_index in range(files_per_imei):
+            version = versions[(imei_index * files_per_imei + file_index) % len(versions)]
+            path = os.path.join(root, imei, "data{index:04d}.csv.log".format(index=file_index))
+            with open(path, "w", newline="") as log_file:
+                csv.writer(log_file).writerows(generate_log(version, rows, imei, null_density, message_density,
+                                                            seed + len(logs), short_messages))
+            logs.append((path, version))
+    return logs
@@ -0,0 +1,40 @@
+"""Compares the cached timestamp conversion with DateTime.from_string. tests/test_timestamps.py checks that both
+agree around DST transitions
+
+Usage:
+  timestamps.py [--rows=ROWS] [--repeat=REPEAT] [--time-zone=TIME_ZONE]
+
+Options:
+  -h --help                Show this screen.
+  --rows=ROWS              Number of synthetic timestamps [default: 100000]
+  --repeat=REPEAT          Number of timed runs per conversion, the best one is reported [default: 3]
+  --time-zone=TIME_ZONE    Time zone of the log timestamps [default: Canada/Eastern]
+
+"""
+import timeit
+from typing import List
+
+from docopt import docopt
+
+from iss4e.webike.db.benchmark.synthetic import V3_FIELDNAMES, generate_rows
+from iss4e.webike.db.date_time import DateTime
+from iss4e.webike.db.timestamp import TimestampConverter
+
+
+def _reference(timestamps: List[str], time_zone_str: str) -> List[int]:
+    return [DateTime.from_string(timestamp, time_zone_str).epoch_nanoseconds for timestamp in timestamps]
+
+
+def run(rows: int, repeat: int, time_zone_str: str):
+    timestamps = [row[0] for row in generate_rows(V3_FIELDNAMES[:1], rows)]
+    timings = [("from_string", lambda: _reference(timestamps, time_zone_str)),
+               ("cached", lambda: TimestampConverter(time_zone_str).column_to_nanoseconds(timestamps))]
+    for name, function in timings:
+        seconds = min(timeit.repeat(function, number=1, repeat=repeat))
+        print("{name:>12}: {seconds:8.3f}s {rate:12.0f} timestamps/s".format(name=name, seconds=seconds,
+                                                                           rate=rows / seconds))
+
+
+if __name__ == "__main__":
+    arguments = docopt(__doc__)
+    run(int(arguments["--rows"]), int(arguments["--repeat"]), arguments["--time-zone"])
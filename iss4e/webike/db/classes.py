@@ -1,5 +1,23 @@
-from typing import NamedTuple
+from typing import List, NamedTuple, Optional, Tuple
+
+from iss4e.webike.db.aggregation import WindowPiece
+from iss4e.webike.db.selection import TimeSpan
 
 File = str
 Data = dict
+# row offset to resume from after the chunk and its points as line protocol
+Chunk = Tuple[int, bytes]
 Directory = NamedTuple('Directory', [('name', str), ('abs_path', str)])
+# size in bytes and modification time in nanoseconds
+LogFile = NamedTuple('LogFile', [('name', File), ('size', int), ('mtime', int)])
+# a log file moved back from a subfolder into its imei folder by a reset
+Move = NamedTuple('Move', [('source', str), ('target', str)])
+WorkItem = NamedTuple('WorkItem', [('directory', Directory), ('file', File), ('size', int)])
+
+# chunks of a part of a log file parsed in a worker process, the metrics taken there, the time span of the file's
+# rows up to the end of the part, which is None if the file was not read from the start, the file's columnar archive
+# if the worker built one, the row offset the next part starts at, None for the last part, and the aggregation
+# windows cut by the start or end of the part
+Parsed = NamedTuple('Parsed', [('chunks', List[Chunk]), ('metrics', dict), ('span', Optional[TimeSpan]),
+                               ('archive', Optional[bytes]), ('resume', Optional[int]),
+                               ('pieces', List[WindowPiece])])
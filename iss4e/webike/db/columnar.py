@@ -0,0 +1,313 @@
+import csv
+from collections import deque
+from datetime import datetime
+from io import TextIOWrapper
+from itertools import islice
+from typing import Callable, Dict, Iterator, List, Tuple, Union
+
+import numpy as np
+
+from iss4e.webike.db.line_protocol import encode_value, escape_measurement, escape_tag
+from iss4e.webike.db.timestamp import TimestampConverter
+from iss4e.webike.db.value_converter import bool_value, code_version_value, float_value, get_converter, int_value, \
+    numeric_literal
+
+# maximum number of rows of a block, the raw strings of a block take far more memory than its typed columns
+BLOCK_ROWS = 1024
+
+# kinds of the values of a TypedColumn
+FLOAT, INTEGER, BOOLEAN, OBJECT = range(4)
+# converters whose values in the plain number formats are converted in bulk
+_NUMBER_CONVERTERS = (float_value, int_value, code_version_value)
+# integers with more digits might not fit into int64
+_MAX_INTEGER_DIGITS = 18
+
+
+class TypedColumn(object):
+    """
+    The values of a column converted exactly like the row-wise parsing converts them. Plain numbers and booleans
+    are held in typed arrays, all other values as the python values the column's converter returns.
+    """
+
+    def __init__(self, kinds: np.ndarray, floats: np.ndarray, integers: np.ndarray, objects: np.ndarray = None):
+        """
+        :param kinds: FLOAT, INTEGER, BOOLEAN or OBJECT for each value
+        :param integers: the integer values and the booleans as 0 or 1
+        :param objects: the converted values of kind OBJECT, None if there are none
+        """
+        self.kinds = kinds
+        self.floats = floats
+        self.integers = integers
+        self.objects = objects
+
+    def select(self, mask: np.ndarray) -> "TypedColumn":
+        return TypedColumn(self.kinds[mask], self.floats[mask], self.integers[mask],
+                           self.objects[mask] if self.objects is not None else None)
+
+    def differs_from(self, raw: np.ndarray) -> np.ndarray:
+        """
+        :returns a mask of the values that are not converted to their raw string
+        """
+        differs = self.kinds != OBJECT
+        if self.objects is not None:
+            is_object = ~differs
+            differs[is_object] = self.objects[is_object] != raw[is_object]
+        return differs
+
+    def encode(self, valid: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        :param valid: mask of the values to encode
+        :returns the line protocol encoded values and the mask of the valid values that could be encoded
+        """
+        kinds = self.kinds[valid]
+        encoded = np.empty(len(kinds), dtype=object)
+        for kind, values, encode in ((FLOAT, self.floats, _encode_floats),
+                                     (INTEGER, self.integers, _encode_integers),
+                                     (BOOLEAN, self.integers, _encode_booleans)):
+            of_kind = kinds == kind
+            if of_kind.any():
+                encoded[of_kind] = encode(values[valid][of_kind])
+        is_object = kinds == OBJECT
+        if is_object.any():
+            encoded[is_object] = [encode_value(value) for value in self.objects[valid][is_object].tolist()]
+        encodable = np.not_equal(encoded, None)
+        return encoded[encodable], encodable
+
+
+class ColumnBatch(object):
+    """
+    A block of log rows stored as one object array of raw strings per column, which are converted into typed
+    columns when they are needed
+    """
+
+    def __init__(self, fieldnames: List[str], columns: dict, lengths: np.ndarray, typed: Dict[str, TypedColumn] = None):
+        self.fieldnames = fieldnames
+        self.columns = columns
+        self.lengths = lengths
+        self._lower = {}
+        self._typed = typed or {}  # type: Dict[str, TypedColumn]
+
+    @classmethod
+    def from_rows(cls, fieldnames: List[str], rows: List[List[str]]):
+        width = len(fieldnames)
+        lengths = np.fromiter(map(len, rows), dtype=np.int64, count=len(rows))
+        # rows with missing columns get empty values, which every parser treats like missing values
+        rows = [row if len(row) == width else (row + [""] * (width - len(row)))[:width] for row in rows]
+        columns = dict((name, np.array(column, dtype=object)) for name, column in zip(fieldnames, zip(*rows)))
+        return cls(fieldnames, columns, lengths)
+
+    def __len__(self):
+        return len(self.lengths)
+
+    @property
+    def surplus(self) -> np.ndarray:
+        """
+        :returns a mask of rows with more values than columns
+        """
+        return self.lengths > len(self.fieldnames)
+
+    def full_mask(self, value: bool) -> np.ndarray:
+        return np.full(len(self), value, dtype=bool)
+
+    def column(self, name: str) -> np.ndarray:
+        return self.columns[name]
+
+    def lower(self, name: str) -> np.ndarray:
+        if name not in self._lower:
+            self._lower[name] = _lower(self.columns[name])
+        return self._lower[name]
+
+    def typed(self, name: str) -> TypedColumn:
+        """
+        :returns the column values converted like in the row based parsing
+        """
+        if name not in self._typed:
+            self._typed[name] = _to_typed(self.columns[name], get_converter(name))
+        return self._typed[name]
+
+    def numeric(self, name: str) -> np.ndarray:
+        """
+        :returns the column parsed to float, unparsable values are NaN
+        """
+        return _convert_unique(self.columns[name], _numeric_or_nan).astype(np.float64)
+
+    def select(self, mask: np.ndarray):
+        return ColumnBatch(self.fieldnames, dict((name, values[mask]) for name, values in self.columns.items()),
+                           self.lengths[mask], dict((name, typed.select(mask)) for name, typed in self._typed.items()))
+
+    def utc_timestamps(self, timestamps: TimestampConverter) -> np.ndarray:
+        """
+        :returns the timestamp column as int64 nanoseconds since the epoch
+        """
+        local_time = self.columns["timestamp"].astype("datetime64[us]")
+        unique_hours, inverse = np.unique(local_time.astype("datetime64[h]"), return_inverse=True)
+        inverse = inverse.reshape(-1)
+        # UTC offsets rarely change within an hour, so one lookup per distinct hour is enough
+        offsets = [timestamps.utc_offset(hour.astype(datetime)) for hour in unique_hours]
+        nanoseconds = local_time.astype(np.int64) * 1000 - np.array([offset or 0 for offset in offsets])[inverse]
+        for index, offset in enumerate(offsets):
+            if offset is None:
+                rows = inverse == index
+                nanoseconds[rows] = timestamps.column_to_nanoseconds(self.columns["timestamp"][rows])
+        return nanoseconds
+
+    def to_line_protocol(self, measurement: str, imei: Union[str, np.ndarray], fields: List[str],
+                         value_mask: Callable[["ColumnBatch", str], np.ndarray],
+                         timestamps: TimestampConverter) -> List[str]:
+        """
+        :param imei: a single imei for all rows or an imei column
+        :param value_mask: returns the mask of usable values for a batch and column name
+        :returns one InfluxDB line protocol string per row that has at least one field
+        """
+        if not len(self):
+            return []
+
+        field_set = np.full(len(self), "", dtype=object)
+        for field in fields:
+            field_set = field_set + _encode_field(field, self.typed(field), value_mask(self, field))
+
+        has_fields = field_set != ""
+        if isinstance(imei, np.ndarray):
+            series = (escape_measurement(measurement) + ",imei=") + _escape_tags(imei[has_fields])
+        else:
+            series = escape_measurement(measurement) + ",imei=" + escape_tag(imei)
+        times = self.utc_timestamps(timestamps)[has_fields].astype(str).astype(object)
+        return ((series + " ") + _strip_separator(field_set[has_fields]) + " " + times).tolist()
+
+
+def read_batches(csv_file: TextIOWrapper, get_fieldnames: Callable[[Iterator[List[str]]], List[str]],
+                 chunk_size: int = BLOCK_ROWS, skip_rows: int = 0) -> Iterator[ColumnBatch]:
+    """
+    :param get_fieldnames: returns the column names of the log, may consume a header row
+    :param skip_rows: number of rows after the header that are skipped
+    :returns an iterator over blocks of at most chunk_size rows of the log file
+    """
+    # blank lines are no rows, like for the DictReader of the row-wise mode, so that both count the same offsets
+    reader = (row for row in csv.reader(csv_file) if row)
+    fieldnames = get_fieldnames(reader)
+    deque(islice(reader, skip_rows), maxlen=0)
+    while True:
+        rows = list(islice(reader, chunk_size))
+        if not rows:
+            return
+        yield ColumnBatch.from_rows(fieldnames, rows)
+
+
+def _numeric_or_nan(value: str):
+    try:
+        parsed_value = numeric_literal(value)
+        return float(parsed_value) if isinstance(parsed_value, (int, float)) else np.nan
+    except (ValueError, SyntaxError, TypeError):
+        return np.nan
+
+
+def _convert_unique(values: np.ndarray, converter: Callable[[str], object]) -> np.ndarray:
+    """
+    converts each distinct value once, which pays off for low cardinality columns like code_version
+    """
+    if not len(values):
+        return np.empty(0, dtype=object)
+    unique_values, inverse = np.unique(values.astype(str), return_inverse=True)
+    converted = np.empty(len(unique_values), dtype=object)
+    converted[:] = [converter(value) for value in unique_values.tolist()]
+    return converted[inverse.reshape(-1)]
+
+
+def _encode_field(field: str, column: TypedColumn, valid: np.ndarray) -> np.ndarray:
+    encoded = np.full(len(valid), "", dtype=object)
+    if not valid.any():
+        return encoded
+    prefix = "," + escape_tag(field) + "="
+    typed_values, typed_valid = column.encode(valid)
+    indices = np.flatnonzero(valid)[typed_valid]
+    encoded[indices] = prefix + typed_values
+    return encoded
+
+
+def _to_typed(values: np.ndarray, converter: Callable[[str], object]) -> TypedColumn:
+    """
+    converts the values in the plain number and boolean formats of the converter in bulk and only the others one
+    by one with the converter
+    """
+    count = len(values)
+    kinds = np.full(count, OBJECT, dtype=np.int8)
+    floats = np.zeros(count, dtype=np.float64)
+    integers = np.zeros(count, dtype=np.int64)
+    if count and converter in _NUMBER_CONVERTERS:
+        integral, fractional = _plain_numbers(values.astype(str))
+        try:
+            integers[integral] = values[integral].astype(np.int64)
+            kinds[integral] = INTEGER
+        except (ValueError, OverflowError):
+            pass
+        # code versions in a float format are truncated by the converter, which the one by one conversion does
+        if converter is not code_version_value:
+            try:
+                parsed = values[fractional].astype(np.float64)
+                # the converters keep infinite values, which cannot be written, like strings they cannot parse
+                finite = np.isfinite(parsed)
+                fractional[fractional] = finite
+                floats[fractional] = parsed[finite]
+                kinds[fractional] = FLOAT
+            except ValueError:
+                pass
+    elif count and converter is bool_value:
+        lower_values = _lower(values)
+        is_true = lower_values == "true"
+        is_boolean = is_true | (lower_values == "false")
+        integers[is_true] = 1
+        kinds[is_boolean] = BOOLEAN
+
+    objects = None
+    is_object = kinds == OBJECT
+    if is_object.any():
+        objects = np.full(count, None, dtype=object)
+        objects[is_object] = _convert_unique(values[is_object], converter)
+    return TypedColumn(kinds, floats, integers, objects)
+
+
+def _plain_numbers(text: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    :param text: fixed width unicode array
+    :returns the masks of the integers in the int converters' format and of the values that only have the
+             characters of a float and at least one digit, which still might not be valid floats
+    """
+    count = len(text)
+    width = text.dtype.itemsize // 4
+    if not width:
+        return np.zeros(count, dtype=bool), np.zeros(count, dtype=bool)
+    # one code point per character, padded with zeros, and two more zeros to look past the first digit
+    characters = np.zeros((count, width + 2), dtype=np.uint32)
+    characters[:, :width] = text.view(np.uint32).reshape(count, width)
+    digits = (characters >= ord("0")) & (characters <= ord("9"))
+    signs = (characters == ord("+")) | (characters == ord("-"))
+    separators = (characters == ord(".")) | (characters == ord("e")) | (characters == ord("E"))
+    number_like = (digits | signs | separators | (characters == 0)).all(axis=1) & digits.any(axis=1)
+
+    leading_sign = signs[:, 0]
+    first_digit = np.arange(count), leading_sign.astype(np.intp)
+    second_digit = first_digit[0], first_digit[1] + 1
+    # python's literal parser rejects leading zeros, e.g. 007, which the converters keep as strings
+    leading_zero = (characters[first_digit] == ord("0")) & digits[second_digit]
+    integral = number_like & ~separators.any(axis=1) & ~signs[:, 1:].any(axis=1) & ~leading_zero \
+        & (digits.sum(axis=1) <= _MAX_INTEGER_DIGITS)
+    fractional = number_like & separators.any(axis=1)
+    return integral, fractional
+
+
+def _encode_floats(values: np.ndarray) -> List[str]:
+    # repr is faster than numpy's string conversion and is what the row-wise serializer writes
+    return list(map(repr, values.tolist()))
+
+
+def _encode_integers(values: np.ndarray) -> List[str]:
+    return [value + "i" for value in map(str, values.tolist())]
+
+
+def _encode_booleans(values: np.ndarray) -> np.ndarray:
+    return np.where(values == 1, "true", "false").astype(object)
+
+
+_lower = np.frompyfunc(str.lower, 1, 1)
+_escape_tags = np.frompyfunc(escape_tag, 1, 1)
+_strip_separator = np.frompyfunc(lambda field_set: field_set[1:], 1, 1)
@@ -1,75 +1,333 @@
-import ast
 import logging
 import os
+import time
 from abc import ABCMeta, abstractmethod
-from csv import DictReader
-from io import TextIOWrapper
-from typing import Iterator, Tuple
+from csv import DictReader, reader as csv_reader
+from io import StringIO, TextIOWrapper
+from contextlib import ExitStack
+from itertools import islice
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
 
 # noinspection PyPep8Naming
 from iss4e.util import BraceMessage as __
 
+from iss4e.webike.db.aggregation import Aggregation, Downsampler, WindowPiece
+from iss4e.webike.db.archive import ArchiveReader, ArchiveWriter, is_archive
 from iss4e.webike.db.classes import *
-from iss4e.webike.db.date_time import DateTime
+from iss4e.webike.db.dedup import DedupIndex
+from iss4e.webike.db.line_protocol import LineProtocolSerializer
+from iss4e.webike.db.mapped_reader import MappedDictReader, map_log, plain_int
+from iss4e.webike.db.metrics import metrics
+from iss4e.webike.db.selection import ImportSelection, TimeSpan
+from iss4e.webike.db.timestamp import TimestampConverter
+from iss4e.webike.db.value_converter import compile_converters, get_converter, numeric_literal
 
 NEW_IMPORT_FORMAT_CODE_VERSION = 21
+# number of characters at the start and the end of a log file that are sniffed for its format
+SNIFF_SIZE = 16 * 1024
 logger = logging.getLogger("iss4e.webike.db")
 
 
 class CSVParser(object):
     __metaclass__ = ABCMeta
+    DROPPED_FIELDS = []
 
-    def read_logs(self, directory: Directory, files: Iterator[File]) -> Iterator[Tuple[Directory, File, Data]]:
+    def __init__(self, columnar: bool = False, chunk_points: int = 5000, chunk_bytes: int = 0, mmap_size: int = 0,
+                 selection: ImportSelection = None, aggregation: Aggregation = None, dedup: DedupIndex = None):
         """
-        :returns an iterator over directories, log file names of their data
+        :param columnar: parse log files in blocks of typed NumPy columns, which is faster than the row-wise mode
+                         but needs somewhat more memory
+        :param chunk_points: maximum number of points per chunk of a log file
+        :param chunk_bytes: maximum line protocol size per chunk of a log file, no limit if 0
+        :param mmap_size: log files of at least this many bytes are memory mapped in the row-wise mode, none if 0
+        :param selection: only rows within its time range are read, all if None
+        :param aggregation: windowed aggregates of the points that are written in addition to or instead of them,
+                            they are computed in the row-wise mode only, so columnar is ignored if it is set
+        :param dedup: points it contains are not written again, all points are written if None
         """
-        logger.info("Start reading log files")
-        for file_name in files:
-            logger.debug(__("Read log file {file} in directory {dir}", file=file_name, dir=directory.name))
-            with open(os.path.join(directory.abs_path, file_name)) as csv_file:
-                reader = self._get_reader(csv_file, directory.name)
-                data = self._format(reader)
-                if data["points"]:
-                    yield directory, file_name, data
+        self._columnar = columnar
+        self._timestamps = TimestampConverter('Canada/Eastern')
+        self._chunk_points = chunk_points
+        self._chunk_bytes = chunk_bytes
+        self._mmap_size = mmap_size
+        self._selection = selection if selection is not None and selection.is_partial else None
+        self._aggregation = aggregation
+        self._dedup = dedup
+
+    def read_chunks(self, directory: Directory, file_name: File, offset: int = 0, span: TimeSpan = None,
+                    archive: ArchiveWriter = None, pieces: List[WindowPiece] = None) -> Iterator[Chunk]:
+        """
+        Reads columnar archives as well, their offsets count points instead of rows
+        :param span: extended by the timestamps of all sensor data rows after the offset, selected or not
+        :param archive: the points of all parsed rows are added to it, the row-wise mode is used then. Not used
+                        for files that are archives already
+        :param pieces: the aggregation windows cut by the start or end of the read rows are added to it instead of
+                       written, see Downsampler
+        :returns an iterator over the row offset to resume from after each chunk and the chunk as line protocol
+        """
+        logger.debug(__("Read log file {file} in directory {dir}", file=file_name, dir=directory.name))
+        serializer = LineProtocolSerializer("sensor_data")
+        path = os.path.join(directory.abs_path, file_name)
+        with ExitStack() as stack:
+            if is_archive(path):
+                offsets = self._serialize_archive(stack.enter_context(ArchiveReader(path)), offset, serializer,
+                                                  span, pieces)
+            else:
+                csv_file = stack.enter_context(open(path))
+                if self._columnar and self._aggregation is None and archive is None:
+                    offsets = self._serialize_columnar(csv_file, directory.name, offset, serializer, span)
                 else:
-                    logger.info(
-                        __("No sensor data read from file {file} in directory {dir}", file=file_name,
-                           dir=directory.name))
-                    yield directory, file_name, None
+                    offsets = self._serialize(self._open_reader(stack, csv_file, path, directory.name), offset,
+                                              serializer, span, archive, pieces)
+            yield from self._split_into_chunks(offsets, serializer)
 
-        return ()
+    def write_archive(self, directory: Directory, file_name: File, archive: ArchiveWriter, span: TimeSpan = None):
+        """
+        adds the points of all rows of a log file to the archive without serializing them
+        :param span: extended by the timestamps of all sensor data rows
+        """
+        path = os.path.join(directory.abs_path, file_name)
+        with ExitStack() as stack:
+            reader = self._open_reader(stack, stack.enter_context(open(path)), path, directory.name)
+            archive.fieldnames = self._get_schema(getattr(reader, "fieldnames", None) or ())
+            for _, imei, timestamp, fields in self._parse_rows(reader, 0, span):
+                archive.add(imei, self._timestamps.to_nanoseconds(timestamp), fields)
+
+    def _open_reader(self, stack: ExitStack, csv_file: TextIOWrapper, path: str, directory_name: str):
+        """
+        :returns a MappedDictReader for large files if memory mapping is enabled, the reader of the text file else
+        """
+        if self._mmap_size and os.fstat(csv_file.fileno()).st_size >= self._mmap_size:
+            mapped = stack.enter_context(map_log(path))
+            if mapped is not None:
+                return self._get_mapped_reader(mapped, directory_name)
+        return self._get_reader(csv_file, directory_name)
 
-    def _format(self, reader: DictReader) -> dict:
+    def _get_schema(self, fieldnames: Iterable[str]) -> List[str]:
+        """
+        :returns the fields of the points read from a log file with the given columns
+        """
+        return [field for field in fieldnames if
+                field not in self.DROPPED_FIELDS and field not in ("timestamp", "IMEI")]
+
+    def _split_into_chunks(self, offsets: Iterator[int], serializer: LineProtocolSerializer) -> Iterator[Chunk]:
+        """
+        :param offsets: row offsets after each point written to the serializer or skipped as a duplicate
+        :returns chunks of the points, the last one is empty if only duplicates follow the one before
+        """
+        flushed = True
+        for next_offset in offsets:
+            flushed = False
+            if serializer.points >= self._chunk_points or (self._chunk_bytes and
+                                                           len(serializer) >= self._chunk_bytes):
+                yield next_offset, serializer.flush()
+                flushed = True
+        if not flushed:
+            yield next_offset, serializer.flush()
+
+    def _parse_rows(self, reader: DictReader, offset: int = 0, span: TimeSpan = None) \
+            -> Iterator[Tuple[int, str, str, dict]]:
         """
         :param reader: log file data
-        :returns formatted data
+        :param offset: number of rows to skip
+        :param span: extended by the timestamp of each sensor data row
+        :returns an iterator over the row offset after each selected sensor data row, its imei, timestamp and fields
         """
 
         logger.debug("Formatting row")
 
-        return {"points": [{"measurement": "sensor_data",
-                            "tags": {"imei": self._get_imei(row)},
-                            "time": DateTime.from_string(row.pop("timestamp"), 'Canada/Eastern').utc_time,
-                            "fields": self._get_fields_with_correct_data_type(row)
-                            } for row in reader if self._filter_for_correct_log_format(row)]}
+        self._converters = compile_converters(tuple(reader.fieldnames or ()))
+        selection = self._selection
+        row_number = offset
+        try:
+            for row_number, row in enumerate(islice(reader, offset, None), offset + 1):
+                # a MappedDictReader yields None for rows its prefilter rejected
+                if row is not None and self._filter_for_correct_log_format(row):
+                    imei = self._get_imei(row)
+                    timestamp = row.pop("timestamp")
+                    if span is not None:
+                        span.add(timestamp)
+                    # the raw timestamp is compared before any value is converted
+                    if selection is None or selection.contains_timestamp(timestamp):
+                        yield row_number, imei, timestamp, self._get_fields_with_correct_data_type(row)
+                    else:
+                        metrics.count("rows.filtered.selection")
+        finally:
+            metrics.count("rows.read", row_number - offset)
+
+    def _serialize(self, reader: DictReader, offset: int, serializer: LineProtocolSerializer,
+                   span: TimeSpan = None, archive: ArchiveWriter = None,
+                   pieces: List[WindowPiece] = None) -> Iterator[int]:
+        """
+        :returns an iterator over the row offset after each point written to the serializer
+        """
+        if archive is not None:
+            archive.fieldnames = self._get_schema(getattr(reader, "fieldnames", None) or ())
+        return self._serialize_rows(self._parse_rows(reader, offset, span), self._timestamps.to_nanoseconds,
+                                    serializer, archive, pieces)
+
+    def _serialize_archive(self, reader: ArchiveReader, offset: int, serializer: LineProtocolSerializer,
+                           span: TimeSpan = None, pieces: List[WindowPiece] = None) -> Iterator[int]:
+        """
+        :returns an iterator over the point offset after each archived point written to the serializer
+        """
+        if span is not None and reader.span.first is not None:
+            span.add(reader.span.first)
+            span.add(reader.span.last)
+        start = end = None
+        if self._selection is not None:
+            # archived points only have UTC timestamps, so the selected local times are converted instead. The
+            # conversion keeps the order of the raw timestamps, except for the nonexistent local times at the start
+            # of daylight saving time, which a device clock does not write and which convert into the next hour
+            if self._selection.start is not None:
+                start = self._timestamps.to_nanoseconds(self._selection.start + ".0")
+            if self._selection.end is not None:
+                end = self._timestamps.to_nanoseconds(self._selection.end + ".0")
+        # the timestamps of archived points are nanoseconds already
+        return self._serialize_rows(reader.rows(offset, start, end), int, serializer, pieces=pieces)
+
+    def _serialize_rows(self, rows: Iterator[Tuple[int, str, object, dict]], to_nanoseconds: Callable[[object], int],
+                        serializer: LineProtocolSerializer, archive: ArchiveWriter = None,
+                        pieces: List[WindowPiece] = None) -> Iterator[int]:
+        """
+        :param rows: the row offset after each point, its imei, timestamp and fields
+        :param to_nanoseconds: converts the timestamps of the rows to nanoseconds since the epoch
+        :returns an iterator over the row offset after each point written to the serializer
+        """
+        clock = time.perf_counter
+        parse_seconds = timestamp_seconds = serialize_seconds = 0.0
+        downsampler = Downsampler(self._aggregation, pieces=pieces) if self._aggregation is not None else None
+        raw = downsampler is None or self._aggregation.raw
+        dedup = self._dedup
+        duplicates = 0
+        try:
+            while True:
+                start = clock()
+                parsed = next(rows, None)
+                parsed_time = clock()
+                parse_seconds += parsed_time - start
+                if parsed is None:
+                    break
+
+                row_number, imei, timestamp, fields = parsed
+                nanoseconds = to_nanoseconds(timestamp)
+                converted_time = clock()
+                if archive is not None:
+                    archive.add(imei, nanoseconds, fields)
+                duplicate = raw and dedup is not None and dedup.contains(imei, nanoseconds)
+                if duplicate:
+                    duplicates += 1
+                added = raw and not duplicate and serializer.add(imei, fields, nanoseconds)
+                # aggregates are written again from all points, so that windows with new points are complete
+                if downsampler is not None:
+                    added = downsampler.add(row_number, imei, nanoseconds, fields, serializer) or added
+                timestamp_seconds += converted_time - parsed_time
+                serialize_seconds += clock() - converted_time
+                if added or duplicate:
+                    if downsampler is None:
+                        yield row_number
+                    else:
+                        # a resumed import reads the rows of open windows again, so that their aggregates are complete
+                        yield downsampler.resume_offset(row_number)
+            if downsampler is not None and downsampler.finish(serializer):
+                yield row_number
+            elif pieces:
+                # the pieces are written once the chunks are, until then a resumed import reads their rows again
+                yield downsampler.resume_offset(row_number)
+        finally:
+            rows.close()
+            metrics.add_time("parse", parse_seconds)
+            metrics.add_time("timestamps", timestamp_seconds)
+            metrics.add_time("serialize", serialize_seconds)
+            if duplicates:
+                metrics.count("points.duplicate", duplicates)
+
+    def _serialize_columnar(self, csv_file: TextIOWrapper, directory_name: str, offset: int,
+                            serializer: LineProtocolSerializer, span: TimeSpan = None) -> Iterator[int]:
+        """
+        :returns an iterator over the row offset to resume from after each point written to the serializer
+        """
+        # numpy is only required for the columnar mode
+        from iss4e.webike.db.columnar import BLOCK_ROWS, read_batches
+
+        batch_start = offset
+        batches = read_batches(csv_file, self._get_fieldnames, min(self._chunk_points, BLOCK_ROWS), offset)
+        while True:
+            with metrics.timer("parse"):
+                batch = next(batches, None)
+            if batch is None:
+                break
+
+            # the conversion of values and timestamps is part of building the line protocol
+            with metrics.timer("serialize"):
+                batch_end = batch_start + len(batch)
+                log_format_mask = self._get_log_format_mask(batch)
+                batch = batch.select(log_format_mask)
+                metrics.count("rows.filtered.log_format", batch_end - batch_start - len(batch))
+                if len(batch) and span is not None:
+                    span.add(batch.column("timestamp").min())
+                    span.add(batch.column("timestamp").max())
+                if self._selection is not None:
+                    selected = len(batch)
+                    batch = batch.select(self._get_selection_mask(batch))
+                    metrics.count("rows.filtered.selection", selected - len(batch))
+                duplicates = 0
+                if self._dedup is not None:
+                    new = batch.select(self._get_new_point_mask(batch, directory_name))
+                    duplicates = len(batch) - len(new)
+                    batch = new
+                    if duplicates:
+                        metrics.count("points.duplicate", duplicates)
+                fields = self._get_schema(batch.fieldnames)
+                lines = batch.to_line_protocol("sensor_data", self._get_imeis(batch, directory_name), fields,
+                                               self._get_value_format_mask, self._timestamps)
+            metrics.count("rows.read", batch_end - batch_start)
+            # a block can only be resumed as a whole, so only its last line completes it
+            for line in lines[:-1]:
+                serializer.add_line(line)
+                yield batch_start
+            if lines:
+                serializer.add_line(lines[-1])
+                yield batch_end
+            elif duplicates:
+                yield batch_end
+            batch_start = batch_end
+
+    def _get_new_point_mask(self, batch, directory_name: str):
+        """
+        :returns a boolean mask of the rows of the ColumnBatch whose points are not in the dedup index
+        """
+        imeis = self._get_imeis(batch, directory_name)
+        if isinstance(imeis, str):
+            imeis = [imeis] * len(batch)
+        else:
+            imeis = imeis.tolist()
+        mask = batch.full_mask(True)
+        for row, (imei, nanoseconds) in enumerate(zip(imeis, batch.utc_timestamps(self._timestamps).tolist())):
+            if self._dedup.contains(imei, nanoseconds):
+                mask[row] = False
+        return mask
+
+    def _get_selection_mask(self, batch):
+        """
+        :returns a boolean mask of the rows of the ColumnBatch whose raw timestamp is within the selection
+        """
+        timestamps = batch.column("timestamp")
+        mask = batch.full_mask(True)
+        if self._selection.start is not None:
+            mask &= timestamps >= self._selection.start
+        if self._selection.end is not None:
+            mask &= timestamps < self._selection.end
+        return mask
 
     def _get_fields_with_correct_data_type(self, row: dict) -> dict:
-        return dict((key, self._get_value(key, value)) for key, value in row.items() if
+        converters = self._converters
+        return dict((key, (converters.get(key) or get_converter(key))(value)) for key, value in row.items() if
                     self._filter_for_correct_value_format(value))
 
     @staticmethod
     def _get_value(key: str, value: str):
-        try:
-            # parse boolean values to python upper case spelling with str.title()
-            parsed_value = ast.literal_eval(value.title())
-
-            # some code version entries are in a float format, int is expected
-            if key == "code_version":
-                parsed_value = int(parsed_value)
-
-            return parsed_value
-        except (ValueError, SyntaxError):
-            return value
+        return get_converter(key)(value)
 
     @abstractmethod
     def _get_imei(self, row: dict) -> str:
@@ -87,13 +345,80 @@ class CSVParser(object):
     def _get_reader(self, csv_file: TextIOWrapper, directory_name: str) -> DictReader:
         pass
 
+    @abstractmethod
+    def _get_mapped_reader(self, mapped, directory_name: str) -> MappedDictReader:
+        """
+        :param mapped: memory mapped log file without quoted fields
+        :returns a reader that yields the same rows as the one of _get_reader
+        """
+        pass
+
+    @abstractmethod
+    def _get_fieldnames(self, reader: Iterator[List[str]]) -> List[str]:
+        pass
+
+    @abstractmethod
+    def _get_imeis(self, batch, directory_name: str):
+        """
+        :returns a single imei or an array with one imei per row
+        """
+        pass
+
+    @abstractmethod
+    def _get_log_format_mask(self, batch):
+        """
+        :param batch: ColumnBatch of log rows
+        :returns a boolean mask of rows with sensor data of this log format
+        """
+        pass
+
+    @abstractmethod
+    def _get_value_format_mask(self, batch, column: str):
+        """
+        :returns a boolean mask of usable values of the given column
+        """
+        pass
+
 
 class V1Parser(CSVParser):
+    FIELDNAMES = ["timestamp",
+                  "class",
+                  "latitude",
+                  "longitude",
+                  "network_latitude",
+                  "network_longitude",
+                  "acceleration_x",
+                  "acceleration_y",
+                  "acceleration_z",
+                  "magnetic_field_x",
+                  "magnetic_field_y",
+                  "magnetic_field_z",
+                  "gyroscope_x",
+                  "gyroscope_y",
+                  "gyroscope_z",
+                  "atmospheric_pressure",
+                  "light_level",
+                  "gravitational_acceleration",
+                  "linear_acceleration_x",
+                  "linear_acceleration_y",
+                  "linear_acceleration_z",
+                  "step_count",
+                  "battery_temperature",
+                  "ambient_temperature",
+                  "voltage",
+                  "charging_current",
+                  "significant_motion",
+                  "proximity_sensor",
+                  "phone_ip",
+                  "phone_battery_state"]
+    DROPPED_FIELDS = ["class", "step_count", "significant_motion", "phone_ip"]
+
     def _filter_for_correct_value_format(self, value: str) -> bool:
         if value and value.lower() != "null" and value.lower() != "nan":
             return True
         else:
             logger.debug(__("Value {value} denied", value=value))
+            metrics.count("values.filtered")
             return False
 
     def _get_imei(self, row: dict) -> str:
@@ -101,37 +426,20 @@ class V1Parser(CSVParser):
 
     def _get_reader(self, csv_file: TextIOWrapper, directory_name: str) -> DictReader:
         self.imei = directory_name
-        return DictReader(csv_file, fieldnames=["timestamp",
-                                                "class",
-                                                "latitude",
-                                                "longitude",
-                                                "network_latitude",
-                                                "network_longitude",
-                                                "acceleration_x",
-                                                "acceleration_y",
-                                                "acceleration_z",
-                                                "magnetic_field_x",
-                                                "magnetic_field_y",
-                                                "magnetic_field_z",
-                                                "gyroscope_x",
-                                                "gyroscope_y",
-                                                "gyroscope_z",
-                                                "atmospheric_pressure",
-                                                "light_level",
-                                                "gravitational_acceleration",
-                                                "linear_acceleration_x",
-                                                "linear_acceleration_y",
-                                                "linear_acceleration_z",
-                                                "step_count",
-                                                "battery_temperature",
-                                                "ambient_temperature",
-                                                "voltage",
-                                                "charging_current",
-                                                "significant_motion",
-                                                "proximity_sensor",
-                                                "phone_ip",
-                                                "phone_battery_state"],
-                          restkey="surplus")
+        return DictReader(csv_file, fieldnames=self.FIELDNAMES, restkey="surplus")
+
+    def _get_mapped_reader(self, mapped, directory_name: str) -> MappedDictReader:
+        self.imei = directory_name
+        reader = MappedDictReader(mapped, self.FIELDNAMES, "surplus")
+        reader.prefilter = self._prefilter
+        return reader
+
+    def _prefilter(self, line: bytes) -> bool:
+        # rows with surplus columns are rejected whatever their latitude is
+        if line.count(b",") >= len(self.FIELDNAMES):
+            metrics.count("rows.filtered.v1_log_message")
+            return False
+        return True
 
     def _filter_for_correct_log_format(self, row: dict) -> bool:
         logger.debug(__("Check row length: {row}", row=row))
@@ -141,76 +449,116 @@ class V1Parser(CSVParser):
 
         # the latitude string value must be unequal to the parsed value or 'NaN',
         # if latitude contains a sensible float value
-        if (row["latitude"].lower() == "nan" or row["latitude"] != CSVParser._get_value("latitude", row["latitude"]))  \
+        # short log message rows have no latitude at all
+        if row["latitude"] is not None \
+                and (row["latitude"].lower() == "nan"
+                     or row["latitude"] != CSVParser._get_value("latitude", row["latitude"])) \
                 and not ("surplus" in row.keys() and row["surplus"]):
-            row.pop("class")
-            row.pop("step_count")
-            row.pop("significant_motion")
-            row.pop("phone_ip")
+            for field in self.DROPPED_FIELDS:
+                row.pop(field)
             return True
         else:
             logger.debug(__("Row has {column_count} columns instead of 30", column_count=len(row)))
+            metrics.count("rows.filtered.v1_log_message")
             return False
 
+    def _get_fieldnames(self, reader: Iterator[List[str]]) -> List[str]:
+        return self.FIELDNAMES
+
+    def _get_imeis(self, batch, directory_name: str):
+        return directory_name
+
+    def _get_log_format_mask(self, batch):
+        latitude = batch.column("latitude")
+        return ((batch.lower("latitude") == "nan") | batch.typed("latitude").differs_from(latitude)) & ~batch.surplus
+
+    def _get_value_format_mask(self, batch, column: str):
+        lower_values = batch.lower(column)
+        return (lower_values != "") & (lower_values != "null") & (lower_values != "nan")
+
 
 class V2Parser(V1Parser):
+    FIELDNAMES = ["timestamp",
+                  "class",
+                  "code_version",
+                  "latitude",
+                  "longitude",
+                  "network_latitude",
+                  "network_longitude",
+                  "acceleration_x",
+                  "acceleration_y",
+                  "acceleration_z",
+                  "magnetic_field_x",
+                  "magnetic_field_y",
+                  "magnetic_field_z",
+                  "gyroscope_x",
+                  "gyroscope_y",
+                  "gyroscope_z",
+                  "atmospheric_pressure",
+                  "light_level",
+                  "gravitational_acceleration",
+                  "linear_acceleration_x",
+                  "linear_acceleration_y",
+                  "linear_acceleration_z",
+                  "step_count",
+                  "battery_temperature",
+                  "ambient_temperature",
+                  "voltage",
+                  "charging_current",
+                  "significant_motion",
+                  "proximity_sensor",
+                  "phone_ip",
+                  "phone_battery_state",
+                  "discharge_current"]
+
     def _get_reader(self, csv_file: TextIOWrapper, directory_name: str) -> DictReader:
         self.imei = directory_name
-        return DictReader(csv_file, fieldnames=["timestamp",
-                                                "class",
-                                                "code_version",
-                                                "latitude",
-                                                "longitude",
-                                                "network_latitude",
-                                                "network_longitude",
-                                                "acceleration_x",
-                                                "acceleration_y",
-                                                "acceleration_z",
-                                                "magnetic_field_x",
-                                                "magnetic_field_y",
-                                                "magnetic_field_z",
-                                                "gyroscope_x",
-                                                "gyroscope_y",
-                                                "gyroscope_z",
-                                                "atmospheric_pressure",
-                                                "light_level",
-                                                "gravitational_acceleration",
-                                                "linear_acceleration_x",
-                                                "linear_acceleration_y",
-                                                "linear_acceleration_z",
-                                                "step_count",
-                                                "battery_temperature",
-                                                "ambient_temperature",
-                                                "voltage",
-                                                "charging_current",
-                                                "significant_motion",
-                                                "proximity_sensor",
-                                                "phone_ip",
-                                                "phone_battery_state",
-                                                "discharge_current"])
+        return DictReader(csv_file, fieldnames=self.FIELDNAMES)
+
+    def _get_mapped_reader(self, mapped, directory_name: str) -> MappedDictReader:
+        self.imei = directory_name
+        reader = MappedDictReader(mapped, self.FIELDNAMES)
+        reader.prefilter = self._prefilter
+        return reader
+
+    def _prefilter(self, line: bytes) -> bool:
+        fields = line.split(b",", 3)
+        code_version = plain_int(fields[2]) if len(fields) > 2 else None
+        if code_version is not None and code_version >= NEW_IMPORT_FORMAT_CODE_VERSION:
+            metrics.count("rows.filtered.v2_new_code_version")
+            return False
+        # everything else is decided by the filter on the decoded row
+        return True
 
     def _filter_for_correct_log_format(self, row: dict) -> bool:
         try:
             logger.debug(__("Check code version filter for row: {row}", row=row))
             # old log files contain rows with written log messages instead of sensor data,
             # so there might be an unparsable string in the 'code_version' field
-            if ast.literal_eval(row["code_version"]) < NEW_IMPORT_FORMAT_CODE_VERSION:
-                row.pop("class")
-                row.pop("step_count")
-                row.pop("significant_motion")
-                row.pop("phone_ip")
+            if numeric_literal(row["code_version"]) < NEW_IMPORT_FORMAT_CODE_VERSION:
+                for field in self.DROPPED_FIELDS:
+                    row.pop(field)
                 return True
             else:
                 logger.debug(__("Code version is {version}", version=row["code_version"]))
+                metrics.count("rows.filtered.v2_new_code_version")
                 return False
         except (ValueError, SyntaxError):
             logger.debug(__("'code_version' field could not be parsed. Value: {value}", value=row["code_version"]))
+            metrics.count("rows.filtered.v2_log_message")
             return False
 
+    def _get_log_format_mask(self, batch):
+        # unparsable code versions are NaN and fail the comparison
+        return batch.numeric("code_version") < NEW_IMPORT_FORMAT_CODE_VERSION
+
 
 class V3Parser(CSVParser):
     def _filter_for_correct_value_format(self, value: str) -> bool:
-        return bool(value)
+        if value:
+            return True
+        metrics.count("values.filtered")
+        return False
 
     def _get_imei(self, row: dict) -> str:
         return row.pop("IMEI")
@@ -218,6 +566,202 @@ class V3Parser(CSVParser):
     def _get_reader(self, csv_file: TextIOWrapper, directory_name: str) -> DictReader:
         return DictReader(csv_file)
 
+    def _get_mapped_reader(self, mapped, directory_name: str) -> MappedDictReader:
+        reader = MappedDictReader(mapped)
+        if "code_version" in reader.fieldnames:
+            self._code_version_index = reader.fieldnames.index("code_version")
+            reader.prefilter = self._prefilter
+        return reader
+
+    def _prefilter(self, line: bytes) -> bool:
+        fields = line.split(b",", self._code_version_index + 1)
+        if len(fields) > self._code_version_index:
+            code_version = plain_int(fields[self._code_version_index])
+            if code_version is not None and code_version < NEW_IMPORT_FORMAT_CODE_VERSION:
+                metrics.count("rows.filtered.v3_old_code_version")
+                return False
+        return True
+
     def _filter_for_correct_log_format(self, row: dict) -> bool:
         # old logs don't have a header, so there will be no 'code_version' field
-        return "code_version" in row.keys() and ast.literal_eval(row["code_version"]) >= NEW_IMPORT_FORMAT_CODE_VERSION
+        if "code_version" not in row.keys():
+            metrics.count("rows.filtered.v3_no_header")
+            return False
+        try:
+            if numeric_literal(row["code_version"]) < NEW_IMPORT_FORMAT_CODE_VERSION:
+                metrics.count("rows.filtered.v3_old_code_version")
+                return False
+        except (ValueError, SyntaxError):
+            # short rows, e.g. written log messages, have no code version
+            logger.debug(__("'code_version' field could not be parsed. Value: {value}", value=row["code_version"]))
+            metrics.count("rows.filtered.v3_log_message")
+            return False
+        return True
+
+    def _get_fieldnames(self, reader: Iterator[List[str]]) -> List[str]:
+        return next(reader, [])
+
+    def _get_imeis(self, batch, directory_name: str):
+        return batch.column("IMEI")
+
+    def _get_log_format_mask(self, batch):
+        if "code_version" not in batch.fieldnames:
+            return batch.full_mask(False)
+        return batch.numeric("code_version") >= NEW_IMPORT_FORMAT_CODE_VERSION
+
+    def _get_value_format_mask(self, batch, column: str):
+        return batch.column(column) != ""
+
+
+# format versions of log rows without header by their column count
+_HEADERLESS_VERSIONS = {len(V1Parser.FIELDNAMES): 1, len(V2Parser.FIELDNAMES): 2}
+
+
+def get_row_version(row: List[str], version: Optional[int]) -> Optional[int]:
+    """
+    :param version: format version of the preceding row
+    :returns the format version of the row, 3 for header rows and all rows after them
+    """
+    if version == 3 or "timestamp" in row:
+        return 3
+    # rows of an unexpected length, e.g. written log messages, belong to the format around them
+    return _HEADERLESS_VERSIONS.get(len(row), version)
+
+
+def sniff_versions(file_path: str, sniff_size: int = SNIFF_SIZE) -> Set[Optional[int]]:
+    """
+    :returns the format versions of the complete rows at the start and the end of the log file.
+             None if rows at the end do not match a headerless format, they might follow a header further up
+    """
+    with open(file_path, "rb") as log_file:
+        head = log_file.read(sniff_size)
+        tail = b""
+        size = os.fstat(log_file.fileno()).st_size
+        if size > sniff_size:
+            head = head[:head.rfind(b"\n") + 1]
+            log_file.seek(max(len(head), size - sniff_size))
+            tail = log_file.read()
+            tail = tail[tail.find(b"\n") + 1:]
+
+    versions = set()
+    for sample in (head, tail):
+        version = None
+        for row in csv_reader(StringIO(sample.decode(errors="replace"))):
+            if row:
+                version = get_row_version(row, version)
+                versions.add(version)
+        if sample is head:
+            # rows at the start of the file without a known format before them are log messages
+            versions.discard(None)
+            # all rows after a header are in the new format
+            if 3 in versions:
+                break
+    return versions
+
+
+class AutoParser(CSVParser):
+    """
+    Detects the format of each log file. Files in a single format are read by the parser of that format,
+    files with several formats are split up row by row and each row is filtered and converted by the parser
+    of its format, so that every file is read exactly once.
+    Mixed files are always read row-wise from the text file, also in the columnar mode.
+    """
+
+    def __init__(self, columnar: bool = False, chunk_points: int = 5000, chunk_bytes: int = 0, mmap_size: int = 0,
+                 selection: ImportSelection = None, aggregation: Aggregation = None, dedup: DedupIndex = None):
+        super().__init__(False, chunk_points, chunk_bytes, selection=selection, aggregation=aggregation,
+                         dedup=dedup)
+        self._parsers = {}  # type: Dict[int, CSVParser]
+        for version, parser in ((1, V1Parser), (2, V2Parser), (3, V3Parser)):
+            self._parsers[version] = parser(columnar, chunk_points, chunk_bytes, mmap_size, selection, aggregation,
+                                            dedup)
+
+    def read_chunks(self, directory: Directory, file_name: File, offset: int = 0, span: TimeSpan = None,
+                    archive: ArchiveWriter = None, pieces: List[WindowPiece] = None) -> Iterator[Chunk]:
+        parser = self._get_parser(directory, file_name)
+        if parser is not None:
+            return parser.read_chunks(directory, file_name, offset, span, archive, pieces)
+        return super().read_chunks(directory, file_name, offset, span, archive, pieces)
+
+    def write_archive(self, directory: Directory, file_name: File, archive: ArchiveWriter, span: TimeSpan = None):
+        parser = self._get_parser(directory, file_name)
+        if parser is not None:
+            parser.write_archive(directory, file_name, archive, span)
+        else:
+            super().write_archive(directory, file_name, archive, span)
+
+    def _get_parser(self, directory: Directory, file_name: File) -> Optional[CSVParser]:
+        """
+        :returns the parser of the file's format, None if it has several or if the file is a columnar archive
+        """
+        path = os.path.join(directory.abs_path, file_name)
+        if is_archive(path):
+            return None
+        versions = sniff_versions(path)
+        logger.debug(__("Detected format versions {versions} of file {file}", versions=versions, file=file_name))
+        if len(versions) == 1 and None not in versions:
+            return self._parsers[versions.pop()]
+        return None
+
+    def _get_reader(self, csv_file: TextIOWrapper, directory_name: str):
+        self._parsers[1].imei = directory_name
+        self._parsers[2].imei = directory_name
+        return csv_reader(csv_file)
+
+    def _parse_rows(self, reader, offset: int = 0, span: TimeSpan = None) -> Iterator[Tuple[int, str, str, dict]]:
+        """
+        :param reader: csv reader of a log file with several formats
+        :param offset: number of rows to skip, header rows included
+        """
+        selection = self._selection
+        for parser in (self._parsers[1], self._parsers[2]):
+            parser._converters = compile_converters(tuple(parser.FIELDNAMES))
+        version = None
+        fieldnames = []
+        row_number = 0
+        try:
+            # empty rows are skipped like by DictReader
+            for row_number, row in enumerate(filter(None, reader), 1):
+                if "timestamp" in row:
+                    version = 3
+                    fieldnames = row
+                    self._parsers[3]._converters = compile_converters(tuple(fieldnames))
+                    continue
+                version = get_row_version(row, version)
+                if row_number <= offset:
+                    continue
+                if version is None:
+                    metrics.count("rows.filtered.unknown_format")
+                    continue
+
+                parser = self._parsers[version]
+                if version == 1:
+                    row = _to_dict(parser.FIELDNAMES, row, "surplus")
+                elif version == 2:
+                    row = _to_dict(parser.FIELDNAMES, row)
+                else:
+                    row = _to_dict(fieldnames, row)
+                if parser._filter_for_correct_log_format(row):
+                    imei = parser._get_imei(row)
+                    timestamp = row.pop("timestamp")
+                    if span is not None:
+                        span.add(timestamp)
+                    if selection is None or selection.contains_timestamp(timestamp):
+                        yield row_number, imei, timestamp, parser._get_fields_with_correct_data_type(row)
+                    else:
+                        metrics.count("rows.filtered.selection")
+        finally:
+            metrics.count("rows.read", max(row_number - offset, 0))
+
+
+def _to_dict(fieldnames: List[str], row: List[str], restkey: str = None) -> dict:
+    """
+    :returns the row as DictReader returns it
+    """
+    row_dict = dict(zip(fieldnames, row))
+    if len(row) > len(fieldnames):
+        row_dict[restkey] = row[len(fieldnames):]
+    else:
+        for key in fieldnames[len(row):]:
+            row_dict[key] = None
+    return row_dict
@@ -1,6 +1,8 @@
 import pytz
 from datetime import datetime
 
+EPOCH = datetime(1970, 1, 1, tzinfo=pytz.utc)
+
 
 class DateTime(object):
     def __init__(self, date_time: datetime):
@@ -21,3 +23,8 @@ class DateTime(object):
     @property
     def utc_time(self) -> datetime:
         return self.__local_date_time.astimezone(pytz.utc)
+
+    @property
+    def epoch_nanoseconds(self) -> int:
+        delta = self.__local_date_time - EPOCH
+        return ((delta.days * 86400 + delta.seconds) * 10 ** 6 + delta.microseconds) * 1000
@@ -0,0 +1,214 @@
+import fcntl
+import heapq
+import logging
+import mmap
+import os
+import re
+import threading
+from array import array
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional
+from urllib.parse import quote, unquote
+
+# noinspection PyPep8Naming
+from iss4e.util import BraceMessage as __
+
+logger = logging.getLogger("iss4e.webike.db")
+
+# the series key of a raw sensor data point in line protocol and its escaped imei tag
+_SERIES = re.compile(rb"sensor_data,imei=((?:[^\\ ]|\\.)*) ")
+_ESCAPED = re.compile(rb"\\(.)")
+# file in the index folder that compact() locks exclusively and the other processes share
+_LOCK_FILE = "index.lock"
+
+
+def _unescape(match) -> bytes:
+    character = match.group(1)
+    return b"\n" if character == b"n" else character
+
+
+class _Timestamps(object):
+    """
+    Sorted, memory mapped file of the unique int64 nanoseconds of the written points of one imei
+    """
+
+    def __init__(self, path: str):
+        self.sorted = array("q")
+        self._mapped = None
+        if os.path.isfile(path) and os.path.getsize(path):
+            with open(path, "rb") as base_file:
+                self._mapped = mmap.mmap(base_file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.sorted = memoryview(self._mapped).cast("q")
+        self.first = self.sorted[0] if len(self.sorted) else None
+        self.last = self.sorted[-1] if len(self.sorted) else None
+
+    def __contains__(self, nanoseconds: int) -> bool:
+        # most points of new data are after all written ones
+        if self.first is None or nanoseconds < self.first or nanoseconds > self.last:
+            return False
+        index = bisect_left(self.sorted, nanoseconds)
+        return self.sorted[index] == nanoseconds
+
+    def close(self):
+        if self._mapped is not None:
+            self.sorted.release()
+            self._mapped.close()
+            self._mapped = None
+            self.sorted = array("q")
+
+
+class DedupIndex(object):
+    """
+    Local index of the timestamps of the sensor data points that have been written for each imei, so that
+    re-imported or overlapping logs only send points the database does not have yet. Each imei has a sorted file
+    of unique int64 timestamps that is searched in place and a log that the timestamps of each acknowledged write
+    are appended to. Lookups are exact, there are no false positives. The logs are merged into the sorted files by
+    compact(), points written since are not found before that. Parser processes get a copy without the loaded
+    files, which they map on first use. Several processes can use the index at once: compact() holds an exclusive
+    lock on the lock file of the folder, appending to the logs and loading the sorted files a shared one.
+    """
+
+    def __init__(self, directory: str):
+        """
+        :param directory: folder of the index files, created if it does not exist
+        """
+        os.makedirs(directory, exist_ok=True)
+        self._directory = directory
+        self._lock = threading.Lock()
+        self._timestamps = {}  # type: Dict[str, _Timestamps]
+        self._logs = {}
+
+    def __getstate__(self) -> dict:
+        return {"directory": self._directory}
+
+    def __setstate__(self, state: dict):
+        self.__init__(state["directory"])
+
+    def contains(self, imei: str, nanoseconds: int) -> bool:
+        """
+        :returns True if a point of the imei with this timestamp has been written
+        """
+        timestamps = self._timestamps.get(imei)
+        if timestamps is None:
+            timestamps = self._load(imei)
+        return nanoseconds in timestamps
+
+    def add(self, imei: str, nanoseconds: Iterable[int]):
+        """
+        records timestamps of written points of the imei
+        """
+        written = array("q", nanoseconds)
+        with self._locked(fcntl.LOCK_SH), self._lock:
+            log_file = self._get_log(imei)
+            written.tofile(log_file)
+            # losing the end of the log only means that some points are written again
+            log_file.flush()
+
+    def add_line_protocol(self, data: bytes):
+        """
+        records the raw sensor data points of a written chunk, other measurements are ignored
+        """
+        written = {}  # type: Dict[str, List[int]]
+        for line in data.splitlines():
+            match = _SERIES.match(line)
+            if match is not None:
+                tag = match.group(1)
+                if b"\\" in tag:
+                    tag = _ESCAPED.sub(_unescape, tag)
+                written.setdefault(tag.decode(), []).append(int(line[line.rindex(b" ") + 1:]))
+        for imei, nanoseconds in written.items():
+            self.add(imei, nanoseconds)
+
+    def compact(self):
+        """
+        merges the logs of written timestamps into the sorted files, other processes wait until it is done
+        """
+        with self._locked(fcntl.LOCK_EX), self._lock:
+            self._close_files()
+            for name in os.listdir(self._directory):
+                if name.endswith(".log"):
+                    self._compact(unquote(name[:-len(".log")]))
+
+    def close(self):
+        with self._lock:
+            self._close_files()
+
+    def _close_files(self):
+        for log_file in self._logs.values():
+            log_file.close()
+        self._logs.clear()
+        for timestamps in self._timestamps.values():
+            timestamps.close()
+        self._timestamps.clear()
+
+    @contextmanager
+    def _locked(self, operation: int):
+        """
+        :param operation: fcntl.LOCK_SH or fcntl.LOCK_EX
+        """
+        with open(os.path.join(self._directory, _LOCK_FILE), "ab") as lock_file:
+            fcntl.flock(lock_file.fileno(), operation)
+            yield
+
+    def _get_log(self, imei: str):
+        """
+        :returns the open log of the imei, opened again if another process compacted and removed it
+        """
+        path = self._path(imei, ".log")
+        log_file = self._logs.get(imei)
+        if log_file is not None:
+            try:
+                removed = os.stat(path).st_ino != os.fstat(log_file.fileno()).st_ino
+            except FileNotFoundError:
+                removed = True
+            if not removed:
+                return log_file
+            log_file.close()
+        log_file = self._logs[imei] = open(path, "ab")
+        return log_file
+
+    def _load(self, imei: str) -> _Timestamps:
+        with self._locked(fcntl.LOCK_SH), self._lock:
+            if imei not in self._timestamps:
+                self._timestamps[imei] = _Timestamps(self._path(imei, ".ts"))
+            return self._timestamps[imei]
+
+    def _compact(self, imei: str):
+        written = array("q")
+        with open(self._path(imei, ".log"), "rb") as log_file:
+            content = log_file.read()
+        # a crash can leave an incomplete timestamp at the end
+        written.frombytes(content[:len(content) - len(content) % written.itemsize])
+        timestamps = _Timestamps(self._path(imei, ".ts"))
+        merged = array("q")
+        try:
+            previous = None
+            for nanoseconds in heapq.merge(timestamps.sorted, sorted(written)):
+                if nanoseconds != previous:
+                    merged.append(nanoseconds)
+                    previous = nanoseconds
+        finally:
+            timestamps.close()
+        temporary_path = self._path(imei, ".ts.tmp")
+        with open(temporary_path, "wb") as base_file:
+            merged.tofile(base_file)
+            base_file.flush()
+            os.fsync(base_file.fileno())
+        os.replace(temporary_path, self._path(imei, ".ts"))
+        # a crash before the log is removed only merges its timestamps again
+        os.remove(self._path(imei, ".log"))
+        logger.debug(__("Compacted the dedup index of {imei} to {count} timestamps", imei=imei, count=len(merged)))
+
+    def _path(self, imei: str, extension: str) -> str:
+        # imeis of the IMEI column of format 3 logs are not necessarily valid file names
+        return os.path.join(self._directory, quote(imei, safe="") + extension)
+
+
+def open_dedup_index(directory: Optional[str]) -> Optional[DedupIndex]:
+    """
+    :param directory: folder of the index, None or empty if no index is used
+    """
+    if not directory:
+        return None
+    return DedupIndex(os.path.expanduser(directory))
@@ -0,0 +1,81 @@
+#!/usr/bin/python3.5
+
+"""Sends the chunks that import_data.py --spool stored to the database
+
+Chunks the database refuses, e.g. because of a field type conflict, are moved into the dead letters of the spool
+instead of being retried.
+
+Usage:
+  drain_spool.py [--follow] [--rate=POINTS] [--requeue] [-d | --debug]
+
+Options:
+  -h --help      Show this screen.
+  --follow       Keeps polling for new chunks instead of stopping once the spool is empty
+  --rate=POINTS  Maximum number of points per second, overrides webike.spool.rate (0 = unlimited)
+  --requeue      Sends the dead letters again, e.g. once the database accepts them
+  -d --debug     Logs messages at DEBUG level
+
+"""
+import logging
+
+import iss4e.db.influxdb as influxdb
+from docopt import docopt
+from influxdb.exceptions import InfluxDBClientError
+# noinspection PyPep8Naming
+from iss4e.util import BraceMessage as __
+from iss4e.util.config import load_config
+
+from iss4e.webike.db import module_locator
+from iss4e.webike.db.metrics import metrics
+from iss4e.webike.db.spool import PermanentWriteError, drain, is_permanent, open_spool
+
+
+def drain_spool():
+    spool = open_spool(config["webike.spool.directory"], config["webike.spool.segment_size"])
+    rate = float(arguments["--rate"] or config["webike.spool.rate"])
+    logger.info(__("Start draining the spool at {rate} points/s", rate=rate or "unlimited"))
+    try:
+        if arguments["--requeue"]:
+            logger.info(__("Requeued {count} dead letters", count=spool.requeue_dead_letters()))
+        with influxdb.connect(**config["webike.influx"]) as client:
+            def write(data: bytes):
+                try:
+                    client.request(url="write", method="POST", params={"db": config["webike.influx.database"]},
+                                   data=data, expected_response_code=204)
+                except InfluxDBClientError as error:
+                    if error.code is not None and is_permanent(error.code):
+                        raise PermanentWriteError(error) from error
+                    raise
+
+            sent = drain(spool, write, rate, arguments["--follow"], config["webike.spool.poll_interval"],
+                         config["webike.upload.backoff"])
+        dead_letters = spool.dead_letters()
+        if dead_letters:
+            logger.warning(__("{count} chunks with {points} points are in the dead letters", count=len(dead_letters),
+                              points=sum(points for _, points, _ in dead_letters)))
+    finally:
+        spool.close()
+        logger.info(__("Drain metrics\n{summary}", summary=metrics.summary()))
+    logger.info(__("Sent {count} spooled chunks", count=sent))
+
+
+logger = logging.getLogger("iss4e.webike.db.spool")
+
+# set up by main()
+arguments = None  # type: dict
+config = None
+
+
+def main():
+    global arguments, config
+    arguments = docopt(__doc__)
+
+    config = load_config(module_locator.module_path())
+    if arguments["--debug"]:
+        logger.setLevel(logging.DEBUG)
+
+    drain_spool()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,23 @@
+import json
 import os
-from logging import Logger
-from typing import Iterator
 import re
+from concurrent.futures import ThreadPoolExecutor
+from logging import Logger
+from typing import Dict, Iterable, Iterator, List
 
-from iss4e.webike.db.classes import Directory, File
+from iss4e.webike.db.classes import Directory, File, LogFile
 
 # noinspection PyPep8Naming
 from iss4e.util import BraceMessage as __
 
 
 class FileSystemAccess(object):
-    def __init__(self, logger: Logger):
+    def __init__(self, logger: Logger, listing_cache_path: str = None):
+        """
+        :param listing_cache_path: json file that caches the log files of each directory until the directory changes
+        """
         self._logger = logger
+        self._listing_cache_path = listing_cache_path
 
     def get_directories(self, directory_regex_pattern) -> Iterator[Directory]:
         """
@@ -19,24 +25,80 @@ class FileSystemAccess(object):
         """
         self._logger.info("Start collecting log file directories")
 
-        home, dirs, _ = next(os.walk(os.path.expanduser("~")))
-        for directory in dirs:
-            if re.fullmatch(directory_regex_pattern, directory):
-                yield Directory(directory, os.path.join(home, directory))
+        directory_regex = re.compile(directory_regex_pattern)
+        home = os.path.expanduser("~")
+        for entry in os.scandir(home):
+            if entry.is_dir() and directory_regex.fullmatch(entry.name):
+                yield Directory(entry.name, entry.path)
 
         return ()
 
     def get_files_in_directory(self, file_regex_pattern: str, directory: Directory) -> Iterator[File]:
-        self._logger.debug(__("Collect logs in directory {directory}", directory=directory.name))
-        _, _, files = next(os.walk(directory.abs_path))
-        for file in files:
-            if self._filter_correct_files(file, file_regex_pattern):
-                yield file
+        for log_file in self.get_log_files(file_regex_pattern, directory):
+            yield log_file.name
 
         return ()
 
-    def _filter_correct_files(self, file: str, regex: str) -> bool:
-        if re.fullmatch(regex, file):
-            self._logger.debug(__("Collect log file {log}", log=file))
-            return True
-        return False
+    def get_log_files(self, file_regex_pattern: str, directory: Directory) -> List[LogFile]:
+        """
+        :returns the log files of the directory with size and modification time
+        """
+        self._logger.debug(__("Collect logs in directory {directory}", directory=directory.name))
+        file_regex = re.compile(file_regex_pattern)
+        log_files = []
+        for entry in os.scandir(directory.abs_path):
+            if entry.is_file() and file_regex.fullmatch(entry.name):
+                # the stat result is cached by the directory entry
+                stat = entry.stat()
+                log_files.append(LogFile(entry.name, stat.st_size, stat.st_mtime_ns))
+        self._logger.debug(__("Collected {count} log files in directory {directory}", count=len(log_files),
+                              directory=directory.name))
+        return log_files
+
+    def scan(self, file_regex_pattern: str, directories: Iterable[Directory], workers: int = 8) \
+            -> Dict[Directory, List[LogFile]]:
+        """
+        Lists the log files of all directories in parallel
+        :returns the log files by directory
+        """
+        directories = list(directories)
+        cache = self._load_listing_cache()
+        listings = {}
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for directory, (mtime, log_files) in zip(directories, executor.map(
+                    lambda directory: self._list_directory(file_regex_pattern, directory, cache), directories)):
+                listings[directory] = log_files
+                cache[directory.abs_path] = {"mtime": mtime, "pattern": file_regex_pattern,
+                                             "files": [list(log_file) for log_file in log_files]}
+        self._save_listing_cache(cache)
+        return listings
+
+    def _list_directory(self, file_regex_pattern: str, directory: Directory, cache: dict):
+        """
+        :returns the modification time of the directory and its log files, from the cache if it is unchanged
+        """
+        mtime = os.stat(directory.abs_path).st_mtime_ns
+        cached = cache.get(directory.abs_path)
+        # renaming, adding or removing files changes the directory's modification time, appending to them does not,
+        # so cached file sizes can be outdated
+        if cached is not None and cached["mtime"] == mtime and cached["pattern"] == file_regex_pattern:
+            return mtime, [LogFile(*log_file) for log_file in cached["files"]]
+        return mtime, self.get_log_files(file_regex_pattern, directory)
+
+    def _load_listing_cache(self) -> dict:
+        if self._listing_cache_path is None or not os.path.isfile(self._listing_cache_path):
+            return {}
+        try:
+            with open(self._listing_cache_path) as cache_file:
+                return json.load(cache_file)
+        except ValueError:
+            self._logger.warning(__("Ignore corrupt listing cache {path}", path=self._listing_cache_path))
+            return {}
+
+    def _save_listing_cache(self, cache: dict):
+        if self._listing_cache_path is None:
+            return
+        temporary_path = self._listing_cache_path + ".tmp"
+        with open(temporary_path, "w") as cache_file:
+            json.dump(cache, cache_file)
+        os.replace(temporary_path, self._listing_cache_path)
@@ -3,41 +3,79 @@
 """Imports all sensor data log files in the imei folders into the influxdb database
 
 Usage:
-  import_data.py [FILE] [--version=VERSION_NUMBER] [-s | --strict] [-a | --archive] [-d | --debug]
+  import_data.py [FILE] [--version=VERSION_NUMBER] [-s | --strict] [-a | --archive] [-c | --columnar] [-d | --debug]
+                 [--workers=WORKERS] [--upload-workers=UPLOAD_WORKERS] [--async-upload] [--profile=DIRECTORY]
+                 [--imei=IMEI...] [--start=TIME] [--end=TIME] [--spool]
+                 [--no-dedup]
 
 Optional Arguments:
   FILE                      Imports a single file
 
 Options:
   -h --help                 Show this screen.
-  --version=VERSION_NUMBER  Imports data log files using a parser for the specified format version [default: 3]
+  --version=VERSION_NUMBER  Imports data log files using a parser for the specified format version (1, 2 or 3).
+                            Detects the format of each file if set to auto [default: auto]. Log files are moved
+                            into the archives as they are if a version is set
   -s --strict               Moves logs that could not be imported into a problem folder.
                             Files stay in place if this is not set
   -d --debug                Logs messages at DEBUG level
   -a --archive              Move all log files from the main folders into the archives
+  -c --columnar             Parses log files block-wise into NumPy columns and uploads them as line protocol.
+                            Requires numpy. Not used if webike.aggregate.windows is set or for log files that
+                            are converted into columnar archives while they are imported
+  --workers=WORKERS         Number of parsing processes, overrides webike.workers.parse (0 = CPU count)
+  --upload-workers=UPLOAD_WORKERS
+                            Number of upload threads, overrides webike.workers.upload
+  --async-upload            Uploads with asyncio over a shared connection pool, configured in webike.upload.
+                            Requires aiohttp
+  --profile=DIRECTORY       Writes cProfile statistics of each parsing process and upload thread into DIRECTORY
+  --imei=IMEI               Only imports the log files in the folder of this imei, can be repeated
+  --start=TIME              Only imports rows logged at or after this local time, e.g. 2016-03-01 or
+                            "2016-03-01 12:30". Log files in the archive folders are read as well and no file
+                            is moved or marked as imported
+  --end=TIME                Only imports rows logged before this local time, like --start
+  --spool                   Appends the parsed chunks to the spool in webike.spool.directory instead of writing
+                            them to the database. drain_spool.py sends them to the database
+  --no-dedup                Writes all points, also those the dedup index in webike.dedup.directory has as
+                            written, e.g. after the database was restored from an older backup. The index
+                            still records the written points
 
 """
-from concurrent.futures import ProcessPoolExecutor, wait
-from multiprocessing.managers import SyncManager
+import threading
+from concurrent.futures import as_completed
+from contextlib import ExitStack
 
-import iss4e.db.influxdb as influxdb
 from docopt import docopt
 # noinspection PyPep8Naming
-from iss4e.util import BraceMessage as __, progress, async_progress
+from iss4e.util import BraceMessage as __, progress
 from iss4e.util.config import load_config
-from multiprocessing import Queue
 
 from iss4e.webike.db import module_locator
+from iss4e.webike.db.aggregation import Aggregation, Downsampler, WindowPiece
+from iss4e.webike.db.archive import is_archive, read_span, store_archive
 from iss4e.webike.db.csv_parser import *
+from iss4e.webike.db.dedup import DedupIndex, open_dedup_index
 from iss4e.webike.db.file_system_access import FileSystemAccess
+from iss4e.webike.db.line_protocol import LineProtocolSerializer
+from iss4e.webike.db.manifest import ImportManifest
+from iss4e.webike.db.metrics import metrics
+from iss4e.webike.db.scheduler import ImportScheduler, ParsedLog, archive_in_worker, collect_work, convert_log, \
+    create_process_pool
+from iss4e.webike.db.selection import ImportSelection, TimeSpan
+from iss4e.webike.db.spool import Spool, open_spool
 
 
 def import_data():
     logger.info("Start log file import")
 
-    parsers = [V1Parser, V2Parser, V3Parser]
     logger.info(__("Using parser version {version}", version=arguments["--version"]))
-    csv_parser = parsers[int(arguments["--version"]) - 1]
+    csv_parser = PARSERS[arguments["--version"]]
+    if config["webike.archive_format"] == "columnar" and not _is_columnar_archive():
+        logger.warning("Log files are archived as they are, the columnar archive format needs --version=auto")
+    if dedup is not None:
+        # the parsers only find the points that are merged into the sorted files of the index
+        with metrics.timer("dedup"):
+            dedup.compact()
 
     if arguments["FILE"] is not None:
         file_path = arguments["FILE"]
@@ -50,41 +88,202 @@ def import_data():
 
         logger.debug(__("directory: {dir}, file:{file}", dir=directory, file=file))
 
-        _execute_import(csv_parser(), directory, file=file)
+        _execute_import(_create_parser(csv_parser), directory, file=file)
     else:
+        listing_cache = config["webike.listing_cache"]
+        file_system_access = FileSystemAccess(logger, os.path.expanduser(listing_cache) if listing_cache else None)
+        directories = [directory for directory in file_system_access.get_directories(config["webike.imei_regex"])
+                       if selection.contains_imei(directory.name)]
+        # a partial import reads the archived files in place instead of having them moved back by a reset
+        subfolders = [config["webike.archive"]] if _is_partial() else []
+        with metrics.timer("scan"):
+            work = collect_work(file_system_access, directories, config["webike.logfile_regex"], subfolders)
+        logger.info(__("Found {count} log files", count=len(work)))
+        if _is_partial():
+            work = [item for item in work if _overlaps_selection(item)]
+            logger.info(__("{count} log files might have rows in the selected time range", count=len(work)))
+        elif not arguments["--archive"]:
+            work = [item for item in work if not _archive_if_imported(item.directory, item.file)]
+            logger.info(__("{count} log files are new or changed", count=len(work)))
+        if arguments["--archive"]:
+            logger.info("Start archiving all files")
+            _archive_all(work)
+        elif len(work) == 1 and not arguments["--async-upload"]:
+            # a single log file is imported faster in this process than the worker processes start up
+            _import_in_process(_create_parser(csv_parser), work)
+        elif arguments["--async-upload"] and spool is None:
+            # aiohttp is only required for the asynchronous upload
+            from iss4e.webike.db.async_upload import AsyncImportScheduler, AsyncUploader
+
+            uploader = AsyncUploader.from_config(config["webike.influx"], config["webike.upload"])
+            scheduler = AsyncImportScheduler(_create_parser(csv_parser), _get_offset, _upload_log_async, uploader,
+                                             _get_parse_workers(), _get_profile_directory(), _converts_on_import(),
+                                             _get_part_points())
+            for _ in progress(scheduler.run(work), delay=10):
+                _report_throughput()
+        else:
+            scheduler = ImportScheduler(_create_parser(csv_parser), _get_offset, _upload_log, _get_parse_workers(),
+                                        int(arguments["--upload-workers"] or config["webike.workers.upload"]),
+                                        _get_profile_directory(), _converts_on_import(), _get_part_points())
+            with clients:
+                for _ in progress(scheduler.run(work), delay=10):
+                    _report_throughput()
+    if spool is not None:
+        spool.close()
+    if dedup is not None:
+        with metrics.timer("dedup"):
+            dedup.compact()
+        dedup.close()
+    logger.info("Import complete")
+    _report_metrics()
 
-        directories = FileSystemAccess(logger).get_directories(config["webike.imei_regex"])
-        manager = SyncManager()
-        manager.start()
-        queue = manager.Queue()
-        with ProcessPoolExecutor(max_workers=14) as executor:
-            futures = [executor.submit(_execute_import, csv_parser(), directory, queue) for directory in
-                       directories]
 
-            async_progress(futures, queue, delay=10)
-    logger.info("Import complete")
+def _is_partial() -> bool:
+    """
+    :returns True if only the rows of a time range are imported. Files are neither archived nor marked as imported
+             then, because the rest of their rows is not
+    """
+    return selection.is_partial and not arguments["--archive"]
+
+
+def _overlaps_selection(item: WorkItem) -> bool:
+    """
+    :returns False if the rows of the log file are known to be outside of the selected time range
+    """
+    with metrics.timer("manifest"):
+        span = _get_manifest(item.directory).get_span(item.file)
+    path = os.path.join(item.directory.abs_path, item.file)
+    if span is None and is_archive(path):
+        # the footer of a columnar archive has the time span of the archived rows
+        span = read_span(path)
+    if span is None or selection.overlaps(span):
+        return True
+    logger.debug(__("Skip file {file} in directory {dir} with rows from {first} to {last}", file=item.file,
+                    dir=item.directory.name, first=span.first, last=span.last))
+    metrics.count("files.skipped")
+    return False
+
+
+def _get_parse_workers() -> int:
+    return int(arguments["--workers"] or config["webike.workers.parse"])
+
+
+def _get_part_points() -> int:
+    # the windows of the aggregates would be cut at the end of each part
+    return 0 if _get_aggregation() is not None else config["webike.chunk.part_points"]
+
+
+def _get_profile_directory() -> str:
+    profile_directory = arguments["--profile"]
+    if profile_directory is not None:
+        os.makedirs(profile_directory, exist_ok=True)
+    return profile_directory
+
+
+def _report_throughput():
+    report = metrics.throughput(10)
+    if report is not None:
+        logger.info(report)
+
+
+def _report_metrics():
+    """
+    logs the time spent in each stage and the counters, and writes them to the metrics file if one is configured
+    """
+    logger.info(__("Import metrics\n{summary}", summary=metrics.summary()))
+    if config["webike.metrics"]:
+        metrics.write(config["webike.metrics"])
+
+
+def _create_parser(csv_parser: type) -> CSVParser:
+    return csv_parser(arguments["--columnar"], config["webike.chunk.points"], config["webike.chunk.bytes"],
+                      config["webike.mmap_size"], selection, _get_aggregation(),
+                      None if arguments["--no-dedup"] else dedup)
+
+
+def _create_archive_parser() -> CSVParser:
+    # archives hold all rows of a log file, so their parser has no selection
+    return AutoParser(mmap_size=config["webike.mmap_size"])
+
+
+def _is_columnar_archive() -> bool:
+    """
+    :returns True if log files are converted into columnar archives. Not with a forced parser version, whose parser
+             would leave out the rows of log files in other formats
+    """
+    return config["webike.archive_format"] == "columnar" and arguments["--version"] == "auto"
+
+
+def _converts_on_import() -> bool:
+    """
+    :returns True if the parsing workers build the columnar archive of each log file they import
+    """
+    return _is_columnar_archive() and not _is_partial()
+
+
+def _get_aggregation() -> Optional[Aggregation]:
+    """
+    :returns the configured windowed aggregates, None if no window is configured
+    """
+    windows = config["webike.aggregate.windows"]
+    if not windows:
+        return None
+    return Aggregation([int(window) for window in windows], list(config["webike.aggregate.fields"]),
+                       list(config["webike.aggregate.functions"]), bool(config["webike.aggregate.raw"]))
 
 
-def _execute_import(csv_importer: CSVParser, directory: Directory, queue: Queue = None, file: File = None) -> bool:
+def _execute_import(csv_importer: CSVParser, directory: Directory, file: File = None) -> bool:
     file_regex_pattern = config["webike.logfile_regex"]
     if file is None:
         files = FileSystemAccess(logger).get_files_in_directory(file_regex_pattern, directory)
     else:
         files = [file]
-    logs = csv_importer.read_logs(directory, files)
+    if not arguments["--archive"] and not _is_partial():
+        files = [name for name in files if not _archive_if_imported(directory, name)]
+    _import_in_process(csv_importer, [WorkItem(directory, name, 0) for name in files])
+
+    return True
+
+
+def _import_in_process(csv_importer: CSVParser, work: List[WorkItem]):
+    """
+    imports the log files one after another without worker processes
+    """
+    logs = (_read_log(csv_importer, item) for item in work)
     try:
-        _insert_into_db_and_archive_logs(logs, queue)
+        _insert_into_db_and_archive_logs(logs)
     except KeyboardInterrupt:
         raise
     except:
         logger.exception("Unexpected Exception")
 
-    return True
+
+def _read_log(csv_importer: CSVParser, item: WorkItem) -> Tuple[Directory, File, Iterator[Chunk], List[WindowPiece]]:
+    """
+    :returns the directory and name of the log file, an iterator over its chunks and the list its cut aggregation
+             windows are added to
+    """
+    pieces = []
+    return item.directory, item.file, _read_chunks(csv_importer, item, pieces), pieces
 
 
-def _insert_into_db_and_archive_logs(path_and_data: Iterator[Tuple[Directory, File, Data]], queue: Queue = None):
+def _read_chunks(csv_importer: CSVParser, item: WorkItem, pieces: List[WindowPiece]) -> Iterator[Chunk]:
     """
-    :param path_and_data: an iterator over directories, log file names of their data
+    :param pieces: the aggregation windows cut by the start or end of the file's rows are added to it
+    :returns an iterator over the chunks of the log file after its imported rows, the time span of its rows is
+             recorded after the last one
+    """
+    offset = _get_offset(item)
+    span = TimeSpan() if offset == 0 else None
+    yield from csv_importer.read_chunks(item.directory, item.file, offset, span, pieces=pieces)
+    _record_span(item, span)
+
+
+def _insert_into_db_and_archive_logs(path_and_data: Iterator[Tuple[Directory, File, Iterator[Chunk],
+                                                                   List[WindowPiece]]]):
+    """
+    :param path_and_data: an iterator over directories, log file names, lazily read chunks of their data and the
+                          cut aggregation windows, which are complete once the chunks are read
     """
 
     if arguments["--archive"]:
@@ -92,49 +291,380 @@ def _insert_into_db_and_archive_logs(path_and_data: Iterator[Tuple[Directory, Fi
     else:
         logger.info("Start uploading log files")
 
-    with influxdb.connect(**config["webike.influx"]) as client:
-        for directory, filename, data in progress(path_and_data, delay=10, remote=queue.put):
+    with ExitStack() as stack:
+        # archiving and spooling runs do not load the database client at all
+        client = stack.enter_context(_connect()) if spool is None and not arguments["--archive"] else None
+        for directory, filename, chunks, pieces in progress(path_and_data, delay=10):
+            if arguments["--archive"]:
+                _archive_log(directory, filename)
+            else:
+                _import_log(client, directory, filename, chunks, _get_manifest(directory), pieces)
+                _report_throughput()
+
+
+def _archive_if_imported(directory: Directory, filename: File) -> bool:
+    """
+    :returns True if the file has been imported completely before and is unchanged, it is archived right away
+    """
+    if _get_manifest(directory).is_imported(filename):
+        logger.debug(__("File {file} in directory {dir} is already imported", file=filename, dir=directory.name))
+        _archive_log(directory, filename)
+        return True
+    return False
+
+
+def _get_offset(item: WorkItem) -> int:
+    if _is_partial():
+        return 0
+    return _get_manifest(item.directory).get(item.file)
+
+
+def _upload_log(item: WorkItem, parsed: ParsedLog):
+    """
+    :param parsed: the parts of the log file parsed by the workers, parsing errors are handled like upload errors
+    """
+    _import_log(_get_client() if spool is None else None, item.directory, item.file, _parsed_chunks(item, parsed),
+                _get_manifest(item.directory), parsed=parsed)
+
+
+async def _upload_log_async(uploader, item: WorkItem, parsed: ParsedLog):
+    """
+    Writes the chunks of a log file in sequence with an AsyncUploader, while other files are uploaded concurrently
+    """
+    # only asynchronous uploads load asyncio
+    import asyncio
+
+    directory, filename = item.directory, item.file
+    manifest = _get_manifest(directory)
+    # noinspection PyBroadException
+    try:
+        written = False
+        part = parsed.first
+        while part is not None:
+            result = await asyncio.wrap_future(part)
+            part = parsed.next(result)
+            for offset, data in result.chunks:
+                # the last chunk of a file whose points were all written before is empty
+                if data:
+                    with metrics.timer("upload"):
+                        await uploader.write(data)
+                    _count_written(data)
+                    _record_written(data)
+                _commit(manifest, filename, offset)
+                written = True
+        if parsed.last.pieces:
+            # the event loop runs all uploads, so the windows of an imei are merged and written by one at a time
+            async with async_window_locks.setdefault(directory.abs_path, asyncio.Lock()):
+                data = _serialize_cut_windows(directory, filename, parsed.last.pieces)
+                if data:
+                    with metrics.timer("upload"):
+                        await uploader.write(data)
+                    _count_written(data)
+        _record_span(item, parsed.last.span)
+        _finish_import(directory, filename, written, manifest, parsed.last.archive)
+    except Exception:
+        _handle_import_error(directory, filename)
+
+
+def _parsed_chunks(item: WorkItem, parsed: ParsedLog) -> Iterator[Chunk]:
+    for part in parsed.parts():
+        yield from part.chunks
+    _record_span(item, parsed.last.span)
+
+
+def _record_span(item: WorkItem, span: Optional[TimeSpan]):
+    """
+    stores the time span of a log file's rows if it was read from the start, so that selective imports can skip it
+    """
+    if span is not None:
+        with metrics.timer("manifest"):
+            _get_manifest(item.directory).record_span(item.file, span)
+
+
+def _get_manifest(directory: Directory) -> ImportManifest:
+    with lock:
+        if directory.abs_path not in manifests_by_directory:
+            manifests_by_directory[directory.abs_path] = ImportManifest(directory, config["webike.manifest"])
+        return manifests_by_directory[directory.abs_path]
+
+
+def _get_client():
+    """
+    :returns a database client for the current upload thread
+    """
+    if not hasattr(thread_data, "client"):
+        with lock:
+            thread_data.client = clients.enter_context(_connect())
+    return thread_data.client
+
+
+def _connect():
+    """
+    :returns a context manager of a new database client
+    """
+    # the client library takes longer to load than a small import takes, so runs that do not write to the
+    # database do not load it
+    import iss4e.db.influxdb as influxdb
+    return influxdb.connect(**config["webike.influx"])
+
+
+def _import_log(client, directory: Directory, filename: File, chunks: Iterator[Chunk],
+                manifest: ImportManifest, pieces: List[WindowPiece] = None, parsed: ParsedLog = None):
+    """
+    :param pieces: the aggregation windows cut by the start or end of the file's rows, once the chunks are read
+    :param parsed: the parts the chunks are from, if they were parsed by the workers. Its last part has the pieces
+    """
+    # noinspection PyBroadException
+    try:
+        written = _upload_chunks(client, directory, filename, chunks, manifest)
+        pieces = parsed.last.pieces if parsed is not None else pieces
+        if pieces:
+            # the files of an imei are uploaded in parallel, its windows are merged and written by one upload at a
+            # time, so that the last write of a window has all of its pieces
+            with _get_window_lock(directory):
+                _write(client, _serialize_cut_windows(directory, filename, pieces))
+        _finish_import(directory, filename, written, manifest, parsed.last.archive if parsed is not None else None)
+    # try to import as many logs as possible, so just log any unexpected exceptions and keep going
+    except KeyboardInterrupt:
+        logger.error(__("Interrupted by user at file {filename} in {directory}", filename=filename,
+                        directory=directory.name))
+        raise
+    except Exception:
+        _handle_import_error(directory, filename)
+
+
+def _finish_import(directory: Directory, filename: File, written: bool, manifest: ImportManifest,
+                   archive: bytes = None):
+    """
+    :param written: True if data of the file has been written in this run
+    :param archive: columnar archive of the file if a parsing worker built one
+    """
+    if _is_partial():
+        logger.debug(__("Read selected rows of file {file} in directory {dir}", file=filename, dir=directory.name))
+        return
+    if written or manifest.get(filename):
+        _archive_log(directory, filename, archive)
+        manifest.complete(filename)
+    else:
+        logger.info(__("No sensor data read from file {file} in directory {dir}", file=filename, dir=directory.name))
+        if arguments["--strict"]:
+            _move_to_problem_folder(directory, filename)
+
+
+def _handle_import_error(directory: Directory, filename: File):
+    logger.exception(__("Error with file {filename} in {directory}:", filename=filename, directory=directory.name))
+    # files of a partial import might be archived already
+    if not _is_partial():
+        _move_to_problem_folder(directory, filename)
+
+
+def _upload_chunks(client, directory: Directory, filename: File, chunks: Iterator[Chunk],
+                   manifest: ImportManifest) -> bool:
+    """
+    Writes the chunks of a log file in sequence and commits the row offset after each acknowledged write
+    :returns True if any data has been written
+    """
+    logger.debug(__("Upload file {file}", file=filename))
+    written = False
+    for offset, data in chunks:
+        logger.debug(data)
+        # the last chunk of a file whose points were all written before is empty and only completes its offset
+        _write(client, data)
+        _commit(manifest, filename, offset)
+        written = True
+    return written
+
+
+def _write(client, data: bytes):
+    """
+    writes line protocol to the database or appends it to the spool
+    """
+    if data and spool is None:
+        # the chunks are already serialized, so they are posted as they are instead of using client.write
+        with metrics.timer("upload"):
+            client.request(url="write", method="POST", params={"db": config["webike.influx.database"]},
+                           data=data, expected_response_code=204)
+        _count_written(data)
+    elif data:
+        # the spool syncs the chunk to disk, so the offset can be committed before the database has it
+        with metrics.timer("spool"):
+            spool.append(data)
+    _record_written(data)
+
+
+def _serialize_cut_windows(directory: Directory, filename: File, pieces: List[WindowPiece]) -> bytes:
+    """
+    :returns the aggregates of the windows cut by the start or end of the log file's rows, each one merged with its
+             pieces from the other log files of the imei. Selective imports do not store their pieces, which might
+             be cut by the selected time range as well
+    """
+    with metrics.timer("manifest"):
+        merged = _get_manifest(directory).merge_pieces(filename, pieces, store=not _is_partial())
+    serializer = LineProtocolSerializer()
+    Downsampler(_get_aggregation()).write_pieces(merged, serializer)
+    return serializer.flush()
+
+
+def _get_window_lock(directory: Directory) -> threading.Lock:
+    with lock:
+        return window_locks.setdefault(directory.abs_path, threading.Lock())
+
+
+def _commit(manifest: ImportManifest, filename: File, offset: int):
+    """
+    stores the row offset up to which the file is imported, unless only some of its rows are
+    """
+    if not _is_partial():
+        with metrics.timer("manifest"):
+            manifest.commit(filename, offset)
+
+
+def _count_written(data: bytes):
+    metrics.count("requests")
+    # each point is a line
+    metrics.count("points.written", data.count(b"\n"))
+    metrics.count("bytes.sent", len(data))
+
+
+def _record_written(data: bytes):
+    """
+    adds the points of an acknowledged or spooled chunk to the dedup index
+    """
+    if dedup is not None and data:
+        with metrics.timer("dedup"):
+            dedup.add_line_protocol(data)
+
+
+def _archive_all(work: List[WorkItem]):
+    """
+    moves all log files into the archives, in the columnar format they are converted in parallel
+    """
+    if not _is_columnar_archive() or len(work) <= 1:
+        # a single log file is converted faster in this process than the worker processes start up
+        for item in progress(work, delay=10):
+            _archive_log(item.directory, item.file)
+        return
+
+    with create_process_pool(_get_parse_workers(), _create_archive_parser()) as pool:
+        converting = {}
+        for item in work:
+            if is_archive(os.path.join(item.directory.abs_path, item.file)):
+                _archive_log(item.directory, item.file)
+            else:
+                converting[pool.submit(archive_in_worker, item, _archive_path(item.directory, item.file))] = item
+        for converted in progress(as_completed(converting), delay=10):
+            item = converting[converted]
             # noinspection PyBroadException
             try:
-                if arguments["--archive"]:
-                    _archive_log(directory, filename)
-                elif data is not None:
-                    logger.debug(__("Upload file {file}", file=filename))
-                    logger.debug(data)
-                    client.write(data, {"db": config["webike.influx.database"]})
-                    _archive_log(directory, filename)
-                elif arguments["--strict"]:
-                    _move_to_problem_folder(directory, filename)
-            # try to import as many logs as possible, so just log any unexpected exceptions and keep going
-            except KeyboardInterrupt:
-                logger.error(__("Interrupted by user at file {filename} in {directory}", filename=filename,
-                                directory=directory.name))
-                raise
-            except Exception as exception:
-                logger.exception(
-                    __("Error with file {filename} in {directory}:", filename=filename, directory=directory.name))
-                _move_to_problem_folder(directory, filename)
-
-
-def _archive_log(directory: Directory, filename: File):
+                metrics.merge(converted.result())
+            except Exception:
+                _archive_unconverted(item.directory, item.file)
+                continue
+            _remove_archived_log(item.directory, item.file)
+
+
+def _archive_log(directory: Directory, filename: File, archive: bytes = None):
+    """
+    :param archive: columnar archive of the file, which is converted if it is needed and None
+    """
     logger.debug(__("Archive file {file} in directory {dir}", file=filename, dir=directory.name))
+    if not _is_columnar_archive() or is_archive(os.path.join(directory.abs_path, filename)):
+        metrics.count("files.archived")
+        _move_to_subfolder(directory, filename, config["webike.archive"])
+        return
+
+    # noinspection PyBroadException
+    try:
+        if archive is None:
+            convert_log(_create_archive_parser(), WorkItem(directory, filename, 0), _archive_path(directory, filename))
+        else:
+            with metrics.timer("archive"):
+                store_archive(_archive_path(directory, filename), archive)
+    except Exception:
+        _archive_unconverted(directory, filename)
+        return
+    _remove_archived_log(directory, filename)
+
+
+def _archive_unconverted(directory: Directory, filename: File):
+    """
+    moves a log file that could not be converted into the archive as it is, imports read both formats
+    """
+    logger.exception(__("Error converting file {file} in {dir}, it is archived as it is:", file=filename,
+                        dir=directory.name))
+    metrics.count("files.archived")
+    metrics.count("files.unconverted")
     _move_to_subfolder(directory, filename, config["webike.archive"])
 
 
+def _archive_path(directory: Directory, filename: File) -> str:
+    return os.path.join(directory.abs_path, config["webike.archive"], filename)
+
+
+def _remove_archived_log(directory: Directory, filename: File):
+    """
+    removes a log file whose columnar archive is stored
+    """
+    path = os.path.join(directory.abs_path, filename)
+    archive_path = _archive_path(directory, filename)
+    stat = os.stat(path)
+    metrics.count("files.archived")
+    metrics.count("bytes.archived.log", stat.st_size)
+    metrics.count("bytes.archived.columnar", os.path.getsize(archive_path))
+    with metrics.timer("archive"):
+        # like a moved log file, the archive keeps the modification time that resets select files by
+        os.utime(archive_path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        os.remove(path)
+
+
 def _move_to_problem_folder(directory: Directory, filename: File):
     logger.warning(__("Move file {file} into problem folder in directory {dir}", file=filename, dir=directory.name))
+    metrics.count("files.problem")
     _move_to_subfolder(directory, filename, config["webike.problem"])
 
 
 def _move_to_subfolder(directory: Directory, filename: str, subfolder: str):
-    os.rename(os.path.join(directory.abs_path, filename), os.path.join(directory.abs_path, subfolder, filename))
+    with metrics.timer("archive"):
+        os.rename(os.path.join(directory.abs_path, filename), os.path.join(directory.abs_path, subfolder, filename))
 
 
-arguments = docopt(__doc__)
+PARSERS = {"1": V1Parser, "2": V2Parser, "3": V3Parser, "auto": AutoParser}
 
-config = load_config(module_locator.module_path())
 logger = logging.getLogger("iss4e.webike.db")
-if arguments["--debug"]:
-    logger.setLevel(logging.DEBUG)
 
-import_data()
+# set up by main(), worker processes only get the parser and its options
+arguments = None  # type: dict
+selection = None  # type: ImportSelection
+config = None
+spool = None  # type: Spool
+dedup = None  # type: DedupIndex
+
+# state shared by the upload threads
+lock = threading.Lock()
+thread_data = threading.local()
+clients = ExitStack()
+manifests_by_directory = {}
+# the windows of an imei are merged and written by one upload at a time
+window_locks = {}
+async_window_locks = {}
+
+
+def main():
+    global arguments, selection, config, spool, dedup
+    arguments = docopt(__doc__)
+
+    selection = ImportSelection(arguments["--imei"], arguments["--start"], arguments["--end"])
+
+    config = load_config(module_locator.module_path())
+    if arguments["--debug"]:
+        logger.setLevel(logging.DEBUG)
+
+    spool = open_spool(config["webike.spool.directory"], config["webike.spool.segment_size"]) \
+        if arguments["--spool"] else None
+    dedup = open_dedup_index(config["webike.dedup.directory"])
+
+    import_data()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+import math
+from typing import Dict
+
+
+def escape_measurement(value: str) -> str:
+    return value.replace("\\", "\\\\").replace(",", "\\,").replace(" ", "\\ ").replace("\n", "\\n")
+
+
+def escape_tag(value: str) -> str:
+    return value.replace("\\", "\\\\").replace(",", "\\,").replace("=", "\\=").replace(" ", "\\ ") \
+        .replace("\n", "\\n")
+
+
+def escape_string(value: str) -> str:
+    # a newline would end the point, the influxdb client escapes it in names and tags as well
+    return '"' + value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+
+
+def encode_value(value) -> str:
+    """
+    :returns the line protocol representation of a parsed python value or None if it cannot be written
+    """
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, int):
+        return str(value) + "i"
+    if isinstance(value, float):
+        return repr(value) if math.isfinite(value) else None
+    if value is None:
+        return None
+    return escape_string(str(value))
+
+
+class LineProtocolSerializer(object):
+    """
+    Writes points as InfluxDB line protocol into a reusable buffer
+    """
+
+    def __init__(self, measurement: str = "sensor_data"):
+        self._measurement = escape_measurement(measurement)
+        self._buffer = bytearray()
+        self._prefixes = {}  # type: Dict[str, bytes]
+        self._keys = {}  # type: Dict[str, str]
+        self.points = 0
+
+    def __len__(self):
+        return len(self._buffer)
+
+    def add(self, imei: str, fields: dict, timestamp: int) -> bool:
+        """
+        :param fields: parsed field values by field name
+        :param timestamp: nanoseconds since the epoch
+        :returns False if the point has no field that can be written
+        """
+        encoded_fields = []
+        for key, value in fields.items():
+            encoded = encode_value(value)
+            if encoded is not None:
+                encoded_fields.append(self._key(key) + encoded)
+        if not encoded_fields:
+            return False
+        field_set = ",".join(encoded_fields)
+
+        self._buffer += self._prefix(imei)
+        self._buffer += (field_set + " " + str(timestamp) + "\n").encode()
+        self.points += 1
+        return True
+
+    def add_line(self, line: str):
+        """
+        :param line: a complete line protocol string without newline
+        """
+        self._buffer += (line + "\n").encode()
+        self.points += 1
+
+    def extend(self, other: "LineProtocolSerializer"):
+        """
+        moves the points of another serializer, e.g. one of another measurement, into this one
+        """
+        self._buffer += other._buffer
+        self.points += other.points
+        other.flush()
+
+    def flush(self) -> bytes:
+        """
+        :returns the serialized points and empties the buffer
+        """
+        data = bytes(self._buffer)
+        del self._buffer[:]
+        self.points = 0
+        return data
+
+    def _prefix(self, imei: str) -> bytes:
+        prefix = self._prefixes.get(imei)
+        if prefix is None:
+            prefix = (self._measurement + ",imei=" + escape_tag(imei) + " ").encode()
+            self._prefixes[imei] = prefix
+        return prefix
+
+    def _key(self, key: str) -> str:
+        escaped_key = self._keys.get(key)
+        if escaped_key is None:
+            escaped_key = escape_tag(key) + "="
+            self._keys[key] = escaped_key
+        return escaped_key
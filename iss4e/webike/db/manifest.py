@@ -0,0 +1,176 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from iss4e.webike.db.aggregation import WindowPiece, merge_pieces
+from iss4e.webike.db.classes import Directory, File
+from iss4e.webike.db.selection import TimeSpan
+
+# size of the blocks at the start and end of a log file that make up its fingerprint
+FINGERPRINT_BLOCK_SIZE = 64 * 1024
+
+LogState = Tuple[int, int, str]
+
+
+def fingerprint(path: str, size: int) -> str:
+    """
+    :param size: number of leading bytes of the file that are fingerprinted
+    :returns a hash of the size and the first and last block of the first size bytes of the file
+    """
+    content_hash = hashlib.sha1(str(size).encode())
+    with open(path, "rb") as log_file:
+        content_hash.update(log_file.read(min(size, FINGERPRINT_BLOCK_SIZE)))
+        if size > FINGERPRINT_BLOCK_SIZE:
+            tail_start = max(FINGERPRINT_BLOCK_SIZE, size - FINGERPRINT_BLOCK_SIZE)
+            log_file.seek(tail_start)
+            content_hash.update(log_file.read(size - tail_start))
+    return content_hash.hexdigest()
+
+
+class ImportManifest(object):
+    """
+    SQLite index of the log files in a directory with their size, modification time, content fingerprint
+    and the row offset up to which their data is written to the database. The time spans of the rows of the
+    log files are stored separately, they outlive the import state and stay valid while a file is unchanged.
+    So do the pieces of the aggregation windows that are cut by the start or end of the rows of a log file.
+    """
+
+    def __init__(self, directory: Directory, file_name: str):
+        self._directory = directory
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(os.path.join(directory.abs_path, file_name), check_same_thread=False)
+        with self._connection:
+            self._connection.execute("CREATE TABLE IF NOT EXISTS logs (file TEXT PRIMARY KEY, size INTEGER, "
+                                     "mtime INTEGER, fingerprint TEXT, row_offset INTEGER, complete INTEGER)")
+            self._connection.execute("CREATE TABLE IF NOT EXISTS spans (file TEXT PRIMARY KEY, size INTEGER, "
+                                     "mtime INTEGER, fingerprint TEXT, first TEXT, last TEXT)")
+            self._connection.execute("CREATE TABLE IF NOT EXISTS windows (imei TEXT, length INTEGER, "
+                                     "start INTEGER, file TEXT, statistics TEXT, "
+                                     "PRIMARY KEY (imei, length, start, file))")
+        # state of the files in this run, it is stored with their first commit
+        self._current = {}  # type: Dict[File, LogState]
+
+    def is_imported(self, file: File) -> bool:
+        """
+        :returns True if the file is completely imported and has not changed since
+        """
+        return self._compare(file) == "unchanged"
+
+    def get(self, file: File, default: int = 0) -> int:
+        """
+        :returns the row offset to resume the import of the file from
+        """
+        if self._compare(file) in ("unchanged", "appended"):
+            return self._load(file)[4]
+        return default
+
+    def commit(self, file: File, offset: int):
+        size, mtime, content_fingerprint = self._get_current(file)
+        with self._lock, self._connection:
+            self._connection.execute("INSERT OR REPLACE INTO logs VALUES (?, ?, ?, ?, ?, 0)",
+                                     (file, size, mtime, content_fingerprint, offset))
+
+    def complete(self, file: File):
+        with self._lock, self._connection:
+            self._connection.execute("UPDATE logs SET complete = 1 WHERE file = ?", (file,))
+
+    def record_span(self, file: File, span: TimeSpan):
+        """
+        :param file: name of the file, or its path relative to the directory if it is in a subfolder
+        :param span: time span of all sensor data rows of the file
+        """
+        size, mtime, content_fingerprint = self._get_current(file)
+        with self._lock, self._connection:
+            # spans are stored by file name, so they are found again after the file is archived
+            self._connection.execute("INSERT OR REPLACE INTO spans VALUES (?, ?, ?, ?, ?, ?)",
+                                     (os.path.basename(file), size, mtime, content_fingerprint, span.first,
+                                      span.last))
+
+    def get_span(self, file: File) -> Optional[TimeSpan]:
+        """
+        :param file: name of the file, or its path relative to the directory if it is in a subfolder
+        :returns the time span of the file's rows, None if it is unknown or the file has changed since
+        """
+        with self._lock:
+            stored = self._connection.execute("SELECT * FROM spans WHERE file = ?",
+                                              (os.path.basename(file),)).fetchone()
+        if stored is None:
+            return None
+        _, size, mtime, content_fingerprint, first, last = stored
+        current_size, current_mtime, current_fingerprint = self._get_current(file, quick=(size, mtime))
+        if current_size == size and (current_mtime == mtime or current_fingerprint == content_fingerprint):
+            return TimeSpan(first, last)
+        return None
+
+    def merge_pieces(self, file: File, pieces: List[WindowPiece], store: bool = True) -> List[WindowPiece]:
+        """
+        :param file: name of the file, or its path relative to the directory if it is in a subfolder
+        :param pieces: the aggregation windows cut by the start or end of the file's rows
+        :param store: the pieces replace those of an earlier import of the file, they are only merged if False
+        :returns the windows of the pieces, each one merged with its pieces from the other log files
+        """
+        name = os.path.basename(file)
+        merged = []
+        with self._lock, self._connection:
+            if store:
+                self._connection.execute("DELETE FROM windows WHERE file = ?", (name,))
+                self._connection.executemany("INSERT OR REPLACE INTO windows VALUES (?, ?, ?, ?, ?)",
+                                             ((piece.imei, piece.length, piece.start, name,
+                                               json.dumps(piece.statistics)) for piece in pieces))
+            for piece in pieces:
+                others = self._connection.execute("SELECT statistics FROM windows WHERE imei = ? AND length = ? "
+                                                  "AND start = ? AND file != ?",
+                                                  (piece.imei, piece.length, piece.start, name)).fetchall()
+                merged.append(merge_pieces([piece] + [WindowPiece(piece.length, piece.imei, piece.start,
+                                                                  json.loads(statistics))
+                                                      for statistics, in others]))
+        return merged
+
+    def forget(self, files: List[File]):
+        """
+        removes the import state of the files, so that they are imported again
+        """
+        with self._lock, self._connection:
+            self._connection.executemany("DELETE FROM logs WHERE file = ?", ((file,) for file in files))
+        for file in files:
+            self._current.pop(file, None)
+
+    def close(self):
+        self._connection.close()
+
+    def _compare(self, file: File) -> str:
+        """
+        :returns 'unchanged' for completely imported files, 'appended' for files that grew or are partially
+                 imported, 'new' otherwise
+        """
+        stored = self._load(file)
+        if stored is None:
+            return "new"
+        _, size, mtime, content_fingerprint, _, complete = stored
+        current_size, current_mtime, current_fingerprint = self._get_current(file, quick=(size, mtime))
+        if current_size == size and (current_mtime == mtime or current_fingerprint == content_fingerprint):
+            return "unchanged" if complete else "appended"
+        if current_size > size and fingerprint(self._path(file), size) == content_fingerprint:
+            return "appended"
+        return "new"
+
+    def _get_current(self, file: File, quick: Tuple[int, int] = None) -> LogState:
+        """
+        :param quick: size and modification time that make hashing the file unnecessary if they match
+        """
+        if file not in self._current:
+            stat = os.stat(self._path(file))
+            if quick == (stat.st_size, stat.st_mtime_ns):
+                return stat.st_size, stat.st_mtime_ns, None
+            self._current[file] = (stat.st_size, stat.st_mtime_ns, fingerprint(self._path(file), stat.st_size))
+        return self._current[file]
+
+    def _load(self, file: File) -> Optional[tuple]:
+        with self._lock:
+            return self._connection.execute("SELECT * FROM logs WHERE file = ?", (file,)).fetchone()
+
+    def _path(self, file: File) -> str:
+        return os.path.join(self._directory.abs_path, file)
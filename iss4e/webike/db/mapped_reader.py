@@ -0,0 +1,121 @@
+import locale
+import mmap
+import os
+import re
+from contextlib import contextmanager
+from typing import Callable, Iterator, List, Optional
+
+# encoding open() uses for the log files in text mode
+ENCODING = locale.getpreferredencoding(False)
+
+# number of bytes that are split into lines at once
+BLOCK_SIZE = 1024 * 1024
+
+_PLAIN_INT = re.compile(rb"0|[1-9][0-9]*")
+# quoted fields and line breaks other than \n and \r\n
+_CSV_SYNTAX = re.compile(rb'"|\r(?!\n)')
+
+
+@contextmanager
+def map_log(path: str) -> Iterator[Optional[mmap.mmap]]:
+    """
+    :returns the read-only memory mapped log file, None if it is empty or has quoted fields or old Mac line breaks,
+             which only the csv module reads correctly
+    """
+    with open(path, "rb") as log_file:
+        if os.fstat(log_file.fileno()).st_size == 0:
+            yield None
+            return
+
+        mapped = mmap.mmap(log_file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            if _CSV_SYNTAX.search(mapped) is not None:
+                yield None
+            else:
+                # the file is read once from start to end, so its pages can be dropped right after they are read
+                if hasattr(mapped, "madvise"):
+                    mapped.madvise(mmap.MADV_SEQUENTIAL)
+                yield mapped
+        finally:
+            mapped.close()
+
+
+def plain_int(field: bytes) -> Optional[int]:
+    """
+    :returns the value of a raw field if it is written as an unsigned integer that numeric_literal parses, else None
+    """
+    if _PLAIN_INT.fullmatch(field):
+        return int(field)
+    return None
+
+
+class MappedDictReader(object):
+    """
+    Reads the rows of a memory mapped log file into dicts like DictReader does for files without quoted fields.
+    Lines are split off megabyte blocks of the mapping and each one is decoded as a whole, without the buffering
+    and csv parsing of a text file. Rows the prefilter rejects by their raw bytes are not decoded at all and yielded
+    as None, so row numbers stay the same.
+    """
+
+    def __init__(self, mapped: mmap.mmap, fieldnames: List[str] = None, restkey: str = None):
+        """
+        :param fieldnames: column names, read from the first line if None
+        """
+        self._mapped = mapped
+        self._position = 0
+        self._restkey = restkey
+        if fieldnames is None:
+            line = self._read_line()
+            fieldnames = line.decode(ENCODING).split(",") if line else []
+        self.fieldnames = fieldnames
+        # returns False for a raw line that the log format filter would reject
+        self.prefilter = None  # type: Callable[[bytes], bool]
+
+    def __iter__(self) -> Iterator[Optional[dict]]:
+        mapped = self._mapped
+        end = len(mapped)
+        position = self._position
+        while position < end:
+            # lines are split off blocks of whole lines, which is faster than looking up each line break
+            block_end = end
+            if position + BLOCK_SIZE < end:
+                block_end = mapped.rfind(b"\n", position, position + BLOCK_SIZE)
+                if block_end == -1:
+                    block_end = mapped.find(b"\n", position + BLOCK_SIZE)
+                    if block_end == -1:
+                        block_end = end
+            block = mapped[position:block_end]
+            position = block_end + 1
+            yield from self._read_rows(block.split(b"\n"))
+
+    def _read_rows(self, lines: List[bytes]) -> Iterator[Optional[dict]]:
+        fieldnames = self.fieldnames
+        column_count = len(fieldnames)
+        restkey = self._restkey
+        prefilter = self.prefilter
+        for line in lines:
+            if line.endswith(b"\r"):
+                line = line[:-1]
+            # DictReader skips empty rows
+            if not line:
+                continue
+            if prefilter is not None and not prefilter(line):
+                yield None
+                continue
+
+            values = line.decode(ENCODING).split(",")
+            row = dict(zip(fieldnames, values))
+            if len(values) > column_count:
+                row[restkey] = values[column_count:]
+            elif len(values) < column_count:
+                for key in fieldnames[len(values):]:
+                    row[key] = None
+            yield row
+
+    def _read_line(self) -> bytes:
+        line_end = self._mapped.find(b"\n", self._position)
+        if line_end == -1:
+            line_end = len(self._mapped)
+        line = self._mapped[self._position:line_end]
+        self._position = line_end + 1
+        return line[:-1] if line.endswith(b"\r") else line
@@ -0,0 +1,137 @@
+import cProfile
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional, Tuple
+
+
+class Metrics(object):
+    """
+    Counters and stage timers of the import, shared by the threads of a process. Worker processes hand their
+    metrics over to the main process with take() and merge(). Stage times of concurrent workers add up.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """
+        discards all metrics, also the ones a forked worker process inherited together with a possibly locked lock
+        """
+        self._lock = threading.Lock()
+        self._counters = {}  # type: Dict[str, int]
+        self._timers = {}  # type: Dict[str, float]
+        self._start = time.perf_counter()
+        self._last_report = (self._start, 0, 0, 0)
+
+    def count(self, name: str, value: int = 1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def add_time(self, stage: str, seconds: float):
+        with self._lock:
+            self._timers[stage] = self._timers.get(stage, 0.0) + seconds
+
+    @contextmanager
+    def timer(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(stage, time.perf_counter() - start)
+
+    def take(self) -> dict:
+        """
+        :returns the counters and timers collected so far and resets them
+        """
+        with self._lock:
+            taken = {"counters": self._counters, "timers": self._timers}
+            self._counters = {}
+            self._timers = {}
+        return taken
+
+    def merge(self, taken: dict):
+        """
+        :param taken: counters and timers taken from the metrics of another process
+        """
+        with self._lock:
+            for name, value in taken["counters"].items():
+                self._counters[name] = self._counters.get(name, 0) + value
+            for stage, seconds in taken["timers"].items():
+                self._timers[stage] = self._timers.get(stage, 0.0) + seconds
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            return {"elapsed": time.perf_counter() - self._start, "counters": dict(self._counters),
+                    "timers": dict(self._timers)}
+
+    def throughput(self, interval: float) -> Optional[str]:
+        """
+        :returns the rates since the last report, None if it is less than interval seconds ago
+        """
+        now = time.perf_counter()
+        with self._lock:
+            last_time, last_rows, last_points, last_bytes = self._last_report
+            if now - last_time < interval:
+                return None
+            rows, points, sent = (self._counters.get(name, 0) for name in ("rows.read", "points.written",
+                                                                            "bytes.sent"))
+            self._last_report = (now, rows, points, sent)
+        seconds = now - last_time
+        return "{rows:.0f} rows/s read, {points:.0f} points/s written, {megabytes:.2f} MB/s sent".format(
+            rows=(rows - last_rows) / seconds, points=(points - last_points) / seconds,
+            megabytes=(sent - last_bytes) / 10 ** 6 / seconds)
+
+    def summary(self) -> str:
+        """
+        :returns a table of the time spent in each stage and of the counters
+        """
+        metrics = self.as_dict()
+        total = sum(metrics["timers"].values()) or 1.0
+        lines = ["{stage:<32} {seconds:>12} {share:>7}".format(stage="stage", seconds="seconds", share="share")]
+        for stage, seconds in sorted(metrics["timers"].items(), key=lambda timer: timer[1], reverse=True):
+            lines.append("{stage:<32} {seconds:12.3f} {share:6.1f}%".format(stage=stage, seconds=seconds,
+                                                                         share=100 * seconds / total))
+        lines.append("")
+        lines.append("{name:<32} {value:>12}".format(name="counter", value="value"))
+        for name, value in sorted(metrics["counters"].items()):
+            lines.append("{name:<32} {value:12d}".format(name=name, value=value))
+        lines.append("")
+        lines.append("{elapsed:.1f}s elapsed".format(elapsed=metrics["elapsed"]))
+        return "\n".join(lines)
+
+    def write(self, path: str):
+        with open(path, "w") as metrics_file:
+            json.dump(self.as_dict(), metrics_file, indent=2, sort_keys=True)
+
+
+# metrics of the current process
+metrics = Metrics()
+
+# profiles by process, thread and role, a forked process starts new ones
+_profiles = {}  # type: Dict[Tuple[int, int, str], cProfile.Profile]
+
+
+@contextmanager
+def profiled(directory: Optional[str], role: str):
+    """
+    Adds the block to the cProfile statistics of the current thread and role, which are written to
+    <role>-<process id>-<thread id>.prof in the directory after each block. Does nothing if directory is None.
+    """
+    if directory is None:
+        yield
+        return
+
+    key = (os.getpid(), threading.get_ident(), role)
+    if key not in _profiles:
+        _profiles[key] = cProfile.Profile()
+    profile = _profiles[key]
+    profile.enable()
+    try:
+        yield
+    finally:
+        profile.disable()
+        profile.dump_stats(os.path.join(directory, "{role}-{pid}-{thread}.prof".format(role=role, pid=key[0],
+                                                                                       thread=key[1])))
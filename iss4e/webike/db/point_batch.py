@@ -0,0 +1,335 @@
+import json
+import math
+import struct
+import sys
+from array import array
+from datetime import timedelta
+from itertools import accumulate
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+from iss4e.webike.db.classes import Data
+from iss4e.webike.db.date_time import EPOCH
+from iss4e.webike.db.value_converter import bool_value, code_version_value, float_value, get_converter, int_value
+
+# array type codes of the columns by the converter of their values, other columns hold python objects
+_TYPECODES = {float_value: "d", int_value: "q", code_version_value: "q", bool_value: "b"}
+_TYPES = {"d": float, "q": int, "b": bool}
+_INT64_RANGE = range(-2 ** 63, 2 ** 63)
+# marks fields without a value, None is a value that literal parsing can return
+_MISSING = object()
+# length of the JSON header of an encoded batch
+_HEADER_LENGTH = struct.Struct(">I")
+# types of the values that literal parsing returns besides the JSON types, encoded as an object with their name
+_CONTAINERS = {"list": list, "tuple": tuple, "set": set, "frozenset": frozenset}
+
+
+class _Column(object):
+    """
+    Values of one field with a validity bitmap. Columns of other types than numbers and booleans store codes of
+    their distinct values. Values of a different type than the column's, e.g. an int in a float column, are kept
+    separately by row so that they come back unchanged.
+    """
+    __slots__ = ("typecode", "values", "valid", "others", "categories", "codes")
+
+    def __init__(self, typecode: Optional[str], length: int = 0):
+        """
+        :param typecode: array type code of the values, None for codes of distinct values
+        :param length: number of rows without a value that precede the first one
+        """
+        self.typecode = typecode
+        self.values = array(typecode or "I", bytes(length * array(typecode or "I").itemsize))
+        self.valid = bytearray((length + 7) // 8)
+        self.others = None  # type: Dict[int, object]
+        self.categories = []  # type: List
+        self.codes = {}  # type: Dict[object, int]
+
+    def append(self, row: int, value=_MISSING):
+        if row % 8 == 0:
+            self.valid.append(0)
+        if value is _MISSING:
+            self.values.append(0)
+            return
+
+        self.valid[row >> 3] |= 1 << (row & 7)
+        if self.typecode is None:
+            code = self._get_code(value)
+            if code is not None:
+                self.values.append(code)
+                return
+        elif type(value) is _TYPES[self.typecode] and (self.typecode != "q" or value in _INT64_RANGE):
+            self.values.append(value)
+            return
+
+        self.values.append(0)
+        if self.others is None:
+            self.others = {}
+        self.others[row] = value
+
+    def _get_code(self, value) -> Optional[int]:
+        """
+        :returns the code of a distinct value, None if the value is not hashable
+        """
+        # the type is part of the key, so that e.g. 1, 1.0 and True get different codes
+        key = (type(value), value)
+        try:
+            code = self.codes.get(key)
+        except TypeError:
+            return None
+        if code is None:
+            code = self.codes[key] = len(self.categories)
+            self.categories.append(value)
+        return code
+
+    def get(self, row: int, default=None):
+        """
+        :returns the value of the row, default if it has none
+        """
+        if not self.valid[row >> 3] & 1 << (row & 7):
+            return default
+        if self.others is not None and row in self.others:
+            return self.others[row]
+        value = self.values[row]
+        if self.typecode is None:
+            return self.categories[value]
+        return bool(value) if self.typecode == "b" else value
+
+    def value_range(self) -> Optional[Tuple[Union[int, float], Union[int, float]]]:
+        """
+        :returns the smallest and the largest finite value of a number column, None if it has none
+        """
+        if self.typecode not in ("d", "q"):
+            return None
+        others = self.others or {}
+        values = [value for row, value in enumerate(self.values) if self.valid[row >> 3] & 1 << (row & 7) and
+                  row not in others and math.isfinite(value)]
+        return (min(values), max(values)) if values else None
+
+    def encode(self) -> Tuple[list, bytes]:
+        """
+        :returns the type code, distinct values and values of other types of the column in JSON values and its
+                 validity bitmap and values in little-endian bytes
+        """
+        others = None if self.others is None else [[row, _to_json(value)] for row, value in self.others.items()]
+        return [self.typecode, [_to_json(value) for value in self.categories], others], \
+            bytes(self.valid) + _pack(self.values)
+
+    @classmethod
+    def decode(cls, header: list, data: memoryview, length: int):
+        """
+        :param header: JSON values returned by encode
+        :param data: bytes returned by encode, followed by any others
+        :param length: number of rows
+        :returns the column and the number of bytes of data it took
+        """
+        typecode, categories, others = header
+        column = cls(typecode)
+        valid_length = (length + 7) // 8
+        column.valid = bytearray(data[:valid_length])
+        column.values = _unpack(typecode or "I", data[valid_length:], length)
+        column.categories = [_from_json(value) for value in categories]
+        if others is not None:
+            column.others = dict((row, _from_json(value)) for row, value in others)
+        return column, valid_length + length * struct.calcsize("<" + (typecode or "I"))
+
+    @property
+    def nbytes(self) -> int:
+        size = len(self.valid) + self.values.itemsize * len(self.values)
+        if self.others:
+            size += sys.getsizeof(self.others)
+        if self.categories:
+            size += sys.getsizeof(self.codes) + sum(sys.getsizeof(value) for value in self.categories)
+        return size
+
+
+class PointBatch(object):
+    """
+    Points of one measurement and imei in columns: the timestamps in an int64 array and each field in a typed
+    array with a validity bitmap. A point takes a few hundred bytes instead of the dicts and objects of the
+    influxdb client's point format, which iterating over the batch still yields.
+    """
+    __slots__ = ("measurement", "imei", "timestamps", "_columns", "_fieldnames", "_field_set")
+
+    def __init__(self, measurement: str, imei: str, fieldnames: Sequence[str] = ()):
+        """
+        :param fieldnames: schema of the points, fields of other names are added as they appear
+        """
+        self.measurement = measurement
+        self.imei = imei
+        self.timestamps = array("q")
+        self._fieldnames = []  # type: List[str]
+        self._field_set = set()
+        self._columns = []  # type: List[_Column]
+        for field in fieldnames:
+            self._add_column(field)
+
+    @property
+    def fieldnames(self) -> List[str]:
+        return list(self._fieldnames)
+
+    def append(self, nanoseconds: int, fields: dict):
+        """
+        :param nanoseconds: time of the point since the epoch
+        :param fields: typed field values, missing fields have no value in this point
+        """
+        row = len(self.timestamps)
+        if not self._field_set.issuperset(fields):
+            for field in fields:
+                if field not in self._field_set:
+                    self._add_column(field)
+        for field, column in zip(self._fieldnames, self._columns):
+            column.append(row, fields.get(field, _MISSING))
+        self.timestamps.append(nanoseconds)
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def __iter__(self) -> Iterator[Data]:
+        """
+        :returns an iterator over the points in the influxdb client's dict format
+        """
+        for imei, nanoseconds, fields in self.points():
+            yield {"measurement": self.measurement,
+                   "tags": {"imei": imei},
+                   "time": EPOCH + timedelta(microseconds=nanoseconds // 1000),
+                   "fields": fields}
+
+    def points(self) -> Iterator[Tuple[str, int, dict]]:
+        """
+        :returns an iterator over the imei, nanoseconds since the epoch and fields of each point
+        """
+        for row, nanoseconds in enumerate(self.timestamps):
+            fields = {}
+            for field, column in zip(self._fieldnames, self._columns):
+                value = column.get(row, _MISSING)
+                if value is not _MISSING:
+                    fields[field] = value
+            yield self.imei, nanoseconds, fields
+
+    def column(self, field: str) -> List:
+        """
+        :returns the values of a field, None for points without one
+        """
+        column = self._columns[self._fieldnames.index(field)]
+        return [column.get(row) for row in range(len(self))]
+
+    def value_ranges(self) -> Dict[str, Tuple[Union[int, float], Union[int, float]]]:
+        """
+        :returns the smallest and the largest finite value of each number field that has one
+        """
+        ranges = {}
+        for field, column in zip(self._fieldnames, self._columns):
+            value_range = column.value_range()
+            if value_range is not None:
+                ranges[field] = value_range
+        return ranges
+
+    def encode(self) -> bytes:
+        """
+        :returns the columns of the batch in a format that does not depend on the python version or platform: a
+                 JSON header with the fields and the values that are not numbers or booleans, followed by the
+                 timestamps as differences to the previous one and the columns in little-endian arrays
+        """
+        timestamps = self.timestamps
+        differences = array("q", timestamps[:1])
+        differences.extend(current - previous for previous, current in zip(timestamps, timestamps[1:]))
+        columns = [column.encode() for column in self._columns]
+        header = json.dumps({"points": len(timestamps), "fields": self._fieldnames,
+                             "columns": [column_header for column_header, _ in columns]}).encode()
+        return b"".join([_HEADER_LENGTH.pack(len(header)), header, _pack(differences)] +
+                        [column_data for _, column_data in columns])
+
+    @classmethod
+    def decode(cls, measurement: str, imei: str, data: bytes):
+        """
+        :param data: columns returned by encode
+        """
+        length, = _HEADER_LENGTH.unpack_from(data)
+        position = _HEADER_LENGTH.size + length
+        header = json.loads(bytes(data[_HEADER_LENGTH.size:position]).decode())
+        points = header["points"]
+        data = memoryview(data)[position:]
+        batch = cls(measurement, imei)
+        batch.timestamps = array("q", accumulate(_unpack("q", data, points)))
+        data = data[points * 8:]
+        batch._fieldnames = list(header["fields"])
+        batch._field_set = set(batch._fieldnames)
+        for column_header in header["columns"]:
+            column, size = _Column.decode(column_header, data, points)
+            batch._columns.append(column)
+            data = data[size:]
+        return batch
+
+    @property
+    def nbytes(self) -> int:
+        """
+        :returns the approximate size of the buffered data in bytes
+        """
+        return self.timestamps.itemsize * len(self.timestamps) + sum(column.nbytes for column in self._columns)
+
+    def _add_column(self, field: str):
+        self._fieldnames.append(field)
+        self._field_set.add(field)
+        self._columns.append(_Column(_TYPECODES.get(get_converter(field)), len(self.timestamps)))
+
+
+def _pack(values: array) -> bytes:
+    """
+    :returns the values in the little-endian format of struct with standard sizes
+    """
+    if values.itemsize != struct.calcsize("<" + values.typecode):
+        return struct.pack("<{count}{code}".format(count=len(values), code=values.typecode), *values)
+    if sys.byteorder == "big":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _unpack(typecode: str, data: memoryview, count: int) -> array:
+    """
+    :param data: values returned by _pack, followed by any other bytes
+    """
+    size = struct.calcsize("<" + typecode)
+    values = array(typecode)
+    if values.itemsize != size:
+        values.extend(struct.unpack_from("<{count}{code}".format(count=count, code=typecode), data))
+        return values
+    values.frombytes(data[:count * size])
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+
+def _to_json(value):
+    """
+    :returns a JSON value for a value that literal parsing returns, types that JSON lacks become an object with the
+             name of the type, which is why dicts become one as well
+    """
+    value_type = type(value)
+    if value is None or value_type in (bool, int, float, str):
+        return value
+    if value_type in (list, tuple, set, frozenset):
+        return {value_type.__name__: [_to_json(item) for item in value]}
+    if value_type is dict:
+        return {"dict": [[_to_json(key), _to_json(item)] for key, item in value.items()]}
+    if value_type is bytes:
+        return {"bytes": value.hex()}
+    if value_type is complex:
+        return {"complex": [value.real, value.imag]}
+    if value is Ellipsis:
+        return {"ellipsis": None}
+    raise ValueError("A value of type {type} cannot be encoded".format(type=value_type.__name__))
+
+
+def _from_json(value):
+    if not isinstance(value, dict):
+        return value
+    (name, encoded), = value.items()
+    if name in _CONTAINERS:
+        return _CONTAINERS[name](_from_json(item) for item in encoded)
+    if name == "dict":
+        return dict((_from_json(key), _from_json(item)) for key, item in encoded)
+    if name == "bytes":
+        return bytes.fromhex(encoded)
+    if name == "complex":
+        return complex(*encoded)
+    return Ellipsis
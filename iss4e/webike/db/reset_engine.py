@@ -0,0 +1,191 @@
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, time, timedelta
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+# noinspection PyPep8Naming
+from iss4e.util import BraceMessage as __
+
+from iss4e.webike.db.classes import Directory, LogFile, Move
+from iss4e.webike.db.file_system_access import FileSystemAccess
+
+logger = logging.getLogger("iss4e.webike.db.reset")
+
+
+class ResetFilter(object):
+    """
+    Selects the log files of a reset by imei, modification date and name
+    """
+
+    def __init__(self, imeis: Iterable[str] = None, start: date = None, end: date = None,
+                 file_regex_pattern: str = None):
+        """
+        :param imeis: imei folders to reset, all if None
+        :param start: first day of the modification time of reset files
+        :param end: last day of the modification time of reset files
+        :param file_regex_pattern: names of reset files, all if None
+        """
+        self.imeis = set(imeis) if imeis else None
+        self._start = _to_nanoseconds(start) if start else None
+        self._end = _to_nanoseconds(end + timedelta(days=1)) if end else None
+        self.file_regex_pattern = file_regex_pattern or "(?s).*"
+
+    def __call__(self, log_file: LogFile) -> bool:
+        return (self._start is None or log_file.mtime >= self._start) and \
+               (self._end is None or log_file.mtime < self._end)
+
+
+def _to_nanoseconds(day: date) -> int:
+    return int(datetime.combine(day, time()).timestamp()) * 10 ** 9
+
+
+def plan_reset(file_system_access: FileSystemAccess, directories: Iterable[Directory], subfolders: List[str],
+               reset_filter: ResetFilter, workers: int = 8) -> List[Move]:
+    """
+    :param subfolders: names of the folders in each imei folder whose files are moved back
+    :returns the moves of all selected files, grouped by imei folder
+    """
+    folders = [(directory, subfolder) for directory in directories for subfolder in subfolders
+               if reset_filter.imeis is None or directory.name in reset_filter.imeis]
+
+    def plan_folder(folder: Tuple[Directory, str]) -> List[Move]:
+        directory, subfolder = folder
+        subfolder_path = os.path.join(directory.abs_path, subfolder)
+        try:
+            log_files = file_system_access.get_log_files(reset_filter.file_regex_pattern,
+                                                         Directory(directory.name, subfolder_path))
+        except FileNotFoundError:
+            logger.info(__("No {subfolder} folder in {dir}", subfolder=subfolder, dir=directory.name))
+            return []
+        return [Move(os.path.join(subfolder_path, log_file.name), os.path.join(directory.abs_path, log_file.name))
+                for log_file in log_files if reset_filter(log_file)]
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return [move for moves in executor.map(plan_folder, folders) for move in moves]
+
+
+class ResetJournal(object):
+    """
+    Append-only file with the planned moves of a reset followed by the indexes of the finished ones,
+    so that an interrupted reset can be resumed or rolled back
+    """
+
+    def __init__(self, path: str):
+        self._path = path
+        self._lock = threading.Lock()
+        self._file = None
+
+    def exists(self) -> bool:
+        return os.path.exists(self._path)
+
+    def start(self, moves: List[Move]):
+        """
+        writes the plan before any file is moved
+        """
+        with open(self._path, "w") as journal_file:
+            for move in moves:
+                journal_file.write(json.dumps(["move", move.source, move.target]) + "\n")
+            journal_file.flush()
+            os.fsync(journal_file.fileno())
+
+    def load(self) -> Tuple[List[Move], Set[int]]:
+        """
+        :returns the planned moves and the indexes of the finished ones
+        """
+        moves = []
+        done = set()
+        with open(self._path) as journal_file:
+            for line in journal_file:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # the last line of an interrupted reset might be incomplete
+                    logger.warning(__("Ignore incomplete journal entry {line}", line=line))
+                    continue
+                if entry[0] == "move":
+                    moves.append(Move(entry[1], entry[2]))
+                else:
+                    done.add(entry[1])
+        return moves, done
+
+    def record(self, index: int):
+        with self._lock:
+            if self._file is None:
+                self._file = open(self._path, "a")
+            self._file.write(json.dumps(["done", index]) + "\n")
+            self._file.flush()
+
+    def remove(self):
+        self.close()
+        os.remove(self._path)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def execute_moves(moves: List[Move], journal: ResetJournal, done: Set[int] = frozenset(), workers: int = 8):
+    """
+    Moves the files of each imei folder in sequence and the folders in parallel, the finished moves are journaled
+    :param done: indexes of moves that are finished already
+    """
+
+    def move_files(indexes: List[int]):
+        for index in indexes:
+            source, target = moves[index]
+            if os.path.lexists(source):
+                os.rename(source, target)
+            elif not os.path.lexists(target):
+                logger.warning(__("File {file} vanished", file=source))
+            journal.record(index)
+
+    _run_by_folder([index for index in range(len(moves)) if index not in done], moves, move_files, workers)
+
+
+def roll_back_moves(moves: List[Move], workers: int = 8):
+    """
+    Moves the moved files back into their subfolders, in reverse order. Besides the journaled moves this includes
+    the ones that were interrupted between the rename and the journal entry, whose target exists and source not
+    """
+
+    def move_back(indexes: List[int]):
+        for index in reversed(indexes):
+            source, target = moves[index]
+            if os.path.lexists(target) and not os.path.lexists(source):
+                os.rename(target, source)
+
+    _run_by_folder(list(range(len(moves))), moves, move_back, workers)
+
+
+def _run_by_folder(indexes: List[int], moves: List[Move], function, workers: int):
+    by_folder = {}  # type: Dict[str, List[int]]
+    for index in indexes:
+        by_folder.setdefault(os.path.dirname(moves[index].target), []).append(index)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # rethrows the first error
+        list(executor.map(function, by_folder.values()))
+
+
+def moved_files_by_folder(moves: List[Move], subfolder: str = None) -> Dict[str, List[str]]:
+    """
+    :param subfolder: only the files moved back from this subfolder of the imei folders, all if None
+    :returns the names of the moved files by imei folder
+    """
+    files = {}  # type: Dict[str, List[str]]
+    for move in moves:
+        if subfolder is None or os.path.basename(os.path.dirname(move.source)) == subfolder:
+            files.setdefault(os.path.dirname(move.target), []).append(os.path.basename(move.target))
+    return files
+
+
+def parse_date(date_string: Optional[str]) -> Optional[date]:
+    """
+    :param date_string: date in the format YYYY-MM-DD
+    """
+    if date_string is None:
+        return None
+    return datetime.strptime(date_string, "%Y-%m-%d").date()
@@ -2,13 +2,29 @@
 
 """Moves all previously processed log files back into the main folder
 
+Columnar archives are moved back as they are, import_data.py reads them without parsing text again. They are
+replaced by the copy of the log file they keep with --restore-logs, e.g. to import them with another parser.
+Files from the archive folder are imported again from the start, files from the problem folder resume from the
+row offset they were imported up to.
+
 Usage:
-  reset_log_files.py [-a | --archive][-p | --problem]
+  reset_log_files.py [-a | --archive] [-p | --problem] [--dry-run] [--imei=IMEI...] [--from=DATE] [--to=DATE]
+                     [--pattern=REGEX] [--workers=WORKERS] [--restore-logs]
+  reset_log_files.py (--resume | --rollback) [--workers=WORKERS] [--restore-logs]
 
 Options:
-  -h --help     Show this screen.
-  -a --archive  Only move back files from the archive folder
-  -p --problem  Only move back files from the problem folder
+  -h --help          Show this screen.
+  -a --archive       Only move back files from the archive folder
+  -p --problem       Only move back files from the problem folder
+  --dry-run          Only print which files would be moved
+  --imei=IMEI        Only move back files of this imei, can be repeated
+  --from=DATE        Only move back files modified on or after this day, e.g. 2016-03-01
+  --to=DATE          Only move back files modified on or before this day
+  --pattern=REGEX    Only move back files whose name matches this regular expression
+  --workers=WORKERS  Number of imei folders processed in parallel [default: 8]
+  --restore-logs     Replace moved back columnar archives with the log files they were converted from
+  --resume           Finishes the moves of an interrupted reset
+  --rollback         Moves the files of an interrupted reset back into their subfolders
 
 """
 
@@ -23,36 +39,106 @@ from iss4e.webike.db import module_locator
 # noinspection PyPep8Naming
 from iss4e.util import BraceMessage as __
 
+from iss4e.webike.db.archive import is_archive, restore_log
+from iss4e.webike.db.classes import Directory, Move
 from iss4e.webike.db.file_system_access import FileSystemAccess
+from iss4e.webike.db.manifest import ImportManifest
+from iss4e.webike.db.reset_engine import *
 
 
 def reset():
+    journal = ResetJournal(os.path.expanduser(config["webike.reset_journal"]))
+    workers = int(arguments["--workers"])
+    if arguments["--resume"] or arguments["--rollback"]:
+        if not journal.exists():
+            logger.error("There is no interrupted reset")
+            return
+        moves, done = journal.load()
+        if arguments["--rollback"]:
+            logger.info(__("Rolling back {count} finished of {total} planned moves", count=len(done), total=len(moves)))
+            roll_back_moves(moves, workers)
+            journal.remove()
+        else:
+            logger.info(__("Resuming {count} of {total} moves", count=len(moves) - len(done), total=len(moves)))
+            _execute(journal, moves, done, workers, arguments["--restore-logs"])
+        return
+
+    if journal.exists():
+        logger.error("An interrupted reset needs to be resumed or rolled back first")
+        return
+
     logger.info(__("Getting all necessary directories"))
     file_system_access = FileSystemAccess(logger)
     directories = file_system_access.get_directories(config["webike.imei_regex"])
     default_behaviour = (not arguments["--archive"] and not arguments["--problem"])
-    for directory in directories:
-        if arguments["--archive"] or default_behaviour:
-            logger.info(__("Moving files from archive folder in {dir} back to main folder.", dir=directory.name))
-            archive = os.path.join(directory.abs_path, config["webike.archive"])
-            _move_to_parent(archive)
-        if arguments["--problem"] or default_behaviour:
-            logger.info(__("Moving files from problem folder in {dir} back to main folder.", dir=directory.name))
-            problem = os.path.join(directory.abs_path, config["webike.problem"])
-            _move_to_parent(problem)
+    subfolders = []
+    if arguments["--archive"] or default_behaviour:
+        subfolders.append(config["webike.archive"])
+    if arguments["--problem"] or default_behaviour:
+        subfolders.append(config["webike.problem"])
+    reset_filter = ResetFilter(arguments["--imei"], parse_date(arguments["--from"]), parse_date(arguments["--to"]),
+                               arguments["--pattern"])
+    moves = plan_reset(file_system_access, directories, subfolders, reset_filter, workers)
+
+    if arguments["--dry-run"]:
+        for folder, files in sorted(moved_files_by_folder(moves).items()):
+            print("{folder}: {count} files".format(folder=folder, count=len(files)))
+            for file in sorted(files):
+                logger.debug(__("Would move {file} back into {folder}", file=file, folder=folder))
+        print("{count} files would be moved, {archives} of them columnar archives".format(
+            count=len(moves), archives=sum(1 for move in moves if is_archive(move.source))))
+        return
+
+    logger.info(__("Moving {count} files back to their main folders", count=len(moves)))
+    journal.start(moves)
+    _execute(journal, moves, set(), workers, arguments["--restore-logs"])
+
+
+def _execute(journal: ResetJournal, moves: List[Move], done: set, workers: int, restore_logs: bool = False):
+    try:
+        execute_moves(moves, journal, done, workers)
+    finally:
+        journal.close()
+    # the imported state of the moved files is dropped only once all of them are back, so a roll back keeps it.
+    # Files from the problem folder keep the row offset they were imported up to and resume from it
+    for folder, files in moved_files_by_folder(moves, config["webike.archive"]).items():
+        manifest = ImportManifest(Directory(os.path.basename(folder), folder), config["webike.manifest"])
+        manifest.forget(files)
+        manifest.close()
+    journal.remove()
+    if restore_logs:
+        _restore_logs(moves)
+    logger.info("Reset complete")
+
+
+def _restore_logs(moves: List[Move]):
+    restored = 0
+    for move in moves:
+        if not is_archive(move.target):
+            continue
+        try:
+            restore_log(move.target)
+            restored += 1
+        except ValueError as e:
+            logger.warning(__("Keeping the archive {file}: {error}", file=move.target, error=e))
+    logger.info(__("Restored {count} log files from their archives", count=restored))
 
 
-def _move_to_parent(directory: str):
-    files = os.listdir(directory)
-    for file in files:
-        full_file_name = os.path.join(directory, file)
-        if os.path.isfile(full_file_name):
-            os.rename(full_file_name, os.path.join(os.path.join(directory, os.path.pardir), file))
+logger = logging.getLogger("iss4e.webike.db.reset")
 
+# set up by main()
+arguments = None  # type: dict
+config = None
 
-arguments = docopt(__doc__)
 
-config = load_config(module_locator.module_path())
-logger = logging.getLogger("iss4e.webike.db.reset")
+def main():
+    global arguments, config
+    arguments = docopt(__doc__)
+
+    config = load_config(module_locator.module_path())
+
+    reset()
+
 
-reset()
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+import os
+import pickle
+import sys
+from concurrent.futures import FIRST_COMPLETED, Executor, Future, ThreadPoolExecutor, wait
+from contextlib import closing
+from io import BytesIO
+from itertools import islice
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from iss4e.webike.db.archive import ArchiveWriter, create_archive, is_archive
+from iss4e.webike.db.classes import Directory, Parsed, WorkItem
+from iss4e.webike.db.csv_parser import CSVParser
+from iss4e.webike.db.file_system_access import FileSystemAccess
+from iss4e.webike.db.metrics import metrics, profiled
+from iss4e.webike.db.selection import TimeSpan
+
+# parser, profile directory and archive flag of the tasks of a worker process, set once by the pool's initializer
+_worker_state = None  # type: Tuple[CSVParser, str, bool]
+
+
+def collect_work(file_system_access: FileSystemAccess, directories: Iterable[Directory],
+                 file_regex_pattern: str, subfolders: Iterable[str] = ()) -> List[WorkItem]:
+    """
+    :param subfolders: folders in each directory whose log files are collected as well, as paths relative to the
+                       directory
+    :returns all log files of the directories, largest first
+    """
+    # the folders to list with their directory and the path of their files relative to it
+    folders = {}  # type: Dict[Directory, Tuple[Directory, str]]
+    for directory in directories:
+        folders[directory] = (directory, "")
+        for subfolder in subfolders:
+            subfolder_path = os.path.join(directory.abs_path, subfolder)
+            if os.path.isdir(subfolder_path):
+                folders[Directory(directory.name, subfolder_path)] = (directory, subfolder)
+    work = [WorkItem(folders[folder][0], os.path.join(folders[folder][1], log_file.name), log_file.size)
+            for folder, log_files in file_system_access.scan(file_regex_pattern, folders).items()
+            for log_file in log_files]
+    # starting with the largest files keeps single big files from becoming stragglers at the end of the import
+    work.sort(key=lambda item: item.size, reverse=True)
+    return work
+
+
+def parse_log(csv_parser: CSVParser, item: WorkItem, offset: int, profile_directory: str = None,
+              archive: bool = False, part_points: int = 0, span: TimeSpan = None) -> Parsed:
+    """
+    Runs in a worker process
+    :param profile_directory: directory of the cProfile statistics of the worker, no profiling if None
+    :param archive: build the columnar archive of log files that are read from the start in a single part
+    :param part_points: the file is parsed in parts, each ends after the chunk that reaches this many points
+                        (0 = the whole file is one part)
+    :param span: time span of the rows before the offset, which is extended by the rows of this part. None if the
+                 file is not read from the start, a new span is used if the offset is 0
+    """
+    metrics.reset()
+    if offset == 0:
+        span = TimeSpan()
+    writer = None
+    chunks = []
+    pieces = []
+    points = 0
+    resume = None
+    with profiled(profile_directory, "parse"):
+        if archive and offset == 0 and not is_archive(os.path.join(item.directory.abs_path, item.file)):
+            archive_file = BytesIO()
+            writer = ArchiveWriter(archive_file)
+        # closing the iterator closes the log file of a part that ends before it
+        with closing(csv_parser.read_chunks(item.directory, item.file, offset, span, writer, pieces)) as reader:
+            for chunk in reader:
+                chunks.append(chunk)
+                # each point is a line
+                points += chunk[1].count(b"\n")
+                if part_points and points >= part_points:
+                    resume = chunk[0]
+                    break
+        if writer is not None and resume is not None:
+            # the archive needs all rows, it is converted when the file is archived instead
+            writer = None
+        elif writer is not None:
+            with metrics.timer("archive"):
+                writer.close(span, os.path.join(item.directory.abs_path, item.file))
+    return Parsed(chunks, metrics.take(), span, archive_file.getvalue() if writer is not None else None, resume,
+                  pieces)
+
+
+def convert_log(csv_parser: CSVParser, item: WorkItem, target: str):
+    """
+    Writes the columnar archive of all rows of a log file and a copy of the log file to the target path
+    """
+    span = TimeSpan()
+    with create_archive(target) as writer:
+        csv_parser.write_archive(item.directory, item.file, writer, span)
+        with metrics.timer("archive"):
+            writer.close(span, os.path.join(item.directory.abs_path, item.file))
+
+
+def create_process_pool(workers: int, csv_parser: CSVParser, profile_directory: str = None,
+                        archive: bool = False) -> Executor:
+    """
+    :param workers: number of processes, the CPU count if 0
+    :param profile_directory: directory of the cProfile statistics of the workers, no profiling if None
+    :param archive: the workers build the columnar archives of the log files they read from the start
+    :returns a pool for parse_in_worker and archive_in_worker tasks, whose workers get the parser and the options
+             once when they start instead of with each task
+    """
+    # multiprocessing is only loaded by runs that start worker processes
+    from concurrent.futures import ProcessPoolExecutor
+
+    # the workers get a copy, so that a worker forked while an upload thread holds the lock of the parser's dedup
+    # index does not inherit it locked
+    state = pickle.dumps((csv_parser, profile_directory, archive))
+    if sys.version_info < (3, 7):
+        # there is no initializer before Python 3.7, the workers are forked once the first task is submitted and
+        # inherit the state of this process instead
+        _initialize_worker(state)
+        return ProcessPoolExecutor(max_workers=workers or None)
+    return ProcessPoolExecutor(max_workers=workers or None, initializer=_initialize_worker, initargs=(state,))
+
+
+def _initialize_worker(state: bytes):
+    global _worker_state
+    _worker_state = pickle.loads(state)
+
+
+def parse_in_worker(item: WorkItem, offset: int, part_points: int = 0, span: TimeSpan = None) -> Parsed:
+    """
+    Runs parse_log with the parser and options of the worker process
+    """
+    csv_parser, profile_directory, archive = _worker_state
+    return parse_log(csv_parser, item, offset, profile_directory, archive, part_points, span)
+
+
+def archive_in_worker(item: WorkItem, target: str) -> dict:
+    """
+    Runs convert_log with the parser of the worker process
+    :returns the metrics taken in the worker
+    """
+    metrics.reset()
+    convert_log(_worker_state[0], item, target)
+    return metrics.take()
+
+
+def _merge_metrics(parsed: Future):
+    if not parsed.cancelled() and parsed.exception() is None:
+        metrics.merge(parsed.result().metrics)
+
+
+class ParsedLog(object):
+    """
+    Futures of the parts of a log file that are parsed in the process pool. The next part is only submitted once
+    the one before is parsed, so that at most two parts of a large file are held in memory
+    """
+
+    def __init__(self, first: Future, parse_next: Callable[[Parsed], Future]):
+        """
+        :param parse_next: submits the part after the given one
+        """
+        self.first = first
+        self._parse_next = parse_next
+        self.last = None  # type: Parsed
+
+    def next(self, parsed: Parsed) -> Optional[Future]:
+        """
+        :returns the future of the part after the given one, None if it is the last part, which is kept as last
+        """
+        if parsed.resume is None:
+            self.last = parsed
+            return None
+        return self._parse_next(parsed)
+
+    def parts(self) -> Iterator[Parsed]:
+        """
+        :returns an iterator over the parsed parts, which raises their parsing errors. Each part is parsed while the
+                 one before is uploaded
+        """
+        future = self.first
+        while future is not None:
+            parsed = future.result()
+            future = self.next(parsed)
+            yield parsed
+
+
+class ImportScheduler(object):
+    """
+    Parses log files in a process pool and hands the parsed chunks to a smaller thread pool for uploading
+    """
+
+    def __init__(self, csv_parser: CSVParser, get_offset: Callable[[WorkItem], int],
+                 upload: Callable[[WorkItem, ParsedLog], None], parse_workers: int = 0, upload_workers: int = 4,
+                 profile_directory: str = None, archive: bool = False, part_points: int = 0):
+        """
+        :param get_offset: returns the number of rows of a log file that are already imported
+        :param upload: uploads a log file given its ParsedLog, handles parsing errors as well
+        :param parse_workers: number of parsing processes, the CPU count if 0
+        :param profile_directory: directory of the cProfile statistics of each worker, no profiling if None
+        :param archive: the workers build the columnar archives of the log files they read from the start
+        :param part_points: log files are parsed in parts of about this many points (0 = whole files). Parsers
+                            with aggregates need whole files, since the parts would cut their windows
+        """
+        self._csv_parser = csv_parser
+        self._get_offset = get_offset
+        self._upload = upload
+        self._parse_workers = parse_workers or os.cpu_count() or 1
+        self._upload_workers = upload_workers
+        self._profile_directory = profile_directory
+        self._archive = archive
+        self._part_points = part_points
+        # parsed files waiting for an upload stay in memory, so only a few are parsed ahead
+        self._max_pending = 2 * self._parse_workers + self._upload_workers
+
+    def run(self, work: Iterable[WorkItem]) -> Iterator[WorkItem]:
+        """
+        :param work: log files in the order they are handed out to the workers
+        :returns an iterator over the log files in the order their import finishes
+        """
+        work = iter(work)
+        parsing = {}
+        uploading = {}
+        with create_process_pool(self._parse_workers, self._csv_parser, self._profile_directory,
+                                 self._archive) as parse_pool, \
+                ThreadPoolExecutor(max_workers=self._upload_workers) as upload_pool:
+            while True:
+                # parsing only runs ahead of the uploads up to the pending limit
+                for item in islice(work, max(self._max_pending - len(parsing) - len(uploading), 0)):
+                    parsed = self._submit_parse(parse_pool, item)
+                    parsing[parsed.first] = item, parsed
+                if not parsing and not uploading:
+                    break
+
+                done, _ = wait(list(parsing) + list(uploading), return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future in parsing:
+                        item, parsed = parsing.pop(future)
+                        uploading[upload_pool.submit(self._run_upload, item, parsed)] = item
+                    else:
+                        item = uploading.pop(future)
+                        # rethrows unexpected errors of the upload
+                        future.result()
+                        yield item
+
+    def _submit_parse(self, parse_pool: Executor, item: WorkItem) -> ParsedLog:
+        first = self._submit_part(parse_pool, item, self._get_offset(item), None)
+        # the next part continues the time span of the rows before it
+        return ParsedLog(first, lambda parsed: self._submit_part(parse_pool, item, parsed.resume, parsed.span))
+
+    def _submit_part(self, parse_pool: Executor, item: WorkItem, offset: int, span: Optional[TimeSpan]) -> Future:
+        parsed = parse_pool.submit(parse_in_worker, item, offset, self._part_points, span)
+        parsed.add_done_callback(_merge_metrics)
+        return parsed
+
+    def _run_upload(self, item: WorkItem, parsed: ParsedLog):
+        with profiled(self._profile_directory, "upload"):
+            self._upload(item, parsed)
@@ -0,0 +1,76 @@
+from datetime import datetime
+from typing import Iterable, Optional
+
+# layouts of the start and end times of a selection, the same as the log timestamps without fractions
+TIME_FORMATS = ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d")
+
+
+class TimeSpan(object):
+    """
+    Earliest and latest raw timestamp of the sensor data rows of a log file, both None if it has none
+    """
+    __slots__ = ("first", "last")
+
+    def __init__(self, first: str = None, last: str = None):
+        self.first = first
+        self.last = last
+
+    def add(self, timestamp: str):
+        if self.first is None or timestamp < self.first:
+            self.first = timestamp
+        if self.last is None or timestamp > self.last:
+            self.last = timestamp
+
+
+class ImportSelection(object):
+    """
+    Imei folders and local time range of a selective import. Times are compared as raw timestamp strings, which
+    sort like the times they stand for in the zero padded '%Y-%m-%d %H:%M:%S.%f' layout of the logs, so rows
+    are selected before their timestamp or any of their values are converted.
+    """
+
+    def __init__(self, imeis: Iterable[str] = None, start: str = None, end: str = None):
+        """
+        :param imeis: imported imei folders, all if None
+        :param start: first local time of the imported rows, e.g. '2016-03-01' or '2016-03-01 12:30:00'
+        :param end: local time before which the imported rows end
+        """
+        self.imeis = frozenset(imeis) if imeis else None
+        self.start = _normalize(start)
+        self.end = _normalize(end)
+
+    @property
+    def is_partial(self) -> bool:
+        """
+        :returns True if the selection might skip rows of the log files it reads
+        """
+        return self.start is not None or self.end is not None
+
+    def contains_imei(self, imei: str) -> bool:
+        return self.imeis is None or imei in self.imeis
+
+    def contains_timestamp(self, timestamp: str) -> bool:
+        return (self.start is None or timestamp >= self.start) and (self.end is None or timestamp < self.end)
+
+    def overlaps(self, span: TimeSpan) -> bool:
+        """
+        :returns True if rows between the first and last timestamp of the span might be selected
+        """
+        if span.first is None:
+            return False
+        return (self.start is None or span.last >= self.start) and (self.end is None or span.first < self.end)
+
+
+def _normalize(time_string: Optional[str]) -> Optional[str]:
+    """
+    :returns the time in the timestamp layout of the logs without fractions, None if time_string is None
+    """
+    if time_string is None:
+        return None
+    for time_format in TIME_FORMATS:
+        try:
+            return datetime.strptime(time_string, time_format).strftime(TIME_FORMATS[0])
+        except ValueError:
+            pass
+    raise ValueError("Time {time} is not in any of the formats {formats}".format(time=time_string,
+                                                                                 formats=TIME_FORMATS))
@@ -0,0 +1,339 @@
+import fcntl
+import logging
+import os
+import sqlite3
+import struct
+import threading
+import time
+import zlib
+from typing import Callable, List, Optional, Tuple
+
+# noinspection PyPep8Naming
+from iss4e.util import BraceMessage as __
+
+from iss4e.webike.db.metrics import metrics
+
+logger = logging.getLogger("iss4e.webike.db.spool")
+
+# zlib level of the spooled line protocol, low levels already shrink it several times at a fraction of the cost
+COMPRESSION_LEVEL = 1
+# length and crc32 of the compressed record that follows
+_FRAME_HEADER = struct.Struct(">II")
+_SEGMENT_NAME = "segment-{number:08d}.spool"
+# seconds between checks whether a drain should stop while it waits
+_STOP_POLL_INTERVAL = 0.1
+
+
+class PermanentWriteError(Exception):
+    """
+    Raised by the write of a drain for records the database refuses, which fail again when they are retried
+    """
+    pass
+
+
+def is_permanent(status: int) -> bool:
+    """
+    :returns True if a write that the database answered with this HTTP status fails again when it is retried
+    """
+    return 400 <= status < 500 and status not in (408, 429)
+
+
+class Spool(object):
+    """
+    Write-ahead store of serialized chunks for a separate drain process that sends them to the database.
+    Records are compressed and appended to segment files, a SQLite index in the same folder holds their position
+    and whether the database acknowledged them. A record is indexed only after it is synced to disk, so the index
+    never points to an incomplete record. Each spool appends to a segment of its own, which it holds a lock on,
+    so that only segments of closed or crashed spools are deleted once all their records are acknowledged.
+    Records the database refuses are moved into a dead letter table of the index with their line protocol, so that
+    they neither block the drain nor get lost with their segment.
+    """
+
+    def __init__(self, directory: str, segment_size: int = 64 * 1024 * 1024):
+        """
+        :param directory: folder of the segments and the index, created if it does not exist
+        :param segment_size: a new segment is started once the current one is larger than this many bytes
+        """
+        os.makedirs(directory, exist_ok=True)
+        self._directory = directory
+        self._segment_size = segment_size
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(os.path.join(directory, "index.sqlite"), timeout=60,
+                                           check_same_thread=False)
+        with self._connection:
+            self._connection.execute("CREATE TABLE IF NOT EXISTS records (id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                                     "segment INTEGER, position INTEGER, length INTEGER, points INTEGER, "
+                                     "acknowledged INTEGER DEFAULT 0)")
+            self._connection.execute("CREATE INDEX IF NOT EXISTS pending ON records (acknowledged, id)")
+            self._connection.execute("CREATE TABLE IF NOT EXISTS dead_letters (id INTEGER PRIMARY KEY, "
+                                     "points INTEGER, error TEXT, data BLOB)")
+        self._segment = None  # type: int
+        self._segment_file = None
+
+    def append(self, data: bytes) -> int:
+        """
+        :param data: line protocol of a chunk
+        :returns the id of the record, once it is synced to disk
+        """
+        compressed = zlib.compress(data, COMPRESSION_LEVEL)
+        with self._lock:
+            if self._segment_file is None or self._segment_file.tell() >= self._segment_size:
+                self._start_segment()
+            position = self._segment_file.tell()
+            self._segment_file.write(_FRAME_HEADER.pack(len(compressed), zlib.crc32(compressed)))
+            self._segment_file.write(compressed)
+            self._segment_file.flush()
+            os.fsync(self._segment_file.fileno())
+            with self._connection:
+                cursor = self._connection.execute(
+                    "INSERT INTO records (segment, position, length, points) VALUES (?, ?, ?, ?)",
+                    (self._segment, position, len(compressed), data.count(b"\n")))
+        metrics.count("spool.records")
+        metrics.count("spool.bytes", _FRAME_HEADER.size + len(compressed))
+        return cursor.lastrowid
+
+    def pending(self, limit: int = 1000) -> List[Tuple[int, int]]:
+        """
+        :returns the ids and point counts of the oldest records that are not acknowledged yet
+        """
+        with self._lock:
+            return self._connection.execute("SELECT id, points FROM records WHERE acknowledged = 0 ORDER BY id "
+                                            "LIMIT ?", (limit,)).fetchall()
+
+    def read(self, record_id: int) -> bytes:
+        """
+        :returns the line protocol of the record
+        """
+        with self._lock:
+            segment, position, length = self._connection.execute(
+                "SELECT segment, position, length FROM records WHERE id = ?", (record_id,)).fetchone()
+        with open(self._segment_path(segment), "rb") as segment_file:
+            segment_file.seek(position)
+            stored_length, crc = _FRAME_HEADER.unpack(segment_file.read(_FRAME_HEADER.size))
+            compressed = segment_file.read(stored_length)
+        if stored_length != length or zlib.crc32(compressed) != crc:
+            raise ValueError("Record {id} in segment {segment} is corrupt".format(id=record_id, segment=segment))
+        return zlib.decompress(compressed)
+
+    def acknowledge(self, record_id: int):
+        with self._lock, self._connection:
+            self._connection.execute("UPDATE records SET acknowledged = 1 WHERE id = ?", (record_id,))
+
+    def reject(self, record_id: int, error: str, data: bytes = None):
+        """
+        moves a record into the dead letters, it is not sent again
+        :param data: line protocol of the record, None if it cannot be read
+        """
+        with self._lock, self._connection:
+            self._connection.execute("INSERT OR REPLACE INTO dead_letters SELECT id, points, ?, ? FROM records "
+                                     "WHERE id = ?", (error, zlib.compress(data, COMPRESSION_LEVEL)
+                                                      if data is not None else None, record_id))
+            self._connection.execute("UPDATE records SET acknowledged = 1 WHERE id = ?", (record_id,))
+        metrics.count("spool.dead_letters")
+
+    def dead_letters(self) -> List[Tuple[int, int, str]]:
+        """
+        :returns the ids, point counts and errors of the rejected records
+        """
+        with self._lock:
+            return self._connection.execute("SELECT id, points, error FROM dead_letters ORDER BY id").fetchall()
+
+    def requeue_dead_letters(self) -> int:
+        """
+        appends the readable dead letters as new records, e.g. once the database accepts them after a schema fix
+        :returns the number of requeued records
+        """
+        with self._lock:
+            letters = self._connection.execute("SELECT id, data FROM dead_letters WHERE data IS NOT NULL "
+                                               "ORDER BY id").fetchall()
+        for record_id, compressed in letters:
+            self.append(zlib.decompress(compressed))
+            with self._lock, self._connection:
+                self._connection.execute("DELETE FROM dead_letters WHERE id = ?", (record_id,))
+        return len(letters)
+
+    def remove_acknowledged_segments(self) -> int:
+        """
+        deletes segments whose records are all acknowledged and that no open spool appends to
+        :returns the number of deleted segments
+        """
+        with self._lock:
+            segments = [segment for segment, in self._connection.execute(
+                "SELECT segment FROM records GROUP BY segment HAVING min(acknowledged) = 1")]
+        removed = 0
+        for segment in segments:
+            if segment != self._segment and self._remove_segment(segment):
+                removed += 1
+        return removed
+
+    def close(self):
+        with self._lock:
+            if self._segment_file is not None:
+                # closing the file releases its lock
+                self._segment_file.close()
+                self._segment_file = None
+        self._connection.close()
+
+    def _start_segment(self):
+        if self._segment_file is not None:
+            self._segment_file.close()
+        with self._connection:
+            row = self._connection.execute("SELECT max(segment) FROM records").fetchone()
+        number = (row[0] or 0) + 1
+        while True:
+            try:
+                # another spool might have started the same segment since
+                segment_file = open(self._segment_path(number), "xb")
+                break
+            except FileExistsError:
+                number += 1
+        fcntl.flock(segment_file.fileno(), fcntl.LOCK_EX)
+        self._segment, self._segment_file = number, segment_file
+        logger.debug(__("Started spool segment {segment}", segment=number))
+
+    def _remove_segment(self, segment: int) -> bool:
+        """
+        :returns True if the segment is deleted, False if a spool still appends to it
+        """
+        path = self._segment_path(segment)
+        try:
+            segment_file = open(path, "rb")
+        except FileNotFoundError:
+            segment_file = None
+        if segment_file is not None:
+            with segment_file:
+                try:
+                    fcntl.flock(segment_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    return False
+                os.remove(path)
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM records WHERE segment = ?", (segment,))
+        logger.debug(__("Removed spool segment {segment}", segment=segment))
+        return True
+
+    def _segment_path(self, segment: int) -> str:
+        return os.path.join(self._directory, _SEGMENT_NAME.format(number=segment))
+
+
+class RateLimiter(object):
+    """
+    Spaces out writes so that they send at most the given number of points per second on average
+    """
+
+    def __init__(self, points_per_second: float):
+        """
+        :param points_per_second: no limit if 0
+        """
+        self._points_per_second = points_per_second
+        self._next = time.monotonic()
+
+    def wait(self, points: int):
+        """
+        blocks until the points can be sent
+        """
+        if not self._points_per_second:
+            return
+        now = time.monotonic()
+        if self._next > now:
+            time.sleep(self._next - now)
+        self._next = max(self._next, now) + points / self._points_per_second
+
+
+def drain(spool: Spool, write: Callable[[bytes], None], rate: float = 0, follow: bool = False,
+          poll_interval: float = 1.0, backoff: float = 0.5, max_backoff: float = 60.0,
+          should_stop: Callable[[], bool] = None) -> int:
+    """
+    Sends the records of the spool to the database in the order they were spooled and acknowledges each one after
+    it is written. Failed writes are retried with an exponential backoff until they succeed, so an outage only
+    delays the drain. Records that are corrupt or that the database refuses with a PermanentWriteError are moved
+    into the dead letters instead. After a crash only the unacknowledged records are sent again.
+    :param write: writes the line protocol of a record to the database, raises an exception if it fails and a
+                  PermanentWriteError if retrying cannot help
+    :param rate: maximum number of points per second, no limit if 0
+    :param follow: keep polling for new records instead of returning once the spool is empty
+    :param should_stop: returns True to end the drain, checked between records and while waiting for a retry
+    :returns the number of sent records
+    """
+    limiter = RateLimiter(rate)
+    sent = 0
+    while not (should_stop is not None and should_stop()):
+        pending = spool.pending()
+        if not pending:
+            spool.remove_acknowledged_segments()
+            if not follow:
+                break
+            _wait(poll_interval, should_stop)
+            continue
+
+        for record_id, points in pending:
+            try:
+                data = spool.read(record_id)
+            except ValueError as error:
+                logger.error(__("Spooled record {id} is moved into the dead letters: {error}", id=record_id,
+                                error=error))
+                spool.reject(record_id, str(error))
+                continue
+            limiter.wait(points)
+            try:
+                if not _write_until_acknowledged(write, data, record_id, backoff, max_backoff, should_stop):
+                    # the record stays pending for the next drain
+                    break
+            except PermanentWriteError as error:
+                logger.error(__("The database refused spooled record {id}, it is moved into the dead letters: "
+                                "{error}", id=record_id, error=error))
+                spool.reject(record_id, str(error), data)
+                continue
+            spool.acknowledge(record_id)
+            metrics.count("requests")
+            metrics.count("points.written", points)
+            metrics.count("bytes.sent", len(data))
+            sent += 1
+            if should_stop is not None and should_stop():
+                break
+        spool.remove_acknowledged_segments()
+    return sent
+
+
+def _write_until_acknowledged(write: Callable[[bytes], None], data: bytes, record_id: int, backoff: float,
+                              max_backoff: float, should_stop: Callable[[], bool] = None) -> bool:
+    """
+    :returns True once the write succeeds, False if the drain should stop before it does
+    """
+    delay = backoff
+    while True:
+        try:
+            with metrics.timer("upload"):
+                write(data)
+            return True
+        except (KeyboardInterrupt, PermanentWriteError):
+            raise
+        except Exception as error:
+            logger.warning(__("Write of spooled record {id} failed, retry in {delay:.1f}s: {error}", id=record_id,
+                              delay=delay, error=error))
+            metrics.count("retries")
+            if _wait(delay, should_stop):
+                return False
+            delay = min(2 * delay, max_backoff)
+
+
+def _wait(seconds: float, should_stop: Callable[[], bool] = None) -> bool:
+    """
+    :returns True if the drain should stop, which ends the wait early
+    """
+    deadline = time.monotonic() + seconds
+    while should_stop is None or not should_stop():
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        time.sleep(min(remaining, _STOP_POLL_INTERVAL) if should_stop is not None else remaining)
+    return True
+
+
+def open_spool(directory: Optional[str], segment_size: int) -> Optional[Spool]:
+    """
+    :param directory: folder of the spool, None or empty if no spool is used
+    """
+    if not directory:
+        return None
+    return Spool(os.path.expanduser(directory), segment_size)
@@ -0,0 +1,62 @@
+import re
+from array import array
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Optional
+
+import pytz
+
+from iss4e.webike.db.date_time import DateTime
+
+_LOG_TIMESTAMP = re.compile(r"([0-9]{4}-[0-9]{2}-[0-9]{2} [0-9]{2}):([0-5][0-9]):([0-5][0-9])\.([0-9]{1,6})")
+
+
+class TimestampConverter(object):
+    """
+    Converts local log timestamps in the '%Y-%m-%d %H:%M:%S.%f' layout to UTC nanoseconds since the epoch.
+    The UTC time of each local hour is computed once, timestamps within the hour only add their minutes,
+    seconds and fractions. Ambiguous and nonexistent hours are resolved like DateTime.from_string.
+    """
+
+    def __init__(self, time_zone_str: str):
+        self._time_zone_str = time_zone_str
+        self._time_zone = pytz.timezone(time_zone_str)
+        # None marks hours with an offset change inside, which are converted per timestamp
+        self._hour_starts = {}  # type: Dict[str, Optional[int]]
+
+    def to_nanoseconds(self, date_time_string: str) -> int:
+        match = _LOG_TIMESTAMP.fullmatch(date_time_string)
+        if match is not None:
+            hour, minute, second, fraction = match.groups()
+            hour_start = self._hour_starts[hour] if hour in self._hour_starts else self._get_hour_start(hour)
+            if hour_start is not None:
+                return hour_start + ((int(minute) * 60 + int(second)) * 10 ** 6 + int(fraction.ljust(6, "0"))) * 1000
+
+        return DateTime.from_string(date_time_string, self._time_zone_str).epoch_nanoseconds
+
+    def column_to_nanoseconds(self, date_time_strings: Iterable[str]) -> array:
+        """
+        :returns an int64 array with the nanoseconds since the epoch of each timestamp
+        """
+        return array("q", map(self.to_nanoseconds, date_time_strings))
+
+    def utc_offset(self, local_hour: datetime) -> Optional[int]:
+        """
+        :param local_hour: naive local time at the start of an hour
+        :returns the UTC offset in nanoseconds during that hour, None if it changes within the hour
+        """
+        hour = local_hour.strftime("%Y-%m-%d %H")
+        hour_start = self._hour_starts[hour] if hour in self._hour_starts else self._get_hour_start(hour)
+        if hour_start is None:
+            return None
+        return DateTime(pytz.utc.localize(local_hour)).epoch_nanoseconds - hour_start
+
+    def _get_hour_start(self, hour: str) -> Optional[int]:
+        local_hour = datetime.strptime(hour, "%Y-%m-%d %H")
+        start = self._time_zone.localize(local_hour)
+        end = self._time_zone.localize(local_hour + timedelta(minutes=59, seconds=59, microseconds=999999))
+        if start.utcoffset() == end.utcoffset():
+            hour_start = DateTime(start).epoch_nanoseconds
+        else:
+            hour_start = None
+        self._hour_starts[hour] = hour_start
+        return hour_start
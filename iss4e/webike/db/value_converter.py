@@ -0,0 +1,121 @@
+import ast
+import re
+from functools import lru_cache
+from typing import Callable, Dict, Iterable
+
+Converter = Callable[[str], object]
+
+# lexical forms that python's literal parser accepts for the corresponding types,
+# so the fast conversion yields exactly what ast.literal_eval would
+_INT_PATTERN = re.compile(r"[-+]?(?:0+|[1-9][0-9]*)")
+_FLOAT_PATTERN = re.compile(r"[-+]?(?:(?:[0-9]+\.[0-9]*|\.[0-9]+)(?:[eE][-+]?[0-9]+)?|[0-9]+[eE][-+]?[0-9]+)")
+_WORD_PATTERN = re.compile(r"[A-Za-z_][A-Za-z_0-9]*")
+_LITERAL_WORDS = {"true": True, "false": False, "none": None}
+
+
+def literal_value(value: str):
+    """
+    Generic conversion of a log value, used for columns of unknown type and as fallback for unexpected formats
+    """
+    try:
+        # parse boolean values to python upper case spelling with str.title()
+        return ast.literal_eval(value.title())
+    except (ValueError, SyntaxError):
+        return value
+
+
+def numeric_literal(value: str):
+    """
+    Strict conversion without case folding, unparsable values raise ValueError or SyntaxError like ast.literal_eval
+    """
+    if not isinstance(value, str):
+        # the missing columns of short rows are None, which ast.literal_eval rejects with a ValueError as well
+        raise ValueError("malformed value: {value!r}".format(value=value))
+    if _INT_PATTERN.fullmatch(value):
+        return int(value)
+    return ast.literal_eval(value)
+
+
+def code_version_value(value: str):
+    if _INT_PATTERN.fullmatch(value):
+        return int(value)
+    try:
+        # some code version entries are in a float format, int is expected
+        return int(ast.literal_eval(value.title()))
+    except (ValueError, SyntaxError):
+        return value
+
+
+def float_value(value: str):
+    if _FLOAT_PATTERN.fullmatch(value):
+        return float(value)
+    if _INT_PATTERN.fullmatch(value):
+        return int(value)
+    return literal_value(value)
+
+
+def int_value(value: str):
+    if _INT_PATTERN.fullmatch(value):
+        return int(value)
+    return literal_value(value)
+
+
+def bool_value(value: str):
+    lower_value = value.lower()
+    if lower_value == "true":
+        return True
+    if lower_value == "false":
+        return False
+    return literal_value(value)
+
+
+def str_value(value: str):
+    if _WORD_PATTERN.fullmatch(value) and value.lower() not in _LITERAL_WORDS:
+        return value
+    return literal_value(value)
+
+
+COLUMN_TYPES = {"class": str_value,
+                "code_version": code_version_value,
+                "latitude": float_value,
+                "longitude": float_value,
+                "network_latitude": float_value,
+                "network_longitude": float_value,
+                "acceleration_x": float_value,
+                "acceleration_y": float_value,
+                "acceleration_z": float_value,
+                "magnetic_field_x": float_value,
+                "magnetic_field_y": float_value,
+                "magnetic_field_z": float_value,
+                "gyroscope_x": float_value,
+                "gyroscope_y": float_value,
+                "gyroscope_z": float_value,
+                "atmospheric_pressure": float_value,
+                "light_level": float_value,
+                "gravitational_acceleration": float_value,
+                "linear_acceleration_x": float_value,
+                "linear_acceleration_y": float_value,
+                "linear_acceleration_z": float_value,
+                "step_count": int_value,
+                "battery_temperature": float_value,
+                "ambient_temperature": float_value,
+                "voltage": float_value,
+                "charging_current": float_value,
+                "discharge_current": float_value,
+                "significant_motion": bool_value,
+                "proximity_sensor": float_value,
+                "phone_ip": str_value,
+                "phone_battery_state": str_value}  # type: Dict[str, Converter]
+
+
+def get_converter(key: str) -> Converter:
+    return COLUMN_TYPES.get(key, literal_value)
+
+
+@lru_cache(maxsize=32)
+def compile_converters(fieldnames: Iterable[str]) -> Dict[str, Converter]:
+    """
+    :param fieldnames: hashable sequence of column names of a log file header
+    :returns a mapping of each column to the conversion function for its values
+    """
+    return dict((key, get_converter(key)) for key in fieldnames)
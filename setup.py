@@ -14,8 +14,13 @@ setup(
     author_email='webike-dev@lists.uwaterloo.ca',
     description='WeBike data import into database',
     packages=find_packages(),
-    scripts=['iss4e/webike/db/import_data.py', 'iss4e/webike/db/reset_log_files.py'],
+    scripts=['iss4e/webike/db/import_data.py', 'iss4e/webike/db/reset_log_files.py',
+             'iss4e/webike/db/drain_spool.py'],
     install_requires=[
         'iss4e_toolchain>=0.1.0', 'docopt'
-    ]
+    ],
+    extras_require={
+        'columnar': ['numpy'],
+        'async': ['aiohttp']
+    }
 )
@@ -0,0 +1,76 @@
+import csv
+import os
+
+import pytest
+
+from iss4e.webike.db.aggregation import AGGREGATE_FUNCTIONS, Aggregation, Downsampler
+from iss4e.webike.db.benchmark.synthetic import generate_log
+from iss4e.webike.db.classes import Directory
+from iss4e.webike.db.csv_parser import V2Parser
+from iss4e.webike.db.line_protocol import LineProtocolSerializer
+from iss4e.webike.db.manifest import ImportManifest
+
+AGGREGATION = Aggregation([1, 60], ["acceleration_x", "voltage", "battery_temperature"], sorted(AGGREGATE_FUNCTIONS),
+                          False)
+
+
+@pytest.fixture
+def directory(tmpdir) -> Directory:
+    path = tmpdir.mkdir("350000000000000")
+    return Directory(path.basename, str(path))
+
+
+def _write_log(directory: Directory, name: str, rows):
+    with open(os.path.join(directory.abs_path, name), "w", newline="") as log_file:
+        csv.writer(log_file).writerows(rows)
+
+
+def _points(data: bytes) -> dict:
+    """
+    :returns the fields of the line protocol points by measurement and timestamp, later points replace earlier ones
+    """
+    points = {}
+    for line in data.decode().splitlines():
+        series, field_set, timestamp = line.rsplit(" ", 2)
+        points[series.split(",")[0], int(timestamp)] = {
+            key: int(value[:-1]) if value.endswith("i") else pytest.approx(float(value), rel=1e-12)
+            for key, value in (field.split("=") for field in field_set.split(","))}
+    return points
+
+
+def _import(directory: Directory, manifest: ImportManifest, name: str) -> bytes:
+    pieces = []
+    data = b"".join(data for _, data in V2Parser(aggregation=AGGREGATION).read_chunks(directory, name,
+                                                                                       pieces=pieces))
+    serializer = LineProtocolSerializer()
+    Downsampler(AGGREGATION).write_pieces(manifest.merge_pieces(name, pieces), serializer)
+    return data + serializer.flush()
+
+
+@pytest.mark.parametrize("order", [["data0.csv.log", "data1.csv.log"], ["data1.csv.log", "data0.csv.log"]])
+def test_windows_cut_by_file_edges_are_merged(directory, order):
+    rows = list(generate_log(2, 2000))
+    _write_log(directory, "whole.csv.log", rows)
+    _write_log(directory, "data0.csv.log", rows[:1000])
+    _write_log(directory, "data1.csv.log", rows[1000:])
+    expected = _points(b"".join(data for _, data in V2Parser(aggregation=AGGREGATION).read_chunks(directory,
+                                                                                                  "whole.csv.log")))
+
+    manifest = ImportManifest(directory, ".import_manifest.sqlite")
+    written = {}
+    for name in order:
+        written.update(_points(_import(directory, manifest, name)))
+    # importing a file again replaces its pieces instead of counting them twice
+    written.update(_points(_import(directory, manifest, order[0])))
+    manifest.close()
+    assert written == expected
+
+
+def test_resume_offsets_do_not_pass_cut_windows(directory):
+    _write_log(directory, "data0.csv.log", generate_log(2, 1000))
+    pieces = []
+    chunks = list(V2Parser(chunk_points=50, aggregation=AGGREGATION._replace(raw=True)).read_chunks(
+        directory, "data0.csv.log", pieces=pieces))
+    assert len(chunks) > 1 and pieces
+    # a resumed import reads the rows of the first window of each length again, until the pieces are written
+    assert all(offset == 0 for offset, _ in chunks)
@@ -0,0 +1,82 @@
+import csv
+import os
+
+import pytest
+
+from iss4e.webike.db.archive import ArchiveReader, create_archive, is_archive, restore_log
+from iss4e.webike.db.benchmark.synthetic import generate_log
+from iss4e.webike.db.classes import Directory, WorkItem
+from iss4e.webike.db.csv_parser import V2Parser, V3Parser
+from iss4e.webike.db.scheduler import convert_log
+from iss4e.webike.db.selection import TimeSpan
+
+pytest.importorskip("numpy")
+
+
+def _write_log(tmpdir, version: int = 3) -> WorkItem:
+    path = tmpdir.mkdir("350000000000000")
+    directory = Directory(path.basename, str(path))
+    with open(os.path.join(directory.abs_path, "data.csv.log"), "w", newline="") as log_file:
+        csv.writer(log_file).writerows(generate_log(version, 2000, null_density=0.05, message_density=0.05, seed=1))
+    return WorkItem(directory, "data.csv.log", 0)
+
+
+def test_restore_log_gives_back_the_log_file(tmpdir):
+    item = _write_log(tmpdir)
+    path = os.path.join(item.directory.abs_path, item.file)
+    with open(path, "rb") as log_file:
+        expected = log_file.read()
+
+    convert_log(V3Parser(), item, path)
+    assert is_archive(path)
+    os.utime(path, (1457000000, 1457000000))
+    restore_log(path)
+
+    assert not is_archive(path)
+    with open(path, "rb") as log_file:
+        assert log_file.read() == expected
+    assert os.stat(path).st_mtime == 1457000000
+
+
+def test_archive_keeps_the_rows_its_parser_leaves_out(tmpdir):
+    item = _write_log(tmpdir)
+    path = os.path.join(item.directory.abs_path, item.file)
+    with open(path, "rb") as log_file:
+        expected = log_file.read()
+
+    convert_log(V2Parser(), item, path)
+    with ArchiveReader(path) as reader:
+        assert reader.points == 0
+    restore_log(path)
+
+    with open(path, "rb") as log_file:
+        assert log_file.read() == expected
+
+
+def test_corrupt_copy_keeps_the_archive(tmpdir):
+    item = _write_log(tmpdir)
+    path = os.path.join(item.directory.abs_path, item.file)
+    convert_log(V3Parser(), item, path)
+    with ArchiveReader(path) as reader:
+        position = reader._log[0]
+    with open(path, "r+b") as archive_file:
+        archive_file.seek(position + 100)
+        archive_file.write(b"\x00" * 16)
+    with open(path, "rb") as archive_file:
+        corrupt = archive_file.read()
+
+    with pytest.raises(ValueError):
+        restore_log(path)
+    with open(path, "rb") as archive_file:
+        assert archive_file.read() == corrupt
+
+
+def test_archive_without_copy(tmpdir):
+    path = str(tmpdir.join("archive"))
+    with create_archive(path) as writer:
+        writer.close(TimeSpan())
+    with ArchiveReader(path) as reader:
+        assert not reader.has_log
+    with pytest.raises(ValueError):
+        restore_log(path)
+    assert is_archive(path)
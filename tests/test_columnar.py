@@ -0,0 +1,86 @@
+import csv
+import os
+import random
+
+import pytest
+
+from iss4e.webike.db.benchmark.synthetic import generate_log
+from iss4e.webike.db.classes import Directory
+from iss4e.webike.db.csv_parser import V1Parser, V2Parser, V3Parser
+
+pytest.importorskip("numpy")
+
+PARSERS = {1: V1Parser, 2: V2Parser, 3: V3Parser}
+# values whose type or format the row-wise converters treat specially
+UNUSUAL_VALUES = ["1", "1.0", "-0", "+5", "007", "-00", "00.5", ".5", "5.", "1e5", "1E+5", "1e999", "-1e999", "nan",
+                  "NaN", "inf", "Infinity", "True", "false", "TRUE", "none", "0x1F", "'quoted'", "1.2.3", "5-3", "1e",
+                  "99999999999999999999", "1_000", " 1.5", "abc", "", "null", "-", "µ"]
+# values that numpy parses as floats, so that only they decide how their column is converted
+NUMBER_LIKE_VALUES = ["1", "-0", "+5", "-00", "1e5", "nan", "NaN", "inf", "-Infinity", "1e999", "1_000"]
+CODE_VERSIONS = {2: ["17", "17.0", "17.9", "+17", "017", "1e1", "abc", "23"], 3: ["23", "23.0", "23.5", "+23", "1e2"]}
+
+
+def _unusual_log(version: int, seed: int, values):
+    rng = random.Random(seed)
+    rows = list(generate_log(version, 500, null_density=0.0 if values is NUMBER_LIKE_VALUES else 0.05,
+                             message_density=0.05, seed=seed))
+    header = rows[0] if version == 3 else None
+    fieldnames = header or PARSERS[version].FIELDNAMES
+    # the code version decides the format of a row, so it only gets values that the filters can compare
+    code_version = fieldnames.index("code_version") if "code_version" in fieldnames else None
+    columns = [column for column, name in enumerate(fieldnames)
+               if name not in ("timestamp", "IMEI", "code_version")]
+    for row in rows[1:] if header else rows:
+        for column in rng.sample(columns, 5):
+            if column < len(row) and rng.random() < 0.5:
+                row[column] = rng.choice(values)
+        if code_version is not None and code_version < len(row) and rng.random() < 0.2:
+            row[code_version] = rng.choice(CODE_VERSIONS[version])
+    return rows
+
+
+def _read(parser, directory: Directory, name: str) -> bytes:
+    return b"".join(data for _, data in parser.read_chunks(directory, name))
+
+
+@pytest.mark.parametrize("version", [1, 2, 3])
+@pytest.mark.parametrize("seed", range(3))
+@pytest.mark.parametrize("values", [UNUSUAL_VALUES, NUMBER_LIKE_VALUES], ids=["unusual", "number_like"])
+def test_columnar_matches_row_wise_parsing(tmpdir, version, seed, values):
+    path = tmpdir.mkdir("350000000000000")
+    directory = Directory(path.basename, str(path))
+    with open(os.path.join(directory.abs_path, "data.csv.log"), "w", newline="") as log_file:
+        csv.writer(log_file).writerows(_unusual_log(version, seed, values))
+
+    expected = _read(PARSERS[version](), directory, "data.csv.log")
+    assert expected
+    assert _read(PARSERS[version](columnar=True), directory, "data.csv.log").splitlines() == expected.splitlines()
+
+
+def test_float_columns_keep_integer_values():
+    from iss4e.webike.db.columnar import ColumnBatch
+
+    batch = ColumnBatch.from_rows(V1Parser.FIELDNAMES, [["2016-03-13 01:00:00.000", "SensorData", "1", "1.5"]])
+    encoded, _ = batch.typed("latitude").encode(batch.full_mask(True))
+    assert encoded.tolist() == ["1i"]
+
+
+@pytest.mark.parametrize("version", [1, 2, 3])
+def test_blank_lines_do_not_count_as_rows(tmpdir, version):
+    path = tmpdir.mkdir("350000000000000")
+    directory = Directory(path.basename, str(path))
+    rows = list(generate_log(version, 60, null_density=0.0, message_density=0.0, seed=version))
+    with open(os.path.join(directory.abs_path, "data.csv.log"), "w", newline="") as log_file:
+        writer = csv.writer(log_file)
+        for index, row in enumerate(rows):
+            writer.writerow(row)
+            if index % 4 == 1:
+                log_file.write("\r\n")
+
+    row_wise = list(PARSERS[version]().read_chunks(directory, "data.csv.log", 10))
+    columnar = list(PARSERS[version](columnar=True).read_chunks(directory, "data.csv.log", 10))
+    assert row_wise
+    assert b"".join(data for _, data in columnar).splitlines() == b"".join(data for _, data in row_wise).splitlines()
+    assert columnar[-1][0] == row_wise[-1][0]
+    mapped = list(PARSERS[version](mmap_size=1).read_chunks(directory, "data.csv.log", 10))
+    assert mapped == row_wise
@@ -0,0 +1,127 @@
+import csv
+import os
+
+import pytest
+
+from iss4e.webike.db.benchmark.synthetic import generate_log
+from iss4e.webike.db.classes import Directory
+from iss4e.webike.db.csv_parser import AutoParser, V1Parser, V2Parser, V3Parser, sniff_versions
+
+PARSERS = {1: V1Parser, 2: V2Parser, 3: V3Parser}
+MODES = [{}, {"mmap_size": 1}, {"columnar": True}]
+
+
+def _write_log(directory: Directory, name: str, rows):
+    with open(os.path.join(directory.abs_path, name), "w", newline="") as log_file:
+        csv.writer(log_file).writerows(rows)
+
+
+def _read(parser, directory: Directory, name: str, offset: int = 0) -> bytes:
+    return b"".join(data for _, data in parser.read_chunks(directory, name, offset))
+
+
+@pytest.fixture
+def directory(tmpdir) -> Directory:
+    path = tmpdir.mkdir("350000000000000")
+    return Directory(path.basename, str(path))
+
+
+@pytest.mark.parametrize("version", [1, 2])
+@pytest.mark.parametrize("auto", [False, True])
+@pytest.mark.parametrize("options", MODES)
+def test_short_message_rows_are_skipped(directory, version, auto, options):
+    # the same sensor data rows with full width and with short log message rows
+    _write_log(directory, "full.csv.log", generate_log(version, 300, message_density=0.1))
+    _write_log(directory, "short.csv.log", generate_log(version, 300, message_density=0.1, short_messages=True))
+    parser_type = AutoParser if auto else PARSERS[version]
+
+    expected = _read(parser_type(**options), directory, "full.csv.log")
+    assert expected
+    assert _read(parser_type(**options), directory, "short.csv.log") == expected
+
+
+@pytest.mark.parametrize("auto", [False, True])
+@pytest.mark.parametrize("options", MODES)
+def test_short_v3_rows_are_skipped(directory, auto, options):
+    _write_log(directory, "data.csv.log", [["timestamp", "IMEI", "class", "code_version", "latitude"],
+                                           ["2016-03-13 01:00:00.000", "350000000000000", "SensorData", "23", "1.5"],
+                                           ["2016-03-13 01:00:01.000", "350000000000000", "GPS signal lost"],
+                                           ["2016-03-13 01:00:02.000", "350000000000000", "SensorData", "23", "2.5"]])
+    parser = AutoParser(**options) if auto else V3Parser(**options)
+
+    assert _read(parser, directory, "data.csv.log").count(b"\n") == 2
+
+
+@pytest.mark.parametrize("options", MODES)
+@pytest.mark.parametrize("limits", [{"chunk_points": 70}, {"chunk_points": 10 ** 6, "chunk_bytes": 20000}])
+def test_chunks_are_bounded_and_resume_at_their_offsets(directory, options, limits):
+    _write_log(directory, "data.csv.log", generate_log(2, 500, message_density=0.1))
+    whole = _read(V2Parser(**options), directory, "data.csv.log").splitlines(keepends=True)
+    chunks = list(V2Parser(**dict(options, **limits)).read_chunks(directory, "data.csv.log"))
+
+    assert len(chunks) > 2
+    assert [line for _, data in chunks for line in data.splitlines(keepends=True)] == whole
+    for _, data in chunks:
+        lines = data.splitlines(keepends=True)
+        assert len(lines) <= limits["chunk_points"]
+        # a chunk is flushed once it reaches the byte limit, so only its last point may pass it
+        assert sum(len(line) for line in lines[:-1]) < limits.get("chunk_bytes", float("inf"))
+    offsets = [offset for offset, _ in chunks]
+    assert offsets == sorted(offsets) and offsets[-1] == 500
+    # a file resumed from the offset after a chunk has the points of the rows after it, which include those of the
+    # following chunks. The columnar mode resumes from the start of the block a chunk ends in
+    for index, (offset, _) in enumerate(chunks):
+        resumed = _read(V2Parser(**dict(options, **limits)), directory, "data.csv.log", offset)
+        assert resumed == _read(V2Parser(), directory, "data.csv.log", offset)
+        assert resumed.endswith(b"".join(data for _, data in chunks[index + 1:]))
+        if not options.get("columnar"):
+            assert resumed == b"".join(data for _, data in chunks[index + 1:])
+
+
+def _mixed_log(parts):
+    """
+    :param parts: format versions of the consecutive parts of the log
+    :returns the rows of each part
+    """
+    return [list(generate_log(version, 150, imei="350000000000000", message_density=0.1, seed=index))
+            for index, version in enumerate(parts)]
+
+
+@pytest.mark.parametrize("version", [1, 2, 3])
+@pytest.mark.parametrize("options", MODES)
+def test_auto_parser_reads_single_format_files_like_their_parser(directory, version, options):
+    _write_log(directory, "data.csv.log", generate_log(version, 300, imei="350000000000000", message_density=0.1))
+    assert sniff_versions(os.path.join(directory.abs_path, "data.csv.log")) == {version}
+
+    expected = _read(PARSERS[version](**options), directory, "data.csv.log")
+    assert expected
+    assert _read(AutoParser(**options), directory, "data.csv.log") == expected
+
+
+@pytest.mark.parametrize("parts", [[1, 2], [2, 3], [1, 2, 3]])
+@pytest.mark.parametrize("options", MODES)
+def test_auto_parser_reads_each_row_of_mixed_files_in_its_format(directory, parts, options):
+    part_rows = _mixed_log(parts)
+    expected = b""
+    for version, rows in zip(parts, part_rows):
+        _write_log(directory, "part.csv.log", rows)
+        expected += _read(PARSERS[version](), directory, "part.csv.log")
+    _write_log(directory, "data.csv.log", [row for rows in part_rows for row in rows])
+    # the file is read row by row if it has several formats
+    assert len(sniff_versions(os.path.join(directory.abs_path, "data.csv.log"))) > 1
+
+    assert _read(AutoParser(**options), directory, "data.csv.log") == expected
+    # resumed after any chunk, a mixed file continues with the points of the following chunks
+    chunks = list(AutoParser(chunk_points=60, **options).read_chunks(directory, "data.csv.log"))
+    for index, (offset, _) in enumerate(chunks):
+        assert _read(AutoParser(**options), directory, "data.csv.log", offset) == \
+               b"".join(data for _, data in chunks[index + 1:])
+
+
+def test_sniffing_a_large_file_finds_the_formats_at_both_ends(directory):
+    _write_log(directory, "data.csv.log", [row for rows in _mixed_log([1, 2]) for row in rows])
+    path = os.path.join(directory.abs_path, "data.csv.log")
+    assert sniff_versions(path, sniff_size=2048) == {1, 2}
+    # rows of the new format without the header in the sniffed tail cannot be told apart from log messages
+    _write_log(directory, "data.csv.log", [row for rows in _mixed_log([2, 3]) for row in rows])
+    assert sniff_versions(path, sniff_size=2048) == {2, None}
@@ -0,0 +1,61 @@
+import fcntl
+import os
+import pickle
+import threading
+
+import pytest
+
+from iss4e.webike.db.dedup import DedupIndex
+
+IMEI = "350000000000000"
+
+
+@pytest.fixture
+def directory(tmpdir) -> str:
+    return str(tmpdir.mkdir("dedup"))
+
+
+def test_lookups_are_exact_after_compaction(directory):
+    index = DedupIndex(directory)
+    index.add(IMEI, [3, 1, 2])
+    assert not index.contains(IMEI, 1)
+    index.compact()
+    index.add(IMEI, [2, 5])
+    index.compact()
+    assert [t for t in range(7) if index.contains(IMEI, t)] == [1, 2, 3, 5]
+    assert not index.contains("350000000000001", 1)
+
+
+def test_worker_copies_see_the_compacted_files(directory):
+    index = DedupIndex(directory)
+    index.add(IMEI, [10])
+    index.compact()
+    worker = pickle.loads(pickle.dumps(index))
+    assert worker.contains(IMEI, 10)
+
+
+def test_appends_after_compaction_by_another_process_are_kept(directory):
+    writer, compactor = DedupIndex(directory), DedupIndex(directory)
+    writer.add(IMEI, [1])
+    compactor.compact()
+    # the log the writer had open has been merged and removed
+    writer.add(IMEI, [2])
+    compactor.compact()
+    assert compactor.contains(IMEI, 1)
+    assert compactor.contains(IMEI, 2)
+
+
+def test_compaction_waits_for_shared_lock(directory):
+    index = DedupIndex(directory)
+    index.add(IMEI, [1])
+    # another process holding the shared lock, e.g. while appending
+    with open(os.path.join(directory, "index.lock"), "ab") as lock_file:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_SH)
+        compaction = threading.Thread(target=DedupIndex(directory).compact)
+        compaction.start()
+        compaction.join(0.2)
+        assert compaction.is_alive()
+        assert os.path.exists(os.path.join(directory, IMEI + ".log"))
+    compaction.join(5)
+    assert not compaction.is_alive()
+    assert DedupIndex(directory).contains(IMEI, 1)
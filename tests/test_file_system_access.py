@@ -0,0 +1,69 @@
+import json
+import logging
+import os
+
+import pytest
+
+from iss4e.webike.db.classes import Directory
+from iss4e.webike.db.file_system_access import FileSystemAccess
+
+LOG_PATTERN = "^data.*?[.].+?[.]log$"
+
+
+@pytest.fixture
+def directory(tmpdir) -> Directory:
+    path = tmpdir.mkdir("350000000000000")
+    path.mkdir("archive")
+    for name in ["data1.csv.log", "data2.csv.log", "notes.txt"]:
+        path.join(name).write("rows\n")
+    # an old modification time, so that any change of the directory gives a new one
+    os.utime(str(path), (1457000000, 1457000000))
+    return Directory(path.basename, str(path))
+
+
+def _scan(cache_path: str, directory: Directory, pattern: str = LOG_PATTERN):
+    listing = FileSystemAccess(logging.getLogger(__name__), cache_path).scan(pattern, [directory])
+    return sorted(log_file.name for log_file in listing[directory])
+
+
+def test_scan_lists_the_matching_files(directory):
+    assert _scan(None, directory) == ["data1.csv.log", "data2.csv.log"]
+
+
+def test_unchanged_directories_are_listed_from_the_cache(tmpdir, directory):
+    cache_path = str(tmpdir.join("listing.json"))
+    _scan(cache_path, directory)
+    with open(cache_path) as cache_file:
+        cache = json.load(cache_file)
+    cache[directory.abs_path]["files"] = [["cached.csv.log", 5, 0]]
+    with open(cache_path, "w") as cache_file:
+        json.dump(cache, cache_file)
+
+    assert _scan(cache_path, directory) == ["cached.csv.log"]
+
+
+def test_moved_files_invalidate_the_cache(tmpdir, directory):
+    cache_path = str(tmpdir.join("listing.json"))
+    assert _scan(cache_path, directory) == ["data1.csv.log", "data2.csv.log"]
+    os.rename(os.path.join(directory.abs_path, "data1.csv.log"),
+              os.path.join(directory.abs_path, "archive", "data1.csv.log"))
+    assert _scan(cache_path, directory) == ["data2.csv.log"]
+    # moved back by a reset
+    os.utime(directory.abs_path, (1457000000, 1457000000))
+    _scan(cache_path, directory)
+    os.rename(os.path.join(directory.abs_path, "archive", "data1.csv.log"),
+              os.path.join(directory.abs_path, "data1.csv.log"))
+    assert _scan(cache_path, directory) == ["data1.csv.log", "data2.csv.log"]
+
+
+def test_another_pattern_invalidates_the_cache(tmpdir, directory):
+    cache_path = str(tmpdir.join("listing.json"))
+    _scan(cache_path, directory)
+    assert _scan(cache_path, directory, "^data1[.].*$") == ["data1.csv.log"]
+
+
+def test_corrupt_cache_is_ignored(tmpdir, directory):
+    cache_path = str(tmpdir.join("listing.json"))
+    tmpdir.join("listing.json").write("{")
+    assert _scan(cache_path, directory) == ["data1.csv.log", "data2.csv.log"]
+    assert _scan(cache_path, directory) == ["data1.csv.log", "data2.csv.log"]
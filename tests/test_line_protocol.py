@@ -0,0 +1,170 @@
+import csv
+import io
+from typing import List, Tuple
+
+import pytest
+
+from iss4e.webike.db.benchmark.synthetic import V3_FIELDNAMES, generate_rows
+from iss4e.webike.db.csv_parser import V3Parser
+from iss4e.webike.db.date_time import DateTime
+from iss4e.webike.db.line_protocol import LineProtocolSerializer, encode_value, escape_measurement, escape_string, \
+    escape_tag
+
+# strings with every character that needs escaping somewhere in a point
+AWKWARD_STRINGS = ["plain", "with space", "comma,separated", "key=value", 'a "quoted" word', "back\\slash",
+                   "trailing\\", "two\nlines", "windows\r\nline", "\n", "", "ünïcödé", "tab\tseparated"]
+
+
+def _split(text: str, separator: str) -> List[str]:
+    """
+    splits at unescaped separators outside of string values
+    """
+    parts = [""]
+    escaped = quoted = False
+    for character in text:
+        if escaped:
+            parts[-1] += character
+            escaped = False
+        elif character == "\\":
+            parts[-1] += character
+            escaped = True
+        elif character == '"':
+            parts[-1] += character
+            quoted = not quoted
+        elif character == separator and not quoted:
+            parts.append("")
+        else:
+            parts[-1] += character
+    return parts
+
+
+def _unescape(text: str) -> str:
+    characters = []
+    escaped = False
+    for character in text:
+        if escaped:
+            characters.append("\n" if character == "n" else character)
+            escaped = False
+        elif character != "\\":
+            characters.append(character)
+        else:
+            escaped = True
+    return "".join(characters)
+
+
+def _parse_value(value: str):
+    if value.startswith('"'):
+        return _unescape(value[1:-1])
+    if value.endswith("i"):
+        return int(value[:-1])
+    if value in ("true", "false"):
+        return value == "true"
+    return float(value)
+
+
+def _parse_line(line: str) -> Tuple[str, dict, dict, int]:
+    """
+    :returns measurement, tags, fields and timestamp of a line protocol string
+    """
+    series, field_set, timestamp = _split(line, " ")
+    measurement, *tags = _split(series, ",")
+    tags = dict((_unescape(key), _unescape(value)) for key, value in (_split(tag, "=") for tag in tags))
+    fields = dict((_unescape(key), _parse_value(value)) for key, value in
+                  (_split(field, "=") for field in _split(field_set, ",")))
+    return _unescape(measurement), tags, fields, int(timestamp)
+
+
+def test_escape_measurement():
+    assert escape_measurement("sensor data,1m") == "sensor\\ data\\,1m"
+    assert escape_measurement("a=b") == "a=b"
+    assert escape_measurement("back\\slash\n") == "back\\\\slash\\n"
+
+
+def test_escape_tag():
+    assert escape_tag("a b,c=d") == "a\\ b\\,c\\=d"
+    assert escape_tag("back\\slash") == "back\\\\slash"
+    assert escape_tag("two\nlines") == "two\\nlines"
+
+
+def test_escape_string():
+    assert escape_string('say "hi"') == '"say \\"hi\\""'
+    assert escape_string("back\\slash") == '"back\\\\slash"'
+    assert escape_string("two\nlines") == '"two\\nlines"'
+    assert escape_string("a b,c=d") == '"a b,c=d"'
+
+
+@pytest.mark.parametrize("value, expected", [(True, "true"), (False, "false"), (0, "0i"), (-17, "-17i"),
+                                             (2 ** 63 - 1, "9223372036854775807i"), (1.5, "1.5"), (-0.0, "-0.0"),
+                                             (1e16, "1e+16"), (0.1 + 0.2, "0.30000000000000004"),
+                                             (float("inf"), None), (float("-inf"), None), (float("nan"), None),
+                                             (None, None), ("text", '"text"'), ("two\nlines", '"two\\nlines"')])
+def test_encode_value(value, expected):
+    assert encode_value(value) == expected
+
+
+def test_encoded_floats_parse_back_exactly():
+    for value in (1 / 3, 5e-324, 1.7976931348623157e308, -123456.789, 1e-7):
+        assert float(encode_value(value)) == value
+
+
+@pytest.mark.parametrize("value", AWKWARD_STRINGS)
+def test_escaping_matches_the_influxdb_client(value):
+    line_protocol = pytest.importorskip("influxdb.line_protocol")
+    assert escape_tag(value) == line_protocol._escape_tag(value)
+    assert escape_string(value) == line_protocol.quote_ident(value)
+
+
+@pytest.mark.parametrize("value", AWKWARD_STRINGS)
+def test_round_trip(value):
+    serializer = LineProtocolSerializer("sensor data," + value)
+    fields = {"text": value, value or "empty": 1, "flag": True, "count": -3, "ratio": 0.25}
+    assert serializer.add(value or "imei", fields, 1457848800123000000)
+    data = serializer.flush()
+
+    # newlines only end points
+    assert data.count(b"\n") == 1 and data.endswith(b"\n")
+    measurement, tags, parsed_fields, timestamp = _parse_line(data.decode()[:-1])
+    assert measurement == "sensor data," + value
+    assert tags == {"imei": value or "imei"}
+    assert parsed_fields == fields
+    assert timestamp == 1457848800123000000
+
+
+def test_points_without_writable_fields_are_skipped():
+    serializer = LineProtocolSerializer()
+    assert not serializer.add("350000000000000", {"latitude": float("nan"), "longitude": None}, 0)
+    assert serializer.add("350000000000000", {"latitude": float("nan"), "longitude": 1.5}, 0)
+    assert serializer.points == 1
+    assert serializer.flush() == b"sensor_data,imei=350000000000000 longitude=1.5 0\n"
+    assert len(serializer) == 0 and serializer.points == 0
+
+
+def test_serializer_matches_the_influxdb_client():
+    line_protocol = pytest.importorskip("influxdb.line_protocol")
+    fields = {"count": 7, "latitude": 43.4723, "state": "charging\n", "voltage": 3.7}
+    serializer = LineProtocolSerializer()
+    # the client sorts the fields by name and writes booleans differently, so neither is part of the comparison
+    serializer.add("350000000000000", fields, 1457848800123000000)
+    expected = line_protocol.make_lines({"points": [{"measurement": "sensor_data",
+                                                     "tags": {"imei": "350000000000000"},
+                                                     "fields": fields, "time": 1457848800123000000}]})
+    assert serializer.flush().decode() == expected
+
+
+
+def test_log_round_trip():
+    log = io.StringIO()
+    writer = csv.writer(log)
+    writer.writerow(V3_FIELDNAMES)
+    writer.writerows(generate_rows(V3_FIELDNAMES, 2000, code_version=25, null_density=0.1))
+    parser = V3Parser()
+    serializer = LineProtocolSerializer("sensor_data")
+    for _ in parser._serialize(csv.DictReader(io.StringIO(log.getvalue())), 0, serializer):
+        pass
+
+    # the points as the influxdb client got them before, without the values it cannot write
+    expected = [("sensor_data", {"imei": imei}, dict((key, value) for key, value in fields.items()
+                                                     if encode_value(value) is not None),
+                 DateTime.from_string(timestamp, "Canada/Eastern").epoch_nanoseconds)
+                for _, imei, timestamp, fields in parser._parse_rows(csv.DictReader(io.StringIO(log.getvalue())))]
+    assert [_parse_line(line) for line in serializer.flush().decode().splitlines()] == expected
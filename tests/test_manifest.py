@@ -0,0 +1,119 @@
+import os
+
+import pytest
+
+from iss4e.webike.db.classes import Directory
+from iss4e.webike.db.manifest import FINGERPRINT_BLOCK_SIZE, ImportManifest, fingerprint
+from iss4e.webike.db.selection import TimeSpan
+
+MANIFEST = ".import_manifest.sqlite"
+ROWS = b"2016-03-13 01:00:00.000,SensorData,1,1.5\n" * 100
+
+
+@pytest.fixture
+def directory(tmpdir) -> Directory:
+    path = tmpdir.mkdir("350000000000000")
+    return Directory(path.basename, str(path))
+
+
+def _write(directory: Directory, data: bytes, mode: str = "wb", mtime: int = None):
+    path = os.path.join(directory.abs_path, "data.csv.log")
+    with open(path, mode) as log_file:
+        log_file.write(data)
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+
+
+def _manifest(directory: Directory) -> ImportManifest:
+    # a new instance for each run, the state of the files is kept for the run
+    return ImportManifest(directory, MANIFEST)
+
+
+def _imported(directory: Directory, offset: int, complete: bool):
+    manifest = _manifest(directory)
+    manifest.commit("data.csv.log", offset)
+    if complete:
+        manifest.complete("data.csv.log")
+    manifest.close()
+
+
+def _state(directory: Directory):
+    manifest = _manifest(directory)
+    try:
+        return manifest.get("data.csv.log"), manifest.is_imported("data.csv.log")
+    finally:
+        manifest.close()
+
+
+def _span(directory: Directory):
+    manifest = _manifest(directory)
+    span = manifest.get_span("data.csv.log")
+    manifest.close()
+    return None if span is None else (span.first, span.last)
+
+
+def test_new_files_are_imported_from_the_start(directory):
+    _write(directory, ROWS)
+    assert _state(directory) == (0, False)
+
+
+def test_partial_imports_resume_from_the_committed_offset(directory):
+    _write(directory, ROWS)
+    _imported(directory, 40, complete=False)
+    assert _state(directory) == (40, False)
+    _imported(directory, 100, complete=True)
+    assert _state(directory) == (100, True)
+
+
+def test_touched_files_stay_imported(directory):
+    _write(directory, ROWS, mtime=1457000000)
+    _imported(directory, 100, complete=True)
+    _write(directory, ROWS, mtime=1458000000)
+    assert _state(directory) == (100, True)
+
+
+def test_appended_files_resume_after_their_imported_rows(directory):
+    _write(directory, ROWS, mtime=1457000000)
+    _imported(directory, 100, complete=True)
+    _write(directory, ROWS[:41], mode="ab", mtime=1458000000)
+    assert _state(directory) == (100, False)
+
+
+@pytest.mark.parametrize("content", [ROWS.replace(b"1.5", b"2.5"), ROWS[:-41], ROWS.replace(b"1.5", b"2.5") + ROWS])
+def test_changed_files_are_imported_again(directory, content):
+    _write(directory, ROWS, mtime=1457000000)
+    _imported(directory, 100, complete=True)
+    _write(directory, content, mtime=1458000000)
+    assert _state(directory) == (0, False)
+
+
+def test_forgotten_files_are_imported_again(directory):
+    _write(directory, ROWS)
+    _imported(directory, 100, complete=True)
+    manifest = _manifest(directory)
+    manifest.forget(["data.csv.log"])
+    manifest.close()
+    assert _state(directory) == (0, False)
+
+
+def test_spans_are_dropped_once_the_file_changes(directory):
+    _write(directory, ROWS, mtime=1457000000)
+    manifest = _manifest(directory)
+    manifest.record_span("data.csv.log", TimeSpan("2016-03-13 01:00:00.000", "2016-03-13 02:00:00.000"))
+    manifest.close()
+    assert _span(directory) == ("2016-03-13 01:00:00.000", "2016-03-13 02:00:00.000")
+    _write(directory, ROWS[:-41], mtime=1458000000)
+    assert _span(directory) is None
+
+
+def test_fingerprint_covers_the_first_and_last_block(directory):
+    data = bytes(range(256)) * (3 * FINGERPRINT_BLOCK_SIZE // 256)
+    _write(directory, data)
+    path = os.path.join(directory.abs_path, "data.csv.log")
+    expected = fingerprint(path, len(data))
+    for position in (0, len(data) - 1):
+        _write(directory, data[:position] + b"x" + data[position + 1:])
+        assert fingerprint(path, len(data)) != expected
+    # the prefix of an appended file has the fingerprint of the file before
+    _write(directory, data + b"appended")
+    assert fingerprint(path, len(data)) == expected
@@ -0,0 +1,71 @@
+import csv
+import io
+import os
+
+import pytest
+
+from iss4e.webike.db import mapped_reader
+from iss4e.webike.db.benchmark.synthetic import generate_log
+from iss4e.webike.db.classes import Directory
+from iss4e.webike.db.csv_parser import V2Parser, V3Parser
+from iss4e.webike.db.mapped_reader import MappedDictReader, map_log, plain_int
+
+LINES = ["timestamp,IMEI,class,latitude", "2016-03-13 01:00:00.000,1,SensorData,1.5", "",
+         "2016-03-13 01:00:01.000,1,GPS signal lost", "2016-03-13 01:00:02.000,1,SensorData,2.5,surplus,more",
+         "2016-03-13 01:00:03.000,1,SensorData,µ"]
+
+
+def _write(tmpdir, data: bytes) -> str:
+    path = str(tmpdir.join("data.csv.log"))
+    with open(path, "wb") as log_file:
+        log_file.write(data)
+    return path
+
+
+@pytest.mark.parametrize("newline", ["\n", "\r\n"])
+@pytest.mark.parametrize("trailing", [True, False])
+@pytest.mark.parametrize("block_size", [16, 1024 * 1024])
+def test_rows_match_dict_reader(tmpdir, monkeypatch, newline, trailing, block_size):
+    monkeypatch.setattr(mapped_reader, "BLOCK_SIZE", block_size)
+    text = newline.join(LINES) + (newline if trailing else "")
+    path = _write(tmpdir, text.encode(mapped_reader.ENCODING))
+
+    expected = list(csv.DictReader(io.StringIO(text, newline=""), restkey="surplus"))
+    with map_log(path) as mapped:
+        reader = MappedDictReader(mapped, restkey="surplus")
+        assert reader.fieldnames == LINES[0].split(",")
+        assert list(reader) == expected
+
+
+def test_rows_the_prefilter_rejects_keep_their_row_numbers(tmpdir):
+    path = _write(tmpdir, "\n".join(LINES).encode(mapped_reader.ENCODING))
+    with map_log(path) as mapped:
+        reader = MappedDictReader(mapped)
+        reader.prefilter = lambda line: b"SensorData" in line
+        rows = list(reader)
+    assert [row is not None for row in rows] == [True, False, True, True]
+
+
+@pytest.mark.parametrize("data", [b"", b'a,"quoted, field"\n', b"a,b\rc,d\r"])
+def test_files_only_the_csv_module_reads_are_not_mapped(tmpdir, data):
+    with map_log(_write(tmpdir, data)) as mapped:
+        assert mapped is None
+
+
+def test_plain_int():
+    assert [plain_int(field) for field in [b"0", b"17", b"007", b"-1", b"1.0", b""]] == [0, 17, None, None, None,
+                                                                                       None]
+
+
+@pytest.mark.parametrize("parser_type, version", [(V2Parser, 2), (V3Parser, 3)])
+def test_mapped_files_are_parsed_like_text_files(tmpdir, parser_type, version):
+    path = tmpdir.mkdir("350000000000000")
+    directory = Directory(path.basename, str(path))
+    rows = list(generate_log(version, 500, imei="350000000000000", message_density=0.1))
+    # a quoted field makes the parser fall back to the text file
+    for name, quote in [("plain.csv.log", csv.QUOTE_MINIMAL), ("quoted.csv.log", csv.QUOTE_NONNUMERIC)]:
+        with open(os.path.join(directory.abs_path, name), "w", newline="") as log_file:
+            csv.writer(log_file, quoting=quote).writerows(rows)
+        expected = list(parser_type().read_chunks(directory, name, 20))
+        assert expected
+        assert list(parser_type(mmap_size=1).read_chunks(directory, name, 20)) == expected
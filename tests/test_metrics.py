@@ -0,0 +1,67 @@
+import os
+import threading
+
+from iss4e.webike.db.metrics import Metrics, profiled
+
+
+def test_counters_and_timers_add_up_across_threads():
+    metrics = Metrics()
+
+    def work():
+        for _ in range(1000):
+            metrics.count("rows.read")
+            metrics.add_time("parse", 0.001)
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    with metrics.timer("upload"):
+        pass
+
+    collected = metrics.as_dict()
+    assert collected["counters"] == {"rows.read": 4000}
+    assert abs(collected["timers"]["parse"] - 4.0) < 1e-6
+    assert collected["timers"]["upload"] >= 0
+
+
+def test_taken_metrics_are_merged_once():
+    worker = Metrics()
+    worker.count("rows.read", 10)
+    worker.add_time("parse", 2.0)
+    taken = worker.take()
+    assert worker.as_dict()["counters"] == {} and worker.as_dict()["timers"] == {}
+
+    main = Metrics()
+    main.count("rows.read", 5)
+    main.merge(taken)
+    assert main.as_dict()["counters"] == {"rows.read": 15}
+    assert main.as_dict()["timers"] == {"parse": 2.0}
+
+
+def test_throughput_is_reported_once_per_interval():
+    metrics = Metrics()
+    metrics.count("rows.read", 100)
+    assert metrics.throughput(3600) is None
+    assert "rows/s read" in metrics.throughput(0)
+
+
+def test_summary_lists_stages_by_time_and_counters():
+    metrics = Metrics()
+    metrics.add_time("parse", 1.0)
+    metrics.add_time("upload", 3.0)
+    metrics.count("points.written", 42)
+    lines = metrics.summary().splitlines()
+    assert lines[1].split() == ["upload", "3.000", "75.0%"]
+    assert lines[2].split() == ["parse", "1.000", "25.0%"]
+    assert ["points.written", "42"] in [line.split() for line in lines]
+
+
+def test_profiles_are_written_per_role(tmpdir):
+    with profiled(str(tmpdir), "parse"):
+        sum(range(1000))
+    with profiled(None, "upload"):
+        pass
+    assert os.listdir(str(tmpdir)) == ["parse-{pid}-{thread}.prof".format(pid=os.getpid(),
+                                                                          thread=threading.get_ident())]
@@ -0,0 +1,80 @@
+import math
+from datetime import datetime, timezone
+
+import pytest
+
+from iss4e.webike.db.point_batch import PointBatch
+
+FIELDS = ["latitude", "longitude", "discharge_current", "code_version", "message"]
+# values of every type that literal parsing returns, in columns of another type as well
+UNUSUAL_VALUES = [None, True, 0, -1, 2 ** 70, 1.5, -0.0, math.inf, "text", b"\x00\xff", 1 + 2j, (1, "a"), [1, [2]],
+                  {"a": (1, 2), 3: None}, {1, 2}, frozenset({"x"}), Ellipsis]
+
+
+def _same(value, expected) -> bool:
+    return type(value) is type(expected) and (value == expected or value != value and expected != expected)
+
+
+def test_encode_round_trip():
+    batch = PointBatch("sensor_data", "350000000000000", FIELDS)
+    for row, value in enumerate(UNUSUAL_VALUES + [math.nan]):
+        batch.append(1457000000000000000 + row * 10 ** 9 - (row % 3) * 7,
+                     dict((field, value) for field in FIELDS[row % 2:]))
+    batch.append(1457000000000000000, {"latitude": 43.47, "code_version": 23, "new_field": "value"})
+
+    decoded = PointBatch.decode("sensor_data", "350000000000000", batch.encode())
+    assert decoded.fieldnames == batch.fieldnames
+    assert list(decoded.timestamps) == list(batch.timestamps)
+    for (_, _, fields), (_, _, expected) in zip(decoded.points(), batch.points()):
+        assert fields.keys() == expected.keys()
+        assert all(_same(fields[field], expected[field]) for field in fields)
+
+
+def test_encode_rejects_unknown_types():
+    batch = PointBatch("sensor_data", "350000000000000", ["message"])
+    batch.append(0, {"message": object()})
+    with pytest.raises(ValueError):
+        batch.encode()
+
+
+def test_points_come_back_as_appended():
+    points = [(1457000000000000000, {"latitude": 43.5, "step_count": 10, "significant_motion": True}),
+              (1457000001000000000, {"latitude": 7, "phone_ip": "10.0.0.1", "significant_motion": "maybe"}),
+              (1457000002000000000, {}),
+              (1457000003000000000, {"step_count": 2 ** 64, "phone_battery_state": "charging", "extra": (1, 2)}),
+              (1457000004000000000, {"phone_battery_state": "charging", "significant_motion": False})]
+    batch = PointBatch("sensor_data", "350000000000000", ["latitude", "step_count", "significant_motion"])
+    for nanoseconds, fields in points:
+        batch.append(nanoseconds, fields)
+
+    assert len(batch) == len(points)
+    assert batch.fieldnames == ["latitude", "step_count", "significant_motion", "phone_ip", "phone_battery_state",
+                                "extra"]
+    for (imei, nanoseconds, fields), (expected_nanoseconds, expected) in zip(batch.points(), points):
+        assert imei == "350000000000000" and nanoseconds == expected_nanoseconds
+        assert fields == expected
+        assert all(type(fields[field]) is type(expected[field]) for field in fields)
+    assert batch.column("step_count") == [10, None, None, 2 ** 64, None]
+
+
+def test_iteration_yields_influxdb_client_points():
+    batch = PointBatch("sensor_data", "350000000000000", ["latitude"])
+    batch.append(1457000000123456789, {"latitude": 43.5})
+    assert list(batch) == [{"measurement": "sensor_data", "tags": {"imei": "350000000000000"},
+                            "time": datetime(2016, 3, 3, 10, 13, 20, 123456, tzinfo=timezone.utc),
+                            "fields": {"latitude": 43.5}}]
+
+
+def test_value_ranges_skip_other_types_and_infinite_values():
+    batch = PointBatch("sensor_data", "350000000000000", ["latitude", "step_count", "phone_ip"])
+    for fields in [{"latitude": 2.5, "step_count": 3}, {"latitude": math.inf, "step_count": "many"},
+                   {"latitude": -1.5, "phone_ip": "10.0.0.1"}, {"latitude": 100}]:
+        batch.append(0, fields)
+    assert batch.value_ranges() == {"latitude": (-1.5, 2.5), "step_count": (3, 3)}
+
+
+def test_batches_are_smaller_than_dict_points():
+    batch = PointBatch("sensor_data", "350000000000000", FIELDS)
+    for row in range(1000):
+        batch.append(row, {"latitude": row / 7, "longitude": -row / 3, "discharge_current": row, "code_version": 23})
+    assert batch.nbytes < 100 * len(batch)
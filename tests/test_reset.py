@@ -0,0 +1,94 @@
+import os
+
+import pytest
+
+from iss4e.webike.db import reset_log_files
+from iss4e.webike.db.classes import Directory, Move
+from iss4e.webike.db.manifest import ImportManifest
+from iss4e.webike.db.reset_engine import ResetJournal, moved_files_by_folder, roll_back_moves
+
+MANIFEST = ".import_manifest.sqlite"
+
+
+def _moves(folder: str, subfolder: str, names) -> list:
+    return [Move(os.path.join(folder, subfolder, name), os.path.join(folder, name)) for name in names]
+
+
+def test_moved_files_by_folder():
+    moves = _moves("/logs/1", "archive", ["a"]) + _moves("/logs/1", "problem", ["b"]) + \
+            _moves("/logs/2", "archive", ["c"])
+    assert moved_files_by_folder(moves) == {"/logs/1": ["a", "b"], "/logs/2": ["c"]}
+    assert moved_files_by_folder(moves, "archive") == {"/logs/1": ["a"], "/logs/2": ["c"]}
+
+
+def test_roll_back_includes_unjournaled_moves(tmpdir):
+    folder = tmpdir.mkdir("350000000000000")
+    folder.mkdir("archive")
+    moves = _moves(str(folder), "archive", ["a.csv.log", "b.csv.log", "c.csv.log"])
+    journal = ResetJournal(str(tmpdir.join("journal")))
+    journal.start(moves)
+    # a is journaled, b was renamed but its entry is missing and c was not moved yet
+    folder.join("a.csv.log").write("a")
+    folder.join("b.csv.log").write("b")
+    folder.join("archive", "c.csv.log").write("c")
+    journal.record(0)
+    journal.close()
+
+    planned, done = journal.load()
+    assert done == {0}
+    roll_back_moves(planned, 2)
+    assert sorted(os.listdir(str(folder.join("archive")))) == ["a.csv.log", "b.csv.log", "c.csv.log"]
+    assert os.listdir(str(folder)) == ["archive"]
+
+
+def test_problem_files_keep_their_row_offset(tmpdir, monkeypatch):
+    folder = tmpdir.mkdir("350000000000000")
+    folder.mkdir("archive")
+    folder.mkdir("problem")
+    directory = Directory(folder.basename, str(folder))
+    for subfolder, name in [("archive", "archived.csv.log"), ("problem", "problem.csv.log")]:
+        folder.join(subfolder, name).write("rows\n")
+    # the manifest state of the files from before they were moved into their subfolders
+    manifest = ImportManifest(directory, MANIFEST)
+    for name in ["archived.csv.log", "problem.csv.log"]:
+        folder.join(name).write("rows\n")
+        manifest.commit(name, 40)
+        os.remove(str(folder.join(name)))
+    manifest.complete("archived.csv.log")
+    manifest.close()
+
+    monkeypatch.setattr(reset_log_files, "config", {"webike.manifest": MANIFEST, "webike.archive": "archive"})
+    moves = _moves(str(folder), "archive", ["archived.csv.log"]) + _moves(str(folder), "problem", ["problem.csv.log"])
+    journal = ResetJournal(str(tmpdir.join("journal")))
+    journal.start(moves)
+    reset_log_files._execute(journal, moves, set(), 2)
+
+    assert not os.listdir(str(folder.join("archive"))) and not os.listdir(str(folder.join("problem")))
+    manifest = ImportManifest(directory, MANIFEST)
+    assert manifest.get("archived.csv.log") == 0 and not manifest.is_imported("archived.csv.log")
+    assert manifest.get("problem.csv.log") == 40
+    manifest.close()
+
+
+def test_restore_logs_replaces_archives(tmpdir, monkeypatch):
+    pytest.importorskip("numpy")
+    from iss4e.webike.db.archive import is_archive
+    from iss4e.webike.db.classes import WorkItem
+    from iss4e.webike.db.csv_parser import V1Parser
+    from iss4e.webike.db.scheduler import convert_log
+
+    folder = tmpdir.mkdir("350000000000000")
+    archive = folder.mkdir("archive")
+    rows = "2016-03-13 01:00:00.000,SensorData,1,1.5\n"
+    archive.join("data.csv.log").write(rows)
+    convert_log(V1Parser(), WorkItem(Directory(archive.basename, str(archive)), "data.csv.log", 0),
+                str(archive.join("data.csv.log")))
+    assert is_archive(str(archive.join("data.csv.log")))
+
+    monkeypatch.setattr(reset_log_files, "config", {"webike.manifest": MANIFEST, "webike.archive": "archive"})
+    moves = _moves(str(folder), "archive", ["data.csv.log"])
+    journal = ResetJournal(str(tmpdir.join("journal")))
+    journal.start(moves)
+    reset_log_files._execute(journal, moves, set(), 2, restore_logs=True)
+
+    assert folder.join("data.csv.log").read() == rows
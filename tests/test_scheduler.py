@@ -0,0 +1,68 @@
+import csv
+import os
+import threading
+import time
+
+import pytest
+
+from iss4e.webike.db.benchmark.synthetic import generate_log
+from iss4e.webike.db.classes import Directory, WorkItem
+from iss4e.webike.db.csv_parser import V2Parser
+from iss4e.webike.db.scheduler import ImportScheduler, ParsedLog, parse_log
+
+
+@pytest.fixture
+def directory(tmpdir) -> Directory:
+    path = tmpdir.mkdir("350000000000000")
+    return Directory(path.basename, str(path))
+
+
+def _write_log(directory: Directory, name: str, rows: int, seed: int = 0) -> WorkItem:
+    path = os.path.join(directory.abs_path, name)
+    with open(path, "w", newline="") as log_file:
+        csv.writer(log_file).writerows(generate_log(2, rows, directory.name, seed=seed))
+    return WorkItem(directory, name, os.path.getsize(path))
+
+
+def test_parts_join_to_the_whole_file(directory):
+    item = _write_log(directory, "data.csv.log", 1000)
+    csv_parser = V2Parser(chunk_points=100)
+    whole = parse_log(csv_parser, item, 0, archive=True)
+    assert whole.resume is None and whole.archive is not None
+
+    parts = [parse_log(csv_parser, item, 0, archive=True, part_points=250)]
+    while parts[-1].resume is not None:
+        parts.append(parse_log(csv_parser, item, parts[-1].resume, part_points=250, span=parts[-1].span))
+    assert len(parts) >= 4
+    # a part ends after the chunk that reaches its points
+    assert all(250 <= sum(data.count(b"\n") for _, data in part.chunks) < 250 + 100 for part in parts[:-1])
+    assert [chunk for part in parts for chunk in part.chunks] == whole.chunks
+    assert (parts[-1].span.first, parts[-1].span.last) == (whole.span.first, whole.span.last)
+    # the archive of a file that is split is built when it is archived
+    assert all(part.archive is None for part in parts)
+
+
+def test_parsing_runs_ahead_of_the_uploads_up_to_the_limit(directory):
+    work = [_write_log(directory, "data{index:02d}.csv.log".format(index=index), 300, index) for index in range(12)]
+    submitted = []
+    uploaded = {}
+    lock = threading.Lock()
+
+    def upload(item: WorkItem, parsed: ParsedLog):
+        chunks = [chunk for part in parsed.parts() for chunk in part.chunks]
+        # slow uploads let the parsing workers run ahead
+        time.sleep(0.05)
+        with lock:
+            uploaded[item.file] = chunks
+
+    scheduler = ImportScheduler(V2Parser(chunk_points=50), lambda item: submitted.append(item) or 0, upload,
+                                parse_workers=1, upload_workers=1, part_points=100)
+    finished = 0
+    for _ in scheduler.run(work):
+        finished += 1
+        assert len(submitted) - finished <= 2 * 1 + 1
+    assert finished == len(work)
+
+    for item in work:
+        expected = parse_log(V2Parser(chunk_points=50), item, 0).chunks
+        assert uploaded[item.file] == expected
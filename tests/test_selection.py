@@ -0,0 +1,101 @@
+import csv
+import os
+
+import pytest
+
+from iss4e.webike.db.benchmark.synthetic import generate_log
+from iss4e.webike.db.classes import Directory, WorkItem
+from iss4e.webike.db.csv_parser import V2Parser, V3Parser
+from iss4e.webike.db.selection import ImportSelection, TimeSpan
+
+MODES = [{}, {"mmap_size": 1}, {"columnar": True}]
+# the synthetic rows start at 2016-03-13 01:00 and go just past the start of daylight saving time at 02:00
+ROWS = 7000
+
+
+def test_start_is_inclusive_and_end_exclusive():
+    selection = ImportSelection(start="2016-03-13 01:30", end="2016-03-13 02:00:00")
+    assert selection.start == "2016-03-13 01:30:00" and selection.end == "2016-03-13 02:00:00"
+    assert not selection.contains_timestamp("2016-03-13 01:29:59.999")
+    assert selection.contains_timestamp("2016-03-13 01:30:00.000")
+    assert selection.contains_timestamp("2016-03-13 01:59:59.999")
+    assert not selection.contains_timestamp("2016-03-13 02:00:00.000")
+
+
+def test_days_select_from_midnight():
+    selection = ImportSelection(start="2016-03-13", end="2016-03-14")
+    assert selection.contains_timestamp("2016-03-13 00:00:00.000")
+    assert selection.contains_timestamp("2016-03-13 23:59:59.999")
+    assert not selection.contains_timestamp("2016-03-14 00:00:00.000")
+
+
+@pytest.mark.parametrize("time", ["13.03.2016", "2016-03-13T01:30:00", "2016-03-13 01:30:00.500", "2016-02-30"])
+def test_other_time_formats_are_refused(time):
+    with pytest.raises(ValueError):
+        ImportSelection(start=time)
+
+
+def test_selections_without_times_are_not_partial():
+    selection = ImportSelection(imeis=["350000000000000"])
+    assert not selection.is_partial
+    assert selection.contains_imei("350000000000000") and not selection.contains_imei("350000000000001")
+    assert ImportSelection(imeis=[]).contains_imei("350000000000001")
+    assert ImportSelection(end="2016-03-14").is_partial
+
+
+@pytest.mark.parametrize("first, last, overlaps", [
+    (None, None, False),
+    ("2016-03-13 00:00:00.000", "2016-03-13 00:59:59.999", False),
+    ("2016-03-13 00:00:00.000", "2016-03-13 01:00:00.000", True),
+    ("2016-03-13 01:10:00.000", "2016-03-13 01:20:00.000", True),
+    ("2016-03-13 01:59:59.999", "2016-03-13 03:00:00.000", True),
+    ("2016-03-13 02:00:00.000", "2016-03-13 03:00:00.000", False)])
+def test_overlaps(first, last, overlaps):
+    selection = ImportSelection(start="2016-03-13 01:00", end="2016-03-13 02:00")
+    assert selection.overlaps(TimeSpan(first, last)) == overlaps
+
+
+@pytest.fixture
+def directory(tmpdir) -> Directory:
+    path = tmpdir.mkdir("350000000000000")
+    return Directory(path.basename, str(path))
+
+
+def _points(parser, directory: Directory, name: str) -> list:
+    return b"".join(data for _, data in parser.read_chunks(directory, name)).splitlines()
+
+
+def _write_log(directory: Directory, name: str, rows):
+    with open(os.path.join(directory.abs_path, name), "w", newline="") as log_file:
+        csv.writer(log_file).writerows(rows)
+
+
+@pytest.mark.parametrize("parser_type, version", [(V2Parser, 2), (V3Parser, 3)])
+@pytest.mark.parametrize("options", MODES)
+def test_parsers_read_the_selected_rows_only(directory, parser_type, version, options):
+    rows = list(generate_log(version, ROWS, imei="350000000000000", message_density=0.1))
+    selection = ImportSelection(start="2016-03-13 01:20", end="2016-03-13 01:40")
+    header = rows[:version == 3]
+    selected = [row for row in rows[len(header):] if selection.contains_timestamp(row[0])]
+    assert 0 < len(selected) < len(rows) - len(header)
+    _write_log(directory, "data.csv.log", rows)
+    _write_log(directory, "selected.csv.log", header + selected)
+
+    expected = _points(parser_type(**options), directory, "selected.csv.log")
+    assert _points(parser_type(selection=selection, **options), directory, "data.csv.log") == expected
+
+
+# windows that do not end within the hour after the nonexistent local hour at the start of daylight saving time.
+# The synthetic rows have times in it, which convert into the following hour, unlike any a device clock writes
+@pytest.mark.parametrize("start, end", [("2016-03-13 01:40", "2016-03-13 02:00"), ("2016-03-13 01:40", None),
+                                        (None, "2016-03-13 01:30"), ("2016-03-13 01:20", "2016-03-13 01:30")])
+def test_archives_select_the_rows_of_their_log(directory, start, end):
+    pytest.importorskip("numpy")
+    from iss4e.webike.db.scheduler import convert_log
+
+    _write_log(directory, "data.csv.log", generate_log(3, ROWS, imei="350000000000000"))
+    selection = ImportSelection(start=start, end=end)
+    expected = _points(V3Parser(selection=selection), directory, "data.csv.log")
+    assert expected
+    convert_log(V3Parser(), WorkItem(directory, "data.csv.log", 0), os.path.join(directory.abs_path, "data.csv.log"))
+    assert _points(V3Parser(selection=selection), directory, "data.csv.log") == expected
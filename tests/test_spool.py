@@ -0,0 +1,89 @@
+import os
+import time
+
+import pytest
+
+from iss4e.webike.db.spool import PermanentWriteError, Spool, drain, is_permanent
+
+
+@pytest.fixture
+def spool(tmpdir):
+    spool = Spool(str(tmpdir.join("spool")), segment_size=1)
+    yield spool
+    spool.close()
+
+
+def _line(index: int) -> bytes:
+    return "sensor_data,imei=350000000000000 voltage={index}i {index}\n".format(index=index).encode()
+
+
+@pytest.mark.parametrize("status, permanent", [(400, True), (404, True), (413, True), (408, False), (429, False),
+                                               (500, False), (503, False)])
+def test_is_permanent(status, permanent):
+    assert is_permanent(status) == permanent
+
+
+def test_transient_errors_are_retried(spool):
+    for index in range(3):
+        spool.append(_line(index))
+    failures = [ConnectionError("refused"), ConnectionError("refused")]
+    written = []
+
+    def write(data: bytes):
+        if failures:
+            raise failures.pop()
+        written.append(data)
+
+    assert drain(spool, write, backoff=0.001) == 3
+    assert written == [_line(index) for index in range(3)]
+    assert not spool.pending() and not spool.dead_letters()
+
+
+def test_refused_records_become_dead_letters(spool):
+    for index in range(3):
+        spool.append(_line(index))
+    written = []
+
+    def write(data: bytes):
+        if data == _line(1):
+            raise PermanentWriteError("400: field type conflict")
+        written.append(data)
+
+    assert drain(spool, write, backoff=0.001) == 2
+    assert written == [_line(0), _line(2)]
+    assert not spool.pending()
+    assert spool.dead_letters() == [(2, 1, "400: field type conflict")]
+    # the dead letter keeps its line protocol after the segments of the acknowledged records are removed
+    assert spool.requeue_dead_letters() == 1
+    assert not spool.dead_letters()
+    assert drain(spool, written.append) == 1
+    assert written[-1] == _line(1)
+
+
+def test_corrupt_records_become_dead_letters(spool):
+    spool.append(_line(0))
+    spool.append(_line(1))
+    segment = sorted(name for name in os.listdir(spool._directory) if name.endswith(".spool"))[0]
+    with open(os.path.join(spool._directory, segment), "r+b") as segment_file:
+        segment_file.seek(-1, os.SEEK_END)
+        segment_file.write(b"\0")
+    written = []
+
+    assert drain(spool, written.append) == 1
+    assert written == [_line(1)]
+    record_id, points, error = spool.dead_letters()[0]
+    assert (record_id, points) == (1, 1) and "corrupt" in error
+    assert spool.requeue_dead_letters() == 0
+
+
+def test_retries_end_when_the_drain_should_stop(spool):
+    spool.append(_line(0))
+    stop_at = time.monotonic() + 0.3
+
+    def write(data: bytes):
+        raise ConnectionError("refused")
+
+    started = time.monotonic()
+    assert drain(spool, write, backoff=60, should_stop=lambda: time.monotonic() > stop_at) == 0
+    assert time.monotonic() - started < 5
+    assert spool.pending() == [(1, 1)]
@@ -0,0 +1,50 @@
+import csv
+import os
+import re
+
+from iss4e.webike.db.benchmark.synthetic import FIELDNAMES_BY_VERSION, generate_log, write_logs
+from iss4e.webike.db.classes import Directory
+from iss4e.webike.db.csv_parser import AutoParser, sniff_versions
+
+# the patterns of webike.imei_regex and webike.logfile_regex in iss4e.conf
+IMEI_PATTERN = re.compile("^[0-9]{15}$")
+LOG_PATTERN = re.compile("^data.*?[.].+?[.]log$")
+
+
+def test_logs_are_reproducible():
+    assert list(generate_log(2, 100, seed=3)) == list(generate_log(2, 100, seed=3))
+    assert list(generate_log(2, 100, seed=3)) != list(generate_log(2, 100, seed=4))
+
+
+def test_rows_have_the_columns_of_their_format():
+    for version, fieldnames in FIELDNAMES_BY_VERSION.items():
+        rows = list(generate_log(version, 200, imei="350000000000000", message_density=0.2))
+        if version == 3:
+            assert rows.pop(0) == fieldnames
+            assert all(row[1] == "350000000000000" for row in rows)
+        assert len(rows) == 200
+        assert all(len(row) == len(fieldnames) for row in rows)
+        timestamps = [row[0] for row in rows]
+        assert timestamps == sorted(timestamps)
+
+
+def test_null_density():
+    rows = list(generate_log(2, 500, null_density=0.2, seed=1))
+    values = [value for row in rows for value in row[3:]]
+    nulls = sum(1 for value in values if value in ("", "null", "NaN"))
+    assert 0.15 < nulls / len(values) < 0.25
+
+
+def test_written_trees_are_imported(tmpdir):
+    logs = write_logs(str(tmpdir), imeis=2, files_per_imei=3, rows=100, versions=[1, 2, 3],
+                      null_density=0.0)
+    assert [version for _, version in logs] == [1, 2, 3, 1, 2, 3]
+    for path, version in logs:
+        folder = os.path.dirname(path)
+        assert IMEI_PATTERN.fullmatch(os.path.basename(folder)) and LOG_PATTERN.fullmatch(os.path.basename(path))
+        assert sniff_versions(path) == {version}
+        data = b"".join(chunk for _, chunk in AutoParser().read_chunks(Directory(os.path.basename(folder), folder),
+                                                                       os.path.basename(path)))
+        assert data.count(b"\n") == 100
+        with open(path, newline="") as log_file:
+            assert sum(1 for _ in csv.reader(log_file)) == 100 + (version == 3)
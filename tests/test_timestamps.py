@@ -0,0 +1,74 @@
+from datetime import datetime, timedelta
+from typing import Iterator
+
+import pytest
+import pytz
+
+from iss4e.webike.db.date_time import DateTime
+from iss4e.webike.db.timestamp import TimestampConverter
+
+TIME_ZONE = "Canada/Eastern"
+
+# spring forward creates a nonexistent hour, fall back an ambiguous one
+DST_TRANSITIONS = [datetime(2015, 3, 8), datetime(2015, 11, 1), datetime(2016, 3, 13), datetime(2016, 11, 6)]
+
+
+def dst_edge_cases() -> Iterator[str]:
+    """
+    :returns timestamps every 7.5 minutes around each transition, including the first and last microsecond of hours
+    """
+    for day in DST_TRANSITIONS:
+        for step in range(6 * 8):
+            time = day + timedelta(minutes=7.5 * step)
+            yield time.strftime('%Y-%m-%d %H:%M:%S.%f')
+        for hour in range(6):
+            yield (day + timedelta(hours=hour)).strftime('%Y-%m-%d %H:%M:%S.%f')
+            yield (day + timedelta(hours=hour + 1, microseconds=-1)).strftime('%Y-%m-%d %H:%M:%S.%f')
+        yield day.strftime('%Y-%m-%d 02:30:00.5')
+
+
+def _utc(*args) -> int:
+    return DateTime(pytz.utc.localize(datetime(*args))).epoch_nanoseconds
+
+
+# DateTime.from_string localizes with is_dst=False: ambiguous hours resolve to standard time and nonexistent hours
+# keep the standard time offset as well
+@pytest.mark.parametrize("local, expected", [
+    # spring forward, 02:00 to 02:59 do not exist
+    ("2015-03-08 01:59:59.999999", _utc(2015, 3, 8, 6, 59, 59, 999999)),
+    ("2015-03-08 02:00:00.000000", _utc(2015, 3, 8, 7)),
+    ("2015-03-08 02:30:00.5", _utc(2015, 3, 8, 7, 30, 0, 500000)),
+    ("2015-03-08 02:59:59.999999", _utc(2015, 3, 8, 7, 59, 59, 999999)),
+    ("2015-03-08 03:00:00.000000", _utc(2015, 3, 8, 7)),
+    ("2016-03-13 02:15:00.000000", _utc(2016, 3, 13, 7, 15)),
+    # fall back, 01:00 to 01:59 happen twice
+    ("2015-11-01 00:59:59.999999", _utc(2015, 11, 1, 4, 59, 59, 999999)),
+    ("2015-11-01 01:00:00.000000", _utc(2015, 11, 1, 6)),
+    ("2015-11-01 01:30:00.000000", _utc(2015, 11, 1, 6, 30)),
+    ("2015-11-01 01:59:59.999999", _utc(2015, 11, 1, 6, 59, 59, 999999)),
+    ("2015-11-01 02:00:00.000000", _utc(2015, 11, 1, 7)),
+    ("2016-11-06 01:45:00.000000", _utc(2016, 11, 6, 6, 45)),
+])
+def test_ambiguous_and_nonexistent_hours(local, expected):
+    assert DateTime.from_string(local, TIME_ZONE).epoch_nanoseconds == expected
+    assert TimestampConverter(TIME_ZONE).to_nanoseconds(local) == expected
+
+
+def test_cached_conversion_matches_from_string_around_transitions():
+    edge_cases = list(dst_edge_cases())
+    expected = [DateTime.from_string(timestamp, TIME_ZONE).epoch_nanoseconds for timestamp in edge_cases]
+    assert list(TimestampConverter(TIME_ZONE).column_to_nanoseconds(edge_cases)) == expected
+
+
+def test_edge_cases_cover_every_transition_hour():
+    hours = {timestamp[:13] for timestamp in dst_edge_cases()}
+    for day in DST_TRANSITIONS:
+        assert {(day + timedelta(hours=hour)).strftime("%Y-%m-%d %H") for hour in range(6)} <= hours
+
+
+def test_utc_offset():
+    converter = TimestampConverter(TIME_ZONE)
+    hour = 3600 * 10 ** 9
+    assert converter.utc_offset(datetime(2015, 11, 1, 0)) == -4 * hour
+    assert converter.utc_offset(datetime(2015, 11, 1, 1)) == -5 * hour
+    assert converter.utc_offset(datetime(2015, 3, 8, 3)) == -4 * hour
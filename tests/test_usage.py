@@ -0,0 +1,35 @@
+import ast
+import os
+
+import pytest
+from docopt import docopt
+
+import iss4e.webike.db
+
+PACKAGE = os.path.dirname(iss4e.webike.db.__file__)
+# a command line of each script that its usage has to accept
+ARGUMENTS = [
+    ("import_data.py", ["--archive", "--workers=2", "--imei=350000000000000", "--start=2016-03-01", "--spool"]),
+    ("import_data.py", ["data.csv.log", "--version=2", "--strict", "--no-dedup"]),
+    ("reset_log_files.py", ["--dry-run", "--archive", "--imei=350000000000000", "--from=2016-03-01"]),
+    ("reset_log_files.py", ["--problem", "--restore-logs", "--workers=4"]),
+    ("reset_log_files.py", ["--rollback"]),
+    ("drain_spool.py", ["--follow", "--rate=1000", "--debug"]),
+    ("drain_spool.py", ["--requeue"]),
+] + [(os.path.join("benchmark", name), []) for name in sorted(os.listdir(os.path.join(PACKAGE, "benchmark")))
+     if name.endswith(".py") and name != "__init__.py" and name != "synthetic.py"]
+
+
+def _usage(script: str) -> str:
+    # the docstring is read from the source, so that the dependencies of the script need not be installed
+    with open(os.path.join(PACKAGE, script)) as source:
+        return ast.get_docstring(ast.parse(source.read()), clean=False)
+
+
+@pytest.mark.parametrize("script, argv", ARGUMENTS)
+def test_usage_parses(script, argv):
+    options = docopt(_usage(script), argv=argv)
+    for argument in argv:
+        name = argument.split("=")[0]
+        if name.startswith("--"):
+            assert options[name]
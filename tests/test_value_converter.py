@@ -0,0 +1,51 @@
+import ast
+import math
+
+import pytest
+
+from iss4e.webike.db.value_converter import COLUMN_TYPES, compile_converters, get_converter, literal_value
+
+# values in the lexical forms of each type, in forms that only literal parsing accepts and in none at all
+VALUES = ["0", "1", "-1", "+5", "007", "00", "-00", "123456789012345678901234567890", "1.5", "-0.0", "1.", ".5",
+          "1e5", "1E-5", "-2.5e+3", "1e999", "nan", "NaN", "inf", "-inf", "0x1F", "1_000", "1j", "true", "True",
+          "TRUE", "false", "False", "none", "None", "null", "abc", "ABC", "a_b1", "1abc", "192.168.0.1", "'quoted'",
+          "(1, 2)", "[1]", "{1: 2}", "", " ", " 1", "1 ", "-", "µ", "charging", "Charging"]
+
+
+def _literal_eval(key: str, value: str):
+    """
+    the conversion of the values before the column typed converters
+    """
+    try:
+        parsed_value = ast.literal_eval(value.title())
+        if key == "code_version":
+            parsed_value = int(parsed_value)
+        return parsed_value
+    except (ValueError, SyntaxError):
+        return value
+
+
+def _outcome(convert, *arguments):
+    try:
+        return convert(*arguments)
+    except Exception as e:
+        return type(e)
+
+
+def _same(value, expected) -> bool:
+    if isinstance(value, float) and isinstance(expected, float) and math.isnan(value):
+        return math.isnan(expected)
+    return type(value) is type(expected) and value == expected
+
+
+@pytest.mark.parametrize("key", sorted(COLUMN_TYPES) + ["unknown_column"])
+def test_converters_match_literal_eval(key):
+    converter = get_converter(key)
+    for value in VALUES:
+        assert _same(_outcome(converter, value), _outcome(_literal_eval, key, value)), value
+
+
+def test_unknown_columns_use_literal_parsing():
+    assert get_converter("unknown_column") is literal_value
+    assert compile_converters(("latitude", "unknown_column")) == {"latitude": COLUMN_TYPES["latitude"],
+                                                                   "unknown_column": literal_value}